@@ -0,0 +1,282 @@
+"""
+analytics.py
+
+Ad-hoc analytics over the songs: totals grouped by artist, a histogram of
+durations, how peak rank and weeks on the charts are correlated, and top-N
+lists. The songs table is read once into a SongColumns, one typed array per
+column, with the songs of each credit (row of the artists table) stored
+together, and the totals of every individual artist are worked out as the
+columns are loaded.
+
+NumPy is not a dependency of this project, so the columns are the standard
+library's array.array, and every aggregation hands a whole column or slice to
+built-ins that loop over it in C: min and math.fsum, itertools.accumulate for
+running totals, itertools.compress to leave out NULLs, map over slices for the
+totals of every group at once, collections.Counter and heapq. No Python code runs
+once per song.
+
+A SongColumns is kept by each DBConnection and dropped with its other cached
+results whenever the database changes, so it always matches the database.
+"""
+
+import array
+import collections
+import heapq
+import itertools
+import math
+import operator
+
+# Width in milliseconds of each band of the duration histogram
+HISTOGRAM_BUCKET_MS = 30000
+
+# Rows read from SQLite at a time when loading the columns
+LOAD_CHUNK_SIZE = 4096
+
+SONG_COLUMNS_QUERY = 'SELECT artist_id, track_name, peak_rank, weeks_on_chart, duration_ms FROM songs ' \
+                     'ORDER BY artist_id, rowid;'
+CREDITS_QUERY = 'SELECT performers.performer_id, performers.performer_name, artist_credits.artist_id FROM performers ' \
+                'JOIN artist_credits ON artist_credits.performer_id = performers.performer_id ' \
+                'ORDER BY performers.performer_id;'
+
+# The number columns of a song, in the order they are read
+NUMBER_COLUMNS = ("peak_rank", "weeks_on_chart", "duration_ms")
+
+# The value stored in place of NULL in each number column, one that leaves its
+# totals alone: nothing added to a sum, and never the smallest peak rank. Which
+# values were NULL is kept in a mask beside each column.
+NULL_VALUES = {
+    "peak_rank": math.inf,
+    "weeks_on_chart": 0,
+    "duration_ms": 0
+}
+
+# The orders of the TOP n SONGS BY and TOP n ARTISTS BY commands: the column
+# compared and whether the largest value comes first
+SONG_ORDERS = {
+    "WEEKS": ("weeks_on_chart", True),
+    "RANK": ("peak_rank", False),
+    "DURATION": ("duration_ms", True)
+}
+ARTIST_ORDERS = {
+    "SONGS": ("songs", True),
+    "WEEKS": ("total_weeks", True),
+    "RANK": ("best_rank", False),
+    "DURATION": ("avg_duration", True)
+}
+
+
+def ranks(values):
+    """
+    Ranks values from 1 up, giving tied values the mean of their ranks.
+    :param values: list, the values to rank
+    :return: list, the rank of each value, in the same order
+    """
+    counts = collections.Counter(values)
+    distinct = sorted(counts)
+    # Each value's ties take the positions from the end of the smaller values' up to
+    # its own end, so their mean rank, counting from 1, is half of start + end + 1
+    bounds = list(itertools.accumulate(map(counts.__getitem__, distinct), initial=0))
+    doubled = map(operator.add, map(operator.add, bounds[:-1], bounds[1:]), itertools.repeat(1))
+    mean_ranks = dict(zip(distinct, map(operator.truediv, doubled, itertools.repeat(2))))
+    return list(map(mean_ranks.__getitem__, values))
+
+
+def correlation(x, y):
+    """
+    Works out Pearson's correlation of two columns the way statistics.correlation
+    does, with each sum taken over a map of the whole columns.
+    :param x: list, the first column
+    :param y: list, the second column, as long as the first
+    :return: float, the correlation, or None if either column has the same value throughout
+    """
+    x_deviations = list(map(operator.sub, x, itertools.repeat(math.fsum(x) / len(x))))
+    y_deviations = list(map(operator.sub, y, itertools.repeat(math.fsum(y) / len(y))))
+    spread = math.fsum(map(operator.mul, x_deviations, x_deviations)) * \
+        math.fsum(map(operator.mul, y_deviations, y_deviations))
+    if spread == 0:
+        return None
+    return math.fsum(map(operator.mul, x_deviations, y_deviations)) / math.sqrt(spread)
+
+
+def run_bounds(keys):
+    """
+    Finds the runs of equal keys in a list where equal keys are next to each other.
+    :param keys: list, the keys
+    :return: tuple, a list of the distinct keys, a list of where each run starts
+             and a list of where it ends
+    """
+    lengths = map(len, map(list, map(operator.itemgetter(1), itertools.groupby(keys))))
+    bounds = list(itertools.accumulate(lengths, initial=0))
+    return list(dict.fromkeys(keys)), bounds[:-1], bounds[1:]
+
+
+def slice_totals(values, starts, ends):
+    """
+    Totals many slices of a column at once, as differences of its running total.
+    :param values: an array or other iterable of numbers
+    :param starts: list, where each slice starts
+    :param ends: list, where each slice ends
+    :return: list, the total of each slice
+    """
+    running = list(itertools.accumulate(values, initial=0))
+    return list(map(operator.sub, map(running.__getitem__, ends), map(running.__getitem__, starts)))
+
+
+def slice_minimums(values, starts, ends):
+    """
+    Finds the smallest value of many slices of a column at once.
+    :param values: an array or list of numbers
+    :param starts: list, where each slice starts
+    :param ends: list, where each slice ends, after its start
+    :return: list, the smallest value of each slice
+    """
+    return list(map(min, map(values.__getitem__, map(slice, starts, ends))))
+
+
+class SongColumns:
+    """
+    A class holding the songs table in columns, grouped by credit, and the totals
+    of each individual artist.
+    Attributes:
+        - track_names, a list of the song names
+        - peak_rank, weeks_on_chart, duration_ms, arrays of doubles, one value per
+                     song, with infinity in place of a NULL peak_rank and 0 in place
+                     of the other NULLs
+        - present, a dictionary of column/bytearray of 1 for each value that is not NULL
+        - artist_names, a list of the individual artists with songs
+        - artist_columns, a dictionary of the columns of ARTIST_ORDERS/array of each
+                          artist's total, with infinity in place of a missing best_rank
+                          and minus infinity in place of a missing avg_duration, so
+                          that they sort last
+    Methods:
+        - artist, the totals of one individual artist
+        - top_artists, the n artists with the largest or smallest of a total
+        - top_songs, the n songs with the largest or smallest value of a column
+        - song, the columns of one song
+        - duration_histogram, counts the songs in each band of durations
+        - rank_weeks_correlation, correlates peak rank with weeks on the charts
+    """
+    def __init__(self, cur):
+        self.track_names = []
+        self.peak_rank = array.array("d")
+        self.weeks_on_chart = array.array("d")
+        self.duration_ms = array.array("d")
+        self.present = {column: bytearray() for column in NUMBER_COLUMNS}
+        artist_ids = []
+        retrieved = cur.execute(SONG_COLUMNS_QUERY)
+        rows = retrieved.fetchmany(LOAD_CHUNK_SIZE)
+        while rows:
+            # Each chunk of rows is turned into columns, so the arrays are extended a column at a time
+            columns = list(zip(*rows))
+            artist_ids.extend(columns[0])
+            self.track_names.extend(columns[1])
+            for column, values in zip(NUMBER_COLUMNS, columns[2:]):
+                # get(value, value) gives the stand-in for None and leaves any other value as it is
+                getattr(self, column).extend(map({None: NULL_VALUES[column]}.get, values, values))
+                self.present[column].extend(map(operator.is_not, values, itertools.repeat(None)))
+            rows = retrieved.fetchmany(LOAD_CHUNK_SIZE)
+        # The songs come sorted by artist_id, so each credit's songs are one slice
+        credit_ids, starts, ends = run_bounds(artist_ids)
+        credit_totals = {
+            "songs": list(map(operator.sub, ends, starts)),
+            "total_weeks": slice_totals(self.weeks_on_chart, starts, ends),
+            "duration": slice_totals(self.duration_ms, starts, ends),
+            "timed": slice_totals(self.present["duration_ms"], starts, ends)
+        }
+        best_ranks = slice_minimums(self.peak_rank, starts, ends)
+        # Each individual artist's credits, leaving out the credits without songs, are
+        # listed together, so each artist's totals are slices of the credits' totals
+        credit_rows = dict(zip(credit_ids, itertools.count()))
+        credits = cur.execute(CREDITS_QUERY).fetchall()
+        with_songs = map(credit_rows.__contains__, map(operator.itemgetter(2), credits))
+        credits = list(itertools.compress(credits, with_songs))
+        rows = list(map(credit_rows.__getitem__, map(operator.itemgetter(2), credits)))
+        _, starts, ends = run_bounds(list(map(operator.itemgetter(0), credits)))
+        self.artist_names = list(map(operator.itemgetter(1), map(credits.__getitem__, starts)))
+        totals = {column: slice_totals(map(credit_totals[column].__getitem__, rows), starts, ends)
+                  for column in credit_totals}
+        self.artist_columns = {
+            "songs": array.array("d", totals["songs"]),
+            "total_weeks": array.array("d", totals["total_weeks"]),
+            "best_rank": array.array("d", slice_minimums(list(map(best_ranks.__getitem__, rows)), starts, ends)),
+            # Rounded once per artist, as the averages are compared as they are displayed
+            "avg_duration": array.array("d", [round(duration / timed) if timed else -math.inf
+                                              for duration, timed in zip(totals["duration"], totals["timed"])])
+        }
+
+    def artist(self, artist):
+        """
+        Gathers the totals of one individual artist, over every credit they appear on.
+        :param artist: int, the position of the artist in artist_names
+        :return: dict, the artist's songs, total_weeks, best_rank and avg_duration,
+                 with None for a missing best_rank or avg_duration
+        """
+        values = {column: self.artist_columns[column][artist] for column in self.artist_columns}
+        return {column: int(values[column]) if math.isfinite(values[column]) else None for column in values}
+
+    def top_artists(self, limit, order):
+        """
+        Finds the individual artists with the most songs, weeks or longest songs, or the best peak rank.
+        :param limit: int, the number of artists
+        :param order: str, a key of ARTIST_ORDERS
+        :return: dict, the top artists' totals from artist, in order
+        """
+        column, largest = ARTIST_ORDERS[order]
+        values = self.artist_columns[column]
+        pick = heapq.nlargest if largest else heapq.nsmallest
+        artists = pick(limit, range(len(values)), key=values.__getitem__)
+        # The artists without the total sort last, so they are only picked when there are too few others
+        return {self.artist_names[artist]: self.artist(artist) for artist in artists if math.isfinite(values[artist])}
+
+    def top_songs(self, limit, order):
+        """
+        Finds the songs with the most weeks, the best peak rank or the longest duration.
+        :param limit: int, the number of songs
+        :param order: str, a key of SONG_ORDERS
+        :return: dict, a dictionary of song name/dictionary of its columns, in order
+        """
+        column, largest = SONG_ORDERS[order]
+        values = getattr(self, column)
+        pick = heapq.nlargest if largest else heapq.nsmallest
+        songs = pick(limit, itertools.compress(range(len(values)), self.present[column]), key=values.__getitem__)
+        return {self.track_names[song]: self.song(song) for song in songs}
+
+    def song(self, song):
+        """
+        Gathers the columns of one song.
+        :param song: int, the position of the song in the columns
+        :return: dict, the song's peak_rank, weeks_on_chart and duration_ms that are not missing
+        """
+        return {column: int(getattr(self, column)[song]) for column in NUMBER_COLUMNS if self.present[column][song]}
+
+    def duration_histogram(self, bucket_ms=HISTOGRAM_BUCKET_MS):
+        """
+        Counts the songs in each band of durations.
+        :param bucket_ms: int, the width of each band of durations
+        :return: dict, a dictionary of (band start, band end) in milliseconds/number of
+                 songs, for every band from the shortest song to the longest
+        """
+        durations = itertools.compress(self.duration_ms, self.present["duration_ms"])
+        counts = collections.Counter(map(operator.floordiv, durations, itertools.repeat(bucket_ms)))
+        if not counts:
+            return {}
+        return {(band * bucket_ms, (band + 1) * bucket_ms): counts[band]
+                for band in range(int(min(counts)), int(max(counts)) + 1)}
+
+    def rank_weeks_correlation(self):
+        """
+        Measures how a song's peak rank and its weeks on the charts go together.
+        :return: dict, the number of "songs" with both values, and the Pearson and
+                 Spearman (rank) correlations of their peak rank and weeks on the charts,
+                 or None where there are too few songs
+        """
+        both = bytes(map(operator.and_, self.present["peak_rank"], self.present["weeks_on_chart"]))
+        peak_rank = list(itertools.compress(self.peak_rank, both))
+        weeks = list(itertools.compress(self.weeks_on_chart, both))
+        result = {"songs": len(peak_rank), "pearson": None, "spearman": None}
+        if len(peak_rank) < 2:
+            return result
+        # Either is None when one of the columns has the same value for every song
+        result["pearson"] = correlation(peak_rank, weeks)
+        result["spearman"] = correlation(ranks(peak_rank), ranks(weeks))
+        return result
@@ -0,0 +1,98 @@
+"""
+batch.py
+
+Runs a file of commands without the interactive prompt. Every command goes
+through parse_input, sharing one database connection and read transaction,
+and the output is buffered and written once at the end. Large command files
+can be run by a pool of worker processes at once (workers.py), each with its
+own read-only connection. Commands can also be run against a snapshot
+(snapshot.py) instead of the database.
+"""
+
+import io
+
+from db_handler import DBConnection, DATABASE_NAME
+from parse import parse_input, loads_data, toggles_profiling
+from profiler import CommandProfiler
+
+
+def read_commands(command_file):
+    """
+        Reads the commands from a command file, one per line, stopping at EXIT.
+        Blank lines and lines starting with # are skipped.
+        :param command_file: an open text file of commands
+        :return: list, the commands in order
+    """
+    commands = []
+    for line in command_file:
+        command = line.strip()
+        if command == "" or command.startswith("#"):
+            continue
+        if command.upper() == "EXIT":
+            break
+        commands.append(command)
+    return commands
+
+
+def run_commands(commands, database_name=DATABASE_NAME, read_only=False, profile=False, snapshot=False):
+    """
+        Runs the commands in order on one connection, inside one read transaction
+        so the database is only locked once. LOAD DATA and LOAD WEEK commit the
+        transaction before they run, since they have to write to the database.
+        :param commands: list, the commands to run
+        :param database_name: str, the path of the database
+        :param read_only: bool, whether to open the connection read-only
+        :param profile: bool, whether to profile the commands from the start
+        :param snapshot: bool, whether database_name is a snapshot to answer the commands from
+        :return: str, everything the commands printed
+    """
+    if snapshot:
+        # Imported here, as only snapshot batches need it
+        from snapshot import SnapshotConnection
+        conx = SnapshotConnection(database_name)
+    else:
+        conx = DBConnection(database_name, read_only)
+    if profile:
+        conx.set_profiler(CommandProfiler())
+    out = io.StringIO()
+    for command in commands:
+        # A snapshot has no transactions to manage
+        if conx.open and not snapshot:
+            if loads_data(command):
+                if conx.con.in_transaction:
+                    conx.con.commit()
+            elif not conx.con.in_transaction:
+                conx.con.execute("BEGIN;")
+        parse_input(conx, command, out)
+    if conx.open:
+        if not snapshot:
+            conx.con.commit()
+        conx.close_connection()
+    return out.getvalue()
+
+
+def run_batch(commands, database_name=DATABASE_NAME, jobs=1, profile=False, snapshot=False):
+    """
+        Runs a list of commands and returns their output. With more than one job,
+        the commands are handed out to that many worker processes as they become
+        free, and their outputs are joined back in order. Commands that load data
+        are never handed out, since the workers only read the database, and neither
+        are commands that start or stop profiling, which would only reach one worker.
+        :param commands: list, the commands to run
+        :param database_name: str, the path of the database
+        :param jobs: int, the number of processes to run the commands with
+        :param profile: bool, whether to profile the commands from the start; each
+                        process keeps its own profile, shown by STATS on that process
+        :param snapshot: bool, whether database_name is a snapshot to answer the commands from
+        :return: str, everything the commands printed
+    """
+    jobs = min(jobs, len(commands))
+    if jobs <= 1 or any(loads_data(command) or toggles_profiling(command) for command in commands):
+        return run_commands(commands, database_name, profile=profile, snapshot=snapshot)
+    # Imported here, as only batches with more than one job need the workers
+    from workers import WorkerPool
+    workers = WorkerPool(database_name, jobs, profile, snapshot)
+    try:
+        return "".join(workers.run_all(commands))
+    finally:
+        workers.close()
@@ -0,0 +1,383 @@
+"""
+benchmark.py
+
+Measures how load_data and each kind of command perform as the data grows.
+A generator writes synthetic artists.csv and songs.csv files of the requested
+size, shaped like the real charts: comma-joined featured artist credits,
+consistent hit and week totals, and skewed song counts per artist. Each size
+is loaded into a fresh database, then every command type is timed through
+parse_input on distinct names, with the result cache turned off so the
+database is queried each time.
+
+Each command type is timed in several rounds, and the median of the rounds
+is reported, so one slow round does not decide the result. The load runs in a
+process of its own, so its peak memory is that of the load alone.
+
+Results can be saved as a baseline and later runs compared against it:
+    python benchmark.py --rows 10000 100000 --save-baseline baseline.json
+    python benchmark.py --rows 10000 100000 --compare baseline.json
+"""
+
+import argparse
+import csv
+import io
+import json
+import multiprocessing
+import os
+import random
+import resource
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from array import array
+
+from db_handler import DBConnection, load_data
+from parse import parse_input
+from result_cache import ResultCache
+
+FIRST_NAMES = ["Ava", "Bad", "Cole", "Dua", "Ed", "Finn", "Gia", "Harry", "Iris", "Jax", "Kali", "Lil",
+               "Mae", "Nico", "Olly", "Post", "Quin", "Rosa", "Sia", "Tate", "Uma", "Vic", "Wiz", "Yung"]
+LAST_NAMES = ["Adams", "Bunny", "Cruz", "Diaz", "Eilish", "Flores", "Grande", "Harlow", "Ivey", "Jones",
+              "Khalid", "Lipa", "Malone", "Nash", "Ocean", "Perry", "Quest", "Rae", "Styles", "Swift",
+              "Tainy", "Uzi", "Vega", "Weeknd"]
+TITLE_WORDS = ["Easy", "On", "Me", "Blinding", "Lights", "Heat", "Waves", "Stay", "As", "It", "Was",
+               "Bad", "Habits", "Shivers", "Butter", "Golden", "Hour", "Midnight", "Rain", "Summer",
+               "Love", "Dancing", "Night", "Fire", "Ghost", "Moon", "River", "Sugar", "Dreams", "Home"]
+
+# Share of artist rows that are collaborations, and the most credits a collaboration has
+COLLABORATION_SHARE = 0.3
+MAX_CREDITS = 4
+
+DEFAULT_ROWS = [10000, 100000]
+DEFAULT_SAMPLES = 200
+DEFAULT_ROUNDS = 3
+
+# How much slower than the baseline a p95 latency may get before it is reported as a regression,
+# both as a ratio and in milliseconds, since a sub-millisecond latency varies by more than the ratio
+# from one run to the next. The milliseconds are raised to the spread between rounds when that is wider.
+REGRESSION_THRESHOLD = 1.2
+REGRESSION_FLOOR_MS = 0.05
+
+# Each command type, with the template its commands are made from
+COMMAND_TYPES = {
+    "ARTIST SONGLIST": '"{artist}" ARTIST SONGLIST',
+    "ARTIST HITS": '"{artist}" ARTIST HITS',
+    "ARTIST WEEKS": '"{artist}" ARTIST WEEKS',
+    "ARTIST INFO": '"{artist}" ARTIST INFO',
+    "ARTIST SEARCH": '"{artist_prefix}" ARTIST SEARCH',
+    "ARTIST SEARCH (SQL)": '"{artist_prefix}%" ARTIST SEARCH',
+    "ARTIST CONTAINS": '"{artist_prefix}" ARTIST CONTAINS',
+    "SONG AUTHOR": '"{song}" SONG AUTHOR',
+    "SONG DURATION": '"{song}" SONG DURATION',
+    "SONG RANK": '"{song}" SONG RANK',
+    "SONG WEEK": '"{song}" SONG WEEK',
+    "SONG INFO": '"{song}" SONG INFO',
+    "SONG SEARCH": '"{song_prefix}" SONG SEARCH',
+    "TOTAL ARTISTS": 'TOTAL ARTISTS',
+    "TOTAL SONGS": 'TOTAL SONGS',
+    "AVG DURATION": 'AVG DURATION',
+    "MEDIAN DURATION": 'MEDIAN DURATION',
+    "TOP 10 ARTISTS": 'TOP 10 ARTISTS'
+}
+
+
+def numbered_name(words, number, count):
+    """
+    Makes a distinct name for every number by combining count words from the
+    list, adding the round number once every combination has been used.
+    :param words: list, the words names are made from
+    :param number: int, the number of the name
+    :param count: int, the number of words in each name
+    :return: str, the name
+    """
+    parts = []
+    remaining = number
+    for _ in range(count):
+        parts.append(words[remaining % len(words)])
+        remaining //= len(words)
+    if remaining > 0:
+        parts.append(str(remaining + 1))
+    return " ".join(parts)
+
+
+def solo_artist_name(number):
+    return f"{FIRST_NAMES[number % len(FIRST_NAMES)]} " \
+           f"{numbered_name(LAST_NAMES, number // len(FIRST_NAMES), 1)}"
+
+
+def song_name(number):
+    return numbered_name(TITLE_WORDS, number, 3)
+
+
+def generate_dataset(directory, songs, seed=0):
+    """
+    Writes synthetic artists.csv and songs.csv files. The songs are written
+    first, while totalling each artist's hits and weeks, so only those totals
+    are held in memory.
+    :param directory: str, the directory to write the files to
+    :param songs: int, the number of songs to generate
+    :param seed: int, the seed for the random generator
+    :return: dict, a dictionary of table name/csv file path, as taken by load_data
+    """
+    rng = random.Random(seed)
+    artists = max(1, songs // 2)
+    solo_artists = max(1, int(artists * (1 - COLLABORATION_SHARE)))
+    hits = array("q", bytes(8 * artists))
+    weeks = array("q", bytes(8 * artists))
+    csv_files = {"artists": os.path.join(directory, "artists.csv"),
+                 "songs": os.path.join(directory, "songs.csv")}
+    with open(csv_files["songs"], "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["artist_id", "track_name", "duration_ms", "peak_rank", "weeks_on_chart"])
+        for number in range(songs):
+            # Every artist has a song, and the rest go mostly to the first few artists, as on the real charts
+            artist = number if number < artists else min(int(artists * rng.random() ** 3), artists - 1)
+            song_weeks = max(1, int(rng.expovariate(1 / 20)))
+            hits[artist] += 1
+            weeks[artist] += song_weeks
+            writer.writerow([artist + 1, song_name(number), int(rng.gauss(210000, 40000)),
+                             rng.randint(1, 200), song_weeks])
+    with open(csv_files["artists"], "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["artist_names", "num_hit_songs", "total_weeks"])
+        for number in range(artists):
+            if number < solo_artists:
+                name = solo_artist_name(number)
+            else:
+                # A collaboration credits distinct solo artists, after a lead that keeps the name unique
+                credits = [solo_artist_name(number)]
+                for _ in range(rng.randint(1, MAX_CREDITS - 1)):
+                    credits.append(solo_artist_name(rng.randrange(solo_artists)))
+                name = ", ".join(dict.fromkeys(credits))
+            writer.writerow([name, hits[number], weeks[number]])
+    return csv_files
+
+
+def sample_names(csv_file, column, samples, seed):
+    """
+    Picks random distinct values from one column of a csv file.
+    :param csv_file: str, the csv file to read
+    :param column: str, the column to pick from
+    :param samples: int, the number of values to pick
+    :param seed: int, the seed for the random generator
+    :return: list, the picked values
+    """
+    rng = random.Random(seed)
+    picked = []
+    seen = 0
+    with open(csv_file, newline="", encoding="utf-8") as f:
+        # Reservoir sampling, so the file is read once without holding it in memory
+        for row in csv.DictReader(f):
+            seen += 1
+            if len(picked) < samples:
+                picked.append(row[column])
+            elif rng.randrange(seen) < samples:
+                picked[rng.randrange(samples)] = row[column]
+    return picked
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def summarize(latencies):
+    """
+    Summarizes the latencies of one command type.
+    :param latencies: list, the latency of each command, in seconds
+    :return: dict, the p50, p95 and p99 latencies in milliseconds and the commands per second
+    """
+    ordered = sorted(latencies)
+    return {
+        "p50_ms": percentile(ordered, 0.50) * 1000,
+        "p95_ms": percentile(ordered, 0.95) * 1000,
+        "p99_ms": percentile(ordered, 0.99) * 1000,
+        "per_second": len(ordered) / max(sum(ordered), 1e-9)
+    }
+
+
+def median_summary(summaries):
+    """
+    Combines the summaries of several rounds of one command type.
+    :param summaries: list, the summary of each round, as summarize returns
+    :return: dict, the median of each figure over the rounds, and how far apart
+             the rounds' p95 latencies were, as a measure of their noise
+    """
+    combined = {figure: statistics.median(summary[figure] for summary in summaries) for figure in summaries[0]}
+    p95s = [summary["p95_ms"] for summary in summaries]
+    combined["p95_spread_ms"] = max(p95s) - min(p95s)
+    return combined
+
+
+def peak_rss_mb():
+    """
+    Returns the peak RSS of this process. On Linux it is read from VmHWM, which
+    starts afresh in a new program, whereas ru_maxrss carries over the peak of the
+    process that started it.
+    :return: float, the peak RSS in megabytes
+    """
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 2 ** 10
+    except OSError:
+        pass
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak_rss / (2 ** 20 if sys.platform == "darwin" else 2 ** 10)
+
+
+def load_in_process(database_name, csv_files):
+    """
+    Runs load_data in a new process, so the process's peak memory is the load's alone.
+    :param database_name: str, the path of the database to create
+    :param csv_files: dict, a dictionary of table name/csv file to load it from
+    :return: tuple, load_data's results and the process's peak RSS in megabytes
+    """
+    loaded = load_data(database_name, csv_files)
+    return loaded, peak_rss_mb()
+
+
+def benchmark_size(rows, samples, seed=0, rounds=DEFAULT_ROUNDS):
+    """
+    Generates a dataset of the given size, loads it, and times every command type.
+    :param rows: int, the number of songs to generate
+    :param samples: int, the number of commands to time for each command type in each round
+    :param seed: int, the seed for the random generator
+    :param rounds: int, the number of rounds of every command type
+    :return: dict, the load results and a summary of each command type
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        csv_files = generate_dataset(directory, rows, seed)
+        database_name = os.path.join(directory, "music.db")
+        # A spawned process starts from a fresh interpreter, not a copy of this one
+        with multiprocessing.get_context("spawn").Pool(1) as pool:
+            loaded, load_peak_mb = pool.apply(load_in_process, (database_name, csv_files))
+        results = {"load": {"rows": loaded["rows"], "seconds": loaded["seconds"],
+                            "per_second": loaded["rows"] / max(loaded["seconds"], 1e-9),
+                            "peak_mb": load_peak_mb},
+                   "commands": {}}
+        artists = sample_names(csv_files["artists"], "artist_names", samples, seed)
+        songs = sample_names(csv_files["songs"], "track_name", samples, seed)
+        conx = DBConnection(database_name)
+        # Every command should reach the database, so nothing is kept in the cache
+        conx.cache = ResultCache(size=0)
+        out = io.StringIO()
+        for command_type in COMMAND_TYPES:
+            # Run once untimed, so the connection and name indexes are ready
+            parse_input(conx, COMMAND_TYPES[command_type].format(artist=artists[0], artist_prefix=artists[0][:3],
+                                                                 song=songs[0], song_prefix=songs[0][:3]), out)
+        # The rounds go through every command type in turn, so a slow spell of the
+        # machine lands in one round of several types rather than every round of one
+        summaries = {command_type: [] for command_type in COMMAND_TYPES}
+        for _ in range(rounds):
+            for command_type in COMMAND_TYPES:
+                template = COMMAND_TYPES[command_type]
+                latencies = []
+                for number in range(samples):
+                    artist = artists[number % len(artists)]
+                    song = songs[number % len(songs)]
+                    command = template.format(artist=artist, artist_prefix=artist[:3], song=song,
+                                              song_prefix=song[:3])
+                    out.seek(0)
+                    out.truncate()
+                    start = time.perf_counter()
+                    parse_input(conx, command, out)
+                    latencies.append(time.perf_counter() - start)
+                summaries[command_type].append(summarize(latencies))
+        for command_type in COMMAND_TYPES:
+            results["commands"][command_type] = median_summary(summaries[command_type])
+        # Memory is traced in a separate pass, since tracing slows down every allocation
+        tracemalloc.start()
+        for command_type in COMMAND_TYPES:
+            parse_input(conx, COMMAND_TYPES[command_type].format(artist=artists[-1], artist_prefix=artists[-1][:3],
+                                                                 song=songs[-1], song_prefix=songs[-1][:3]), out)
+        results["query_peak_mb"] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        tracemalloc.stop()
+        conx.close_connection()
+    return results
+
+
+def compare(results, baseline, threshold=REGRESSION_THRESHOLD, floor_ms=REGRESSION_FLOOR_MS):
+    """
+    Compares benchmark results against a saved baseline.
+    :param results: dict, a dictionary of row count/results from this run
+    :param baseline: dict, a dictionary of row count/results from the baseline run
+    :param threshold: float, how many times slower a p95 latency may get
+    :param floor_ms: float, how many milliseconds slower a p95 latency may get, whatever the ratio;
+                     more if the rounds of either run were further apart than that
+    :return: list, a description of each regression found
+    """
+    regressions = []
+    for rows in results:
+        if rows not in baseline:
+            continue
+        for command_type in results[rows]["commands"]:
+            old = baseline[rows]["commands"].get(command_type)
+            new = results[rows]["commands"][command_type]
+            if old is None:
+                continue
+            noise = max(floor_ms, old.get("p95_spread_ms", 0), new["p95_spread_ms"])
+            if new["p95_ms"] > old["p95_ms"] * threshold and new["p95_ms"] - old["p95_ms"] > noise:
+                regressions.append(f"{command_type} at {rows} rows: p95 {old['p95_ms']:.3f}ms -> "
+                                   f"{new['p95_ms']:.3f}ms")
+        old_rate = baseline[rows]["load"]["per_second"]
+        new_rate = results[rows]["load"]["per_second"]
+        if new_rate * threshold < old_rate:
+            regressions.append(f"LOAD DATA at {rows} rows: {old_rate:.0f} -> {new_rate:.0f} rows/s")
+    return regressions
+
+
+def format_results(results):
+    """
+    Formats benchmark results as a table for printing.
+    :param results: dict, a dictionary of row count/results
+    :return: str, the formatted results
+    """
+    format_string = ""
+    for rows in results:
+        result = results[rows]
+        format_string += f"--- {rows} rows: loaded in {result['load']['seconds']:.2f}s " \
+                         f"({result['load']['per_second']:.0f} rows/s), load peak RSS {result['load']['peak_mb']:.1f}MB, " \
+                         f"query peak {result['query_peak_mb']:.1f}MB\n"
+        format_string += f"{'command':<22}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'per s':>12}\n"
+        for command_type in result["commands"]:
+            summary = result["commands"][command_type]
+            format_string += f"{command_type:<22}{summary['p50_ms']:>10.3f}{summary['p95_ms']:>10.3f}" \
+                             f"{summary['p99_ms']:>10.3f}{summary['per_second']:>12.0f}\n"
+    return format_string
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark load_data and the query commands.")
+    parser.add_argument("--rows", type=int, nargs="+", default=DEFAULT_ROWS,
+                        help="numbers of songs to generate, one benchmark each")
+    parser.add_argument("--samples", type=int, default=DEFAULT_SAMPLES,
+                        help="number of commands timed for each command type")
+    parser.add_argument("--rounds", type=int, default=DEFAULT_ROUNDS,
+                        help="number of rounds of every command type, of which the median is reported")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the generated data")
+    parser.add_argument("--save-baseline", metavar="FILE", help="save the results to FILE as a baseline")
+    parser.add_argument("--compare", metavar="FILE", help="compare the results against the baseline in FILE")
+    args = parser.parse_args()
+
+    results = {}
+    for rows in args.rows:
+        results[str(rows)] = benchmark_size(rows, args.samples, args.seed, args.rounds)
+    print(format_results(results), end="")
+    if args.save_baseline is not None:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if args.compare is not None:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f))
+        for regression in regressions:
+            print("REGRESSION: " + regression)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+client.py
+
+A thin client for the query daemon, for answering one-off commands without
+starting Python's database modules each time. It only imports what it needs
+to talk to the daemon's Unix socket; the daemon holds the warm connections,
+result caches and name indexes.
+
+    python client.py '"Adele" ARTIST INFO' 'TOTAL SONGS'
+
+Commands are taken from the arguments, or from standard input, one per line,
+if there are none. If the daemon is not running it is started in the
+background (python main.py --daemon), and keeps running for the next client.
+"""
+
+import os
+import socket
+import sys
+
+DAEMON_SOCKET = "music.sock"
+
+# Seconds to wait for a daemon started by the client to begin listening
+DAEMON_START_TIMEOUT = 10.0
+
+
+def connect(socket_path=DAEMON_SOCKET):
+    """
+        Connects to the daemon, starting it first if it is not running.
+        :param socket_path: str, the path of the daemon's Unix socket
+        :return: socket, connected to the daemon
+    """
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(socket_path)
+        return client
+    except (FileNotFoundError, ConnectionRefusedError):
+        pass
+    # Only needed the first time, so not imported up front
+    import subprocess
+    import time
+    main = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+    subprocess.Popen([sys.executable, main, "--daemon"], stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                     stderr=subprocess.DEVNULL, start_new_session=True)
+    deadline = time.monotonic() + DAEMON_START_TIMEOUT
+    while True:
+        try:
+            client.connect(socket_path)
+            return client
+        except (FileNotFoundError, ConnectionRefusedError):
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.02)
+
+
+def run_commands(commands, socket_path=DAEMON_SOCKET):
+    """
+        Sends commands to the daemon all at once and reads back their output.
+        :param commands: list, the commands to run
+        :param socket_path: str, the path of the daemon's Unix socket
+        :return: str, everything the commands printed, in order
+    """
+    client = connect(socket_path)
+    with client:
+        client.sendall(("\n".join(commands) + "\nEXIT\n").encode())
+        received = []
+        while True:
+            chunk = client.recv(65536)
+            if not chunk:
+                break
+            received.append(chunk)
+    output = []
+    for line in b"".join(received).decode(errors="replace").splitlines(keepends=True):
+        # A line holding a single "." ends each command's output; other lines
+        # starting with "." had another "." added in front of them
+        if line.rstrip("\n") == ".":
+            continue
+        output.append(line[1:] if line.startswith(".") else line)
+    return "".join(output)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        commands = sys.argv[1:]
+    else:
+        commands = [line.strip() for line in sys.stdin if line.strip() != ""]
+    try:
+        sys.stdout.write(run_commands(commands))
+    except OSError as error:
+        sys.exit("Could not reach the query daemon: " + str(error))
@@ -0,0 +1,188 @@
+"""
+commands.py
+
+The grammar of the command language. A command is any number of quoted
+names, separated by commas, followed by its keywords:
+    "Adele" ARTIST INFO
+    TOP 10 ARTISTS
+    "Adele", "Drake" ARTIST INFO
+A command that takes a list of names can instead read them from a file, one
+name per line, with FILE before its keywords:
+    "dashboard.txt" FILE ARTIST INFO
+Inside quotes, a backslash escapes the next character, so \\" is a quote
+that is part of the name. Keywords are not case sensitive, and a number
+among them is an argument of the command, such as the 10 above.
+
+A CommandParser compiles each line into a Command once, using a dispatch
+table from keywords to handler, and remembers the compiled form of recent
+lines so a repeated command is not tokenized again.
+"""
+
+import functools
+import re
+
+# Quoted names (with backslash escapes), commas between names, and bare keywords
+TOKEN_PATTERN = re.compile(r'\s*(?:"((?:[^"\\]|\\.)*)"|(,)|([^\s",]+))')
+ESCAPE_PATTERN = re.compile(r'\\(.)')
+
+# Stands in for a number among the keywords in the dispatch table
+NUMBER = "#"
+
+# A number among the keywords: ASCII digits only, as str.isdigit also takes the
+# likes of "²", which int cannot read
+NUMBER_PATTERN = re.compile(r"[0-9]+")
+
+# The largest number a command takes. Numbers become limits and offsets bound into
+# queries, which SQLite cannot take past 64 bits, after paging multiplies them.
+MAX_NUMBER = 10 ** 9
+
+# The number of names taken by a command that takes one or more
+MANY = -1
+
+# The keyword before a command's keywords that makes its one name a file of names
+FROM_FILE = "FILE"
+
+# Number of compiled commands a CommandParser remembers
+PARSED_CACHE_SIZE = 1024
+
+
+class InvalidInput(Exception):
+    pass
+
+
+class Command:
+    """
+    A class for a compiled command, ready to be run any number of times.
+    Attributes:
+        - text, the command as it was entered
+        - names, a tuple of the quoted names, unescaped
+        - name_file, the path of the file to read the names from, or None
+        - keywords, a tuple of the keywords in upper case, with NUMBER in place of numbers
+        - numbers, a tuple of the numbers among the keywords, as ints
+        - handler, the function that runs the command, taking the connection,
+                   the Command and the stream to print to
+        - needs_database, whether the database has to exist to run the command
+    Methods:
+        - kind, returns the keywords as one string, such as ARTIST INFO
+        - arguments, returns the names, read from name_file if there is one
+    """
+    def __init__(self, text, names, keywords, numbers, handler, needs_database, name_file=None):
+        self.text = text
+        self.names = names
+        self.name_file = name_file
+        self.keywords = keywords
+        self.numbers = numbers
+        self.handler = handler
+        self.needs_database = needs_database
+
+    def kind(self):
+        return " ".join(self.keywords)
+
+    def arguments(self):
+        # The file is read each time the command runs, as it may have changed
+        if self.name_file is None:
+            return self.names
+        return read_names(self.name_file)
+
+
+def read_names(file_name):
+    """
+        Reads a file of names, one per line. Blank lines and lines starting with # are skipped.
+        :param file_name: str, the path of the file
+        :return: tuple, the names in order
+    """
+    try:
+        with open(file_name, encoding="utf-8") as name_file:
+            names = tuple(line.strip() for line in name_file
+                          if line.strip() != "" and not line.startswith("#"))
+    except OSError as error:
+        raise InvalidInput("Could not read " + file_name + ": " + str(error.strerror) + ".")
+    if not names:
+        raise InvalidInput(file_name + " holds no names.")
+    return names
+
+
+def tokenize(text):
+    """
+        Splits a command into its quoted names and its keywords. Names come first,
+        separated by commas, then the keywords.
+        :param text: str, the command as entered
+        :return: tuple, a tuple of the names and a tuple of the upper case keywords
+    """
+    names = []
+    keywords = []
+    comma = False
+    position = 0
+    end = len(text.rstrip())
+    while position < end:
+        token = TOKEN_PATTERN.match(text, position)
+        if token is None:
+            # The only text the pattern cannot match is an unclosed quote
+            raise InvalidInput("Command not recognised.")
+        position = token.end()
+        name, separator, keyword = token.groups()
+        if name is not None:
+            if keywords or (names and not comma):
+                raise InvalidInput("Command not recognised.")
+            names.append(ESCAPE_PATTERN.sub(r"\1", name))
+            comma = False
+        elif separator is not None:
+            if not names or comma or keywords:
+                raise InvalidInput("Command not recognised.")
+            comma = True
+        else:
+            keywords.append(keyword.upper())
+    if comma:
+        raise InvalidInput("Command not recognised.")
+    return tuple(names), tuple(keywords)
+
+
+class CommandParser:
+    """
+    A class for compiling commands against a dispatch table.
+    Attributes:
+        - table, a dictionary of keyword tuple/(handler, number of names, whether
+                 the database has to exist), where NUMBER stands in for a number
+                 and MANY for one or more names
+        - compile, compiles a command, remembering the last PARSED_CACHE_SIZE compiled
+    Methods:
+        - compile_command, tokenizes a command and looks its keywords up in the table
+    """
+    def __init__(self, table, cache_size=PARSED_CACHE_SIZE):
+        self.table = table
+        self.compile = functools.lru_cache(maxsize=cache_size)(self.compile_command)
+
+    def compile_command(self, text):
+        """
+        Compiles a command, raising InvalidInput with the reason it cannot be run.
+        :param text: str, the command as entered
+        :return: Command, the compiled command
+        """
+        names, words = tokenize(text)
+        name_file = None
+        if words[:1] == (FROM_FILE,):
+            if len(names) != 1:
+                raise InvalidInput("FILE takes one file name.")
+            name_file = names[0]
+            words = words[1:]
+        keywords = tuple(NUMBER if NUMBER_PATTERN.fullmatch(word) else word for word in words)
+        numbers = tuple(int(word) for word in words if NUMBER_PATTERN.fullmatch(word))
+        if any(number > MAX_NUMBER for number in numbers):
+            raise InvalidInput(f"Numbers can be at most {MAX_NUMBER}.")
+        if keywords not in self.table:
+            if not names:
+                raise InvalidInput("Command not recognised.")
+            if len(keywords) < 2:
+                raise InvalidInput("Invalid number of commands.")
+            # Report the first keyword that no command starts with
+            for length in range(1, len(keywords) + 1):
+                if not any(key[:length] == keywords[:length] for key in self.table):
+                    raise InvalidInput(words[length - 1])
+            raise InvalidInput("Command not recognised.")
+        handler, name_count, needs_database = self.table[keywords]
+        if name_count == MANY:
+            if len(names) == 0:
+                raise InvalidInput("Command not recognised.")
+        elif len(names) != name_count or name_file is not None:
+            raise InvalidInput("Command not recognised.")
+        return Command(text, names, keywords, numbers, handler, needs_database, name_file)
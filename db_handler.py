@@ -4,8 +4,14 @@ the load data function and all database querying functions.
 Additionally, the database connection class is also held here.
 """
 
+import functools
+import os
 import sqlite3 as sql
-import pandas as pd
+import time
+from full_text import create_search_indexes, find_query
+from name_index import NameIndex
+from profiler import ProfilingCursor, PROGRESS_STEPS
+from result_cache import ResultCache
 
 DB_SCHEMA = {
     "artists": {
@@ -23,78 +29,862 @@ DB_SCHEMA = {
     }
 }
 
+# The column each table is looked up and searched by
+NAME_COLUMNS = {
+    "artists": "artist_names",
+    "songs": "track_name"
+}
+
+# Secondary indexes kept on the database. The NOCASE indexes serve the
+# case-insensitive LIKE "prefix%" searches, the plain ones the equality lookups.
+DB_INDEXES = {
+    "idx_artists_names": ("artists", "artist_names"),
+    "idx_artists_names_nocase": ("artists", "artist_names COLLATE NOCASE"),
+    "idx_songs_track_nocase": ("songs", "track_name COLLATE NOCASE"),
+    "idx_songs_artist_id": ("songs", "artist_id"),
+    "idx_songs_duration": ("songs", "duration_ms")
+}
+
 DATABASE_NAME = "music.db"
 
+# The csv file each table is loaded from
+CSV_FILES = {
+    "artists": "artists.csv",
+    "songs": "songs.csv"
+}
+
+# The column each table's rows are matched on when load_data updates an existing database
+UPSERT_KEYS = {
+    "artists": "artist_id",
+    "songs": "track_name"
+}
+
+# Unique indexes on the keys in UPSERT_KEYS that are not a primary key, which the
+# upserts of load_data need as their conflict target; they also serve the lookups
+KEY_INDEXES = {
+    "idx_songs_track_key": ("songs", "track_name")
+}
+
+# Records the rows an upsert inserted or changed, with their names and artists
+# before and after, through temporary triggers on the table being upserted into
+LOAD_CHANGES_TABLE = 'CREATE TEMP TABLE IF NOT EXISTS load_changes(old_name TEXT, new_name TEXT, ' \
+                     'old_artist INTEGER, new_artist INTEGER);'
+LOAD_CHANGES_TRIGGERS = [
+    'CREATE TEMP TRIGGER "load_{table}_insert" AFTER INSERT ON main."{table}" BEGIN '
+    'INSERT INTO load_changes VALUES (NULL, new.{name_col}, NULL, new.artist_id); END;',
+    'CREATE TEMP TRIGGER "load_{table}_update" AFTER UPDATE ON main."{table}" BEGIN '
+    'INSERT INTO load_changes VALUES (old.{name_col}, new.{name_col}, old.artist_id, new.artist_id); END;'
+]
+
+# Bookkeeping tables recording the fingerprint of each csv file as of the last
+# load: its size and modification time, and a digest of each of its chunks
+LOAD_STATE_TABLES = [
+    'CREATE TABLE IF NOT EXISTS load_files(table_name TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER);',
+    'CREATE TABLE IF NOT EXISTS load_chunks(table_name TEXT, chunk INTEGER, digest TEXT, '
+    'PRIMARY KEY(table_name, chunk));'
+]
+
+# The width of the peak rank bands counted in rank_distribution
+RANK_BUCKET_SIZE = 10
+
+# Materialized statistics kept current by load_data: single values by name,
+# songs per band of peak ranks, and rollups per individual artist, over every
+# credit they appear on. The rollups per credit they replaced are dropped.
+STATISTICS_TABLES = [
+    'CREATE TABLE IF NOT EXISTS statistics(name TEXT PRIMARY KEY, value);',
+    'CREATE TABLE IF NOT EXISTS rank_distribution(bucket_start INTEGER PRIMARY KEY, bucket_end INTEGER, '
+    'songs INTEGER);',
+    'CREATE TABLE IF NOT EXISTS performer_statistics(performer_id INTEGER PRIMARY KEY, songs INTEGER, '
+    'total_weeks INTEGER, best_rank INTEGER, avg_duration REAL);',
+    'CREATE INDEX IF NOT EXISTS idx_performer_statistics_weeks ON performer_statistics(total_weeks);',
+    'DROP TABLE IF EXISTS artist_statistics;'
+]
+
+# The statistics the triggers below keep as running totals, from which the
+# others are derived after each load
+RUNNING_STATISTICS = ("total_artists", "total_songs", "duration_count", "total_duration", "total_song_weeks")
+
+# Adds a song row's values to the running totals and its band of peak ranks ({sign} is +),
+# or takes them away (-). {row} is new or old.
+SONG_STATISTICS_CHANGE = 'UPDATE statistics SET value = value {sign} CASE name WHEN \'total_songs\' THEN 1 ' \
+                         'WHEN \'duration_count\' THEN {row}.duration_ms IS NOT NULL ' \
+                         'WHEN \'total_duration\' THEN COALESCE({row}.duration_ms, 0) ' \
+                         'ELSE COALESCE({row}.weeks_on_chart, 0) END ' \
+                         'WHERE name IN (\'total_songs\', \'duration_count\', \'total_duration\', ' \
+                         '\'total_song_weeks\'); ' \
+                         'INSERT INTO rank_distribution SELECT ({row}.peak_rank - 1) / {size} * {size} + 1, ' \
+                         '({row}.peak_rank - 1) / {size} * {size} + {size}, {sign}1 WHERE {row}.peak_rank >= 1 ' \
+                         'ON CONFLICT(bucket_start) DO UPDATE SET songs = songs {sign} 1; '
+# Drops the bands left without songs, as a full count would not list them
+EMPTY_BANDS_DELETE = 'DELETE FROM rank_distribution WHERE songs = 0; '
+
+# Triggers keeping the running totals and rank distribution current as rows are inserted,
+# updated and deleted, so an incremental load only pays for the rows it changes. They are
+# created once the statistics have been computed in full, after a new database is loaded.
+STATISTICS_TRIGGERS = [
+    'CREATE TRIGGER IF NOT EXISTS artists_statistics_insert AFTER INSERT ON artists BEGIN '
+    'UPDATE statistics SET value = value + 1 WHERE name = \'total_artists\'; END;',
+    'CREATE TRIGGER IF NOT EXISTS artists_statistics_delete AFTER DELETE ON artists BEGIN '
+    'UPDATE statistics SET value = value - 1 WHERE name = \'total_artists\'; END;',
+    'CREATE TRIGGER IF NOT EXISTS songs_statistics_insert AFTER INSERT ON songs BEGIN '
+    + SONG_STATISTICS_CHANGE.format(sign="+", row="new", size=RANK_BUCKET_SIZE) + 'END;',
+    'CREATE TRIGGER IF NOT EXISTS songs_statistics_delete AFTER DELETE ON songs BEGIN '
+    + SONG_STATISTICS_CHANGE.format(sign="-", row="old", size=RANK_BUCKET_SIZE) + EMPTY_BANDS_DELETE + 'END;',
+    'CREATE TRIGGER IF NOT EXISTS songs_statistics_update AFTER UPDATE ON songs BEGIN '
+    + SONG_STATISTICS_CHANGE.format(sign="-", row="old", size=RANK_BUCKET_SIZE)
+    + SONG_STATISTICS_CHANGE.format(sign="+", row="new", size=RANK_BUCKET_SIZE) + EMPTY_BANDS_DELETE + 'END;'
+]
+
+STATISTICS_TRIGGERS_EXIST_QUERY = "SELECT 1 FROM sqlite_master WHERE name = 'songs_statistics_insert';"
+
+# The running totals, counted in full
+RUNNING_STATISTICS_QUERY = 'SELECT (SELECT COUNT(*) FROM artists), COUNT(*), COUNT(duration_ms), ' \
+                           'COALESCE(SUM(duration_ms), 0), COALESCE(SUM(weeks_on_chart), 0) FROM songs;'
+
+# The individual artists credited on each row of the artists table, which holds a
+# whole credit such as "24kGoldn, iann dior". Songs reach their individual artists
+# through their credit's artist_id; both sides of the link are indexed.
+CREDIT_TABLES = [
+    'CREATE TABLE IF NOT EXISTS performers(performer_id INTEGER PRIMARY KEY, performer_name TEXT NOT NULL UNIQUE);',
+    'CREATE TABLE IF NOT EXISTS artist_credits(performer_id INTEGER NOT NULL, artist_id INTEGER NOT NULL, '
+    'PRIMARY KEY(performer_id, artist_id)) WITHOUT ROWID;',
+    'CREATE INDEX IF NOT EXISTS idx_artist_credits_artist ON artist_credits(artist_id, performer_id);',
+    # Serves the case-insensitive LIKE "prefix%" matches of the featured artists in a search
+    'CREATE INDEX IF NOT EXISTS idx_performers_name_nocase ON performers(performer_name COLLATE NOCASE);'
+]
+
+CREDITS_EXIST_QUERY = "SELECT 1 FROM sqlite_master WHERE name = 'performers';"
+
+# The totals of individual artists, over every song they are credited on
+PERFORMER_TOTALS_QUERY = 'SELECT performer_name, COUNT(songs.track_name) AS num_hit_songs, ' \
+                         'COALESCE(SUM(songs.weeks_on_chart), 0) AS total_weeks FROM performers ' \
+                         'JOIN artist_credits ON artist_credits.performer_id = performers.performer_id ' \
+                         'LEFT JOIN songs ON songs.artist_id = artist_credits.artist_id ' \
+                         'WHERE performer_name {match} GROUP BY performers.performer_id;'
+PERFORMER_SONGLIST_QUERY = 'SELECT performer_name, track_name FROM performers ' \
+                           'JOIN artist_credits ON artist_credits.performer_id = performers.performer_id ' \
+                           'LEFT JOIN songs ON songs.artist_id = artist_credits.artist_id ' \
+                           'WHERE performer_name {match} ORDER BY songs.rowid;'
+
+PERFORMER_STATISTICS_QUERY = 'INSERT OR REPLACE INTO performer_statistics SELECT performers.performer_id, ' \
+                             'COUNT(songs.track_name), COALESCE(SUM(weeks_on_chart), 0), MIN(peak_rank), ' \
+                             'AVG(duration_ms) FROM performers ' \
+                             'JOIN artist_credits ON artist_credits.performer_id = performers.performer_id ' \
+                             'LEFT JOIN songs ON songs.artist_id = artist_credits.artist_id ' \
+                             '{where} GROUP BY performers.performer_id;'
+
+MEDIAN_DURATION_QUERY = 'SELECT AVG(duration_ms) FROM (SELECT duration_ms FROM songs ' \
+                        'WHERE duration_ms IS NOT NULL ORDER BY duration_ms ' \
+                        'LIMIT 2 - (SELECT COUNT(duration_ms) FROM songs) % 2 ' \
+                        'OFFSET ((SELECT COUNT(duration_ms) FROM songs) - 1) / 2);'
+
+# The median from the duration index, given the number of durations, which
+# stands at the middle of the index so SQLite steps to it without sorting
+MEDIAN_DURATION_AT_QUERY = 'SELECT AVG(duration_ms) FROM (SELECT duration_ms FROM songs ' \
+                           'WHERE duration_ms IS NOT NULL ORDER BY duration_ms LIMIT ? OFFSET ?);'
+
+STATISTICS_EXIST_QUERY = "SELECT 1 FROM sqlite_master WHERE name = 'statistics';"
+
+STATISTIC_QUERY = 'SELECT value FROM statistics WHERE name = ?;'
+
+# The top rollups are picked in a subquery, so they are read from the end of the weeks index
+# rather than by joining every artist and sorting
+TOP_ARTISTS_QUERY = 'SELECT performer_name, top.total_weeks, songs, best_rank FROM ' \
+                    '(SELECT * FROM performer_statistics ORDER BY total_weeks DESC LIMIT ?) AS top ' \
+                    'INNER JOIN performers ON performers.performer_id = top.performer_id ORDER BY top.total_weeks DESC;'
+
+# The data keywords, each with the statistic it is stored as, the query that computes it,
+# and the format it is displayed in
+DATA_KEYWORDS = {
+    "artists": ("total_artists", 'SELECT COUNT(*) FROM artists;',
+                'The total number of artists stored is: {}'),
+    "songs": ("total_songs", 'SELECT COUNT(*) FROM songs;',
+              'The total number of songs stored is: {}'),
+    "duration": ("avg_duration", 'SELECT AVG(duration_ms) FROM songs;',
+                 'The average duration of songs store in ms is: {}'),
+    "median": ("median_duration", MEDIAN_DURATION_QUERY,
+               'The median duration of songs stored in ms is: {}'),
+    "shortest": ("min_duration", 'SELECT MIN(duration_ms) FROM songs;',
+                 'The shortest duration of songs stored in ms is: {}'),
+    "longest": ("max_duration", 'SELECT MAX(duration_ms) FROM songs;',
+                'The longest duration of songs stored in ms is: {}')
+}
+
+# Number of csv rows read and inserted at a time by load_data
+CSV_CHUNK_SIZE = 10000
+
+# Connection settings used while bulk loading a new database. The database is
+# removed if the load fails, so it does not need a rollback journal or fsyncs.
+BULK_LOAD_PRAGMAS = {
+    "journal_mode": "MEMORY",
+    "synchronous": "OFF",
+    "cache_size": -65536
+}
+
+# Connection settings of read-only connections. Reading the database through a
+# memory map lets the processes reading it share the operating system's page
+# cache, instead of each copying pages into its own.
+READ_ONLY_PRAGMAS = {
+    "mmap_size": 268435456
+}
+
+# Number of prepared statements sqlite3 keeps per connection for reuse
+STATEMENT_CACHE_SIZE = 256
+
+# Rows fetched from SQLite at a time when streaming a query's results
+FETCH_SIZE = 256
+
+# Results on each page of a paged SONGLIST or SEARCH
+PAGE_SIZE = 50
+
+# The joins are outer joins so that a name which exists without a match on the
+# other side still returns a row, letting a single query double as the existence check
+SONGLIST_QUERY = 'SELECT artist_names, track_name FROM artists LEFT JOIN songs ' \
+                 'ON artists.artist_id = songs.artist_id WHERE artist_names = ?;'
+AUTHOR_QUERY = 'SELECT artist_names FROM songs LEFT JOIN artists ' \
+               'ON artists.artist_id = songs.artist_id WHERE track_name = ?;'
+# A page of an artist's songs in one statement, its parts returned in turn: a first row,
+# flagged 0, if the name is an individual artist or a whole credit, then the songs the
+# individual artist is credited on, flagged 1, or else the songs of the credit, flagged 2
+SONGLIST_PAGE_QUERY = 'SELECT 0, NULL WHERE EXISTS (SELECT 1 FROM performers WHERE performer_name = :name) ' \
+                      'OR EXISTS (SELECT 1 FROM artists WHERE artist_names = :name) ' \
+                      'UNION ALL SELECT * FROM (SELECT 1, track_name FROM performers ' \
+                      'JOIN artist_credits ON artist_credits.performer_id = performers.performer_id ' \
+                      'JOIN songs ON songs.artist_id = artist_credits.artist_id WHERE performer_name = :name ' \
+                      'ORDER BY songs.rowid LIMIT :limit OFFSET :offset) ' \
+                      'UNION ALL SELECT * FROM (SELECT 2, track_name FROM artists ' \
+                      'JOIN songs ON artists.artist_id = songs.artist_id WHERE artist_names = :name ' \
+                      'AND NOT EXISTS (SELECT 1 FROM performers WHERE performer_name = :name) ' \
+                      'ORDER BY songs.rowid LIMIT :limit OFFSET :offset);'
+
+# The batch forms of the lookups, for many names at once; {names} is filled in by _batch_names
+SELECT_BATCH_QUERY = 'SELECT {all_cols} FROM {table} WHERE {search_col} IN {names};'
+SONGLIST_BATCH_QUERY = 'SELECT artist_names, track_name FROM artists LEFT JOIN songs ' \
+                       'ON artists.artist_id = songs.artist_id WHERE artist_names IN {names};'
+AUTHOR_BATCH_QUERY = 'SELECT track_name, artist_names FROM songs LEFT JOIN artists ' \
+                     'ON artists.artist_id = songs.artist_id WHERE track_name IN {names};'
+
+# Batches of up to this many names are bound into an IN list; larger batches are
+# written to a temporary table that the lookup joins against
+BATCH_IN_LIMIT = 500
+BATCH_NAMES_TABLE = 'CREATE TEMP TABLE IF NOT EXISTS batch_names (name TEXT PRIMARY KEY);'
+
 
 class DBConnection:
     """
     A class for maintaining a connection to the database
-    given by DATABASE_NAME.
+    given by DATABASE_NAME, or another database file.
     Attributes:
+        - database_name, the path of the database file
+        - read_only, a boolean value indicating if the connection
+                     is opened read-only
         - con, the connection object
         - cur, the cursor object for con
         - open, a boolean value indicating if the database
                 connection is open
+        - name_indexes, a dictionary of table name/NameIndex, built
+                        the first time each table is searched
+        - columns, the analytics.SongColumns of the songs table, loaded
+                   by the first analytics command, or None
+        - cache, a ResultCache of query results
+        - data_version, the database's data version when the cached
+                        results were stored
+        - profiler, the CommandProfiler recording this connection's
+                    commands, or None when profiling is off
     Methods:
         - open_connection, opens the connection to the database and
                            sets the open boolean to true
         - close_connection, closes the connection the database and
                             sets the open boolean to false
+        - name_index, returns the NameIndex for a table, building it if needed
+        - song_columns, returns the SongColumns, loading them if needed
+        - reset_name_indexes, discards the built name indexes after the
+                              data has been rebuilt
+        - update_name_indexes, applies the names added and removed by an
+                               incremental load to the built name indexes
+        - check_data_version, discards the cached results, name indexes and columns
+                              if the database has changed since they were made; it is
+                              run once before each command, not before each lookup
+        - sync_data_version, records the current data version, after the
+                             name indexes have been brought up to date by hand
+        - cached, returns the cached result of a query, running it if needed
+        - set_profiler, starts or stops profiling the connection's commands
+
+    The connection may be used from any thread, but only by one thread at a time.
     """
-    def __init__(self):
+    def __init__(self, database_name=DATABASE_NAME, read_only=False):
+        self.database_name = database_name
+        self.read_only = read_only
         self.con = None
         self.cur = None
         self.open = False
+        self.name_indexes = {}
+        self.columns = None
+        self.cache = ResultCache()
+        self.data_version = None
+        self.profiler = None
 
     def open_connection(self):
-        self.con = sql.connect(DATABASE_NAME)
+        if self.read_only:
+            # Imported here, like csv and hashlib below, so that starting up does not pay for it
+            import urllib.parse
+            uri = "file:" + urllib.parse.quote(os.path.abspath(self.database_name)) + "?mode=ro"
+            self.con = sql.connect(uri, uri=True, cached_statements=STATEMENT_CACHE_SIZE,
+                                   check_same_thread=False)
+            for pragma in READ_ONLY_PRAGMAS:
+                self.con.execute(f"PRAGMA {pragma} = {READ_ONLY_PRAGMAS[pragma]};")
+        else:
+            self.con = sql.connect(self.database_name, cached_statements=STATEMENT_CACHE_SIZE,
+                                   check_same_thread=False)
         self.cur = self.con.cursor()
         self.open = True
+        self.set_profiler(self.profiler)
 
     def close_connection(self):
         self.cur.close()
         self.con.close()
         self.open = False
+        self.data_version = None
+
+    def name_index(self, table):
+        if table not in self.name_indexes:
+            self.name_indexes[table] = build_name_index(self.cur, table)
+        return self.name_indexes[table]
+
+    def song_columns(self):
+        if self.columns is None:
+            # Only the analytics commands need the module
+            from analytics import SongColumns
+            self.columns = SongColumns(self.cur)
+        return self.columns
+
+    def reset_name_indexes(self):
+        self.name_indexes = {}
+
+    def update_name_indexes(self, added, removed):
+        for table in self.name_indexes:
+            for name in removed.get(table, []):
+                self.name_indexes[table].remove(name)
+            for name in added.get(table, []):
+                self.name_indexes[table].add(name)
+
+    def check_data_version(self):
+        # SQLite changes the data version whenever another connection, such as
+        # load_data's, commits to the database, which makes every cached result
+        # and name index stale
+        data_version = self.con.execute("PRAGMA data_version;").fetchone()[0]
+        if data_version != self.data_version:
+            self.cache.clear()
+            self.name_indexes = {}
+            self.columns = None
+            self.data_version = data_version
+
+    def sync_data_version(self):
+        self.data_version = self.con.execute("PRAGMA data_version;").fetchone()[0]
+
+    def cached(self, key, query, *args):
+        if self.profiler is not None:
+            self.profiler.query_started()
+            start = time.perf_counter()
+        hit, result = self.cache.get(key)
+        if not hit:
+            result = query(*args)
+            # Errors are not cached, so the query is tried again next time
+            if result is not None:
+                self.cache.put(key, result)
+        if self.profiler is not None:
+            self.profiler.add_query(time.perf_counter() - start)
+        return result
+
+    def set_profiler(self, profiler):
+        self.profiler = profiler
+        if not self.open:
+            return
+        # Wrap or unwrap the cursor, and count virtual machine steps only while profiling
+        cursor = self.cur.cursor if isinstance(self.cur, ProfilingCursor) else self.cur
+        if profiler is None:
+            self.cur = cursor
+            self.con.set_progress_handler(None, 0)
+        else:
+            self.cur = ProfilingCursor(cursor, profiler)
+            self.con.set_progress_handler(lambda: profiler.add_steps(PROGRESS_STEPS), PROGRESS_STEPS)
 
 
-def load_data():
+def load_data(database_name=DATABASE_NAME, csv_files=CSV_FILES):
     """
-    Creates the database music.db based on the above schema.
-    Then, the data is loaded into this database from the original
-    csv files.
-    :return: None
+    Creates the database music.db based on the above schema, then streams the
+    data into it from the original csv files, CSV_CHUNK_SIZE rows at a time,
+    inside a single transaction. The indexes, including the full-text search indexes
+    of full_text.py, are built once all the rows are inserted.
+    If the database already exists, it is updated incrementally instead: csv files
+    whose size and modification time are unchanged are skipped, and of the rest only
+    the chunks whose digest changed are upserted, keyed by UPSERT_KEYS, and the rows
+    whose keys are no longer in the file are deleted. The artists' hit and week totals
+    are counted from the songs table, which is their only source: all of them for a
+    new database, and those of the artists whose songs or rows changed for an update.
+    The credits and the statistics tables are then brought up to date.
+    :param database_name: str, the path of the database to create or update
+    :param csv_files: dict, a dictionary of table name/csv file to load it from
+    :return: A dictionary with the number of "rows" inserted, updated or deleted, the "seconds" it took,
+             whether the database was "rebuilt", and for an update, the names
+             "added" to and "removed" from each table
     """
-    # Check to see if the database already exists
+    start = time.perf_counter()
+    rebuilt = not os.path.exists(database_name)
+    changes = {
+        "rows": 0,
+        "rebuilt": rebuilt,
+        "added": {table_name: [] for table_name in csv_files},
+        "removed": {table_name: [] for table_name in csv_files},
+        "artist_ids": set(),
+        "deleted_ids": set()
+    }
+    conx = sql.connect(database_name)
+    curr = conx.cursor()
     try:
-        f = open("music.db", 'r')
-        f.close()
-    except FileNotFoundError:
-        # The file did not exist. Create it, then connect to it
-        f = open("music.db", 'w')
-        f.close()
-        conx = sql.connect("music.db")
-        curr = conx.cursor()
-        # Compile the schema and execute the table creation
-        for table_name in DB_SCHEMA:
-            q = f'CREATE TABLE "{table_name}"('
-            for field in DB_SCHEMA[table_name]:
-                q += f'"{field}" {DB_SCHEMA[table_name][field]}, '
-            if table_name == "artists":
-                q += 'PRIMARY KEY("artist_id")'
-            else:
-                q = q.rstrip(", ")
-            q += ");"
+        if rebuilt:
+            for pragma in BULK_LOAD_PRAGMAS:
+                curr.execute(f"PRAGMA {pragma} = {BULK_LOAD_PRAGMAS[pragma]};")
+            create_tables(curr)
+        for q in LOAD_STATE_TABLES:
             curr.execute(q)
-            conx.commit()
-        # Use a pandas dataframe to import the csv data to the sqlite database
-        df_artists = pd.read_csv("artists.csv")
-        df_artists.to_sql("artists", conx, if_exists="append", index=False)
-        df_songs = pd.read_csv("songs.csv")
-        df_songs.to_sql("songs", conx, if_exists="append", index=False)
+        curr.execute("BEGIN;")
+        if not rebuilt:
+            # The upserts need the unique key indexes, which a database loaded before them lacks
+            create_indexes(curr)
+        for table_name in csv_files:
+            load_csv(curr, table_name, csv_files[table_name], changes)
+        artist_ids = changes.pop("artist_ids")
+        deleted_ids = changes.pop("deleted_ids")
+        refresh_artist_totals(curr, artist_ids, rebuilt)
+        # The individual artists credited on the changed rows have their rollups changed,
+        # both those credited before the rows are linked again and those credited after
+        performer_ids = set() if rebuilt else credited_performers(curr, artist_ids | deleted_ids)
+        refresh_credits(curr, changes["added"]["artists"], deleted_ids, rebuilt)
+        create_indexes(curr)
+        create_search_indexes(curr, False)
+        if changes["rows"] > 0 or curr.execute(STATISTICS_EXIST_QUERY).fetchone() is None:
+            performer_ids |= set() if rebuilt else credited_performers(curr, artist_ids)
+            refresh_statistics(curr, performer_ids, rebuilt)
+        conx.commit()
+        # Write-ahead logging lets readers keep querying while a later load writes
+        curr.execute("PRAGMA journal_mode = WAL;")
+    except BaseException:
+        # An update is rolled back by closing without committing. A new database is
+        # removed, so a half-loaded one is not left behind for the next run to trust.
         curr.close()
         conx.close()
+        if rebuilt:
+            os.remove(database_name)
+        raise
+    curr.close()
+    conx.close()
+    changes["seconds"] = time.perf_counter() - start
+    return changes
+
+
+def create_tables(cur):
+    """
+    Compiles DB_SCHEMA into table creation statements and executes them.
+    :param cur: sqlite3 cursor for the database
+    :return: None
+    """
+    for table_name in DB_SCHEMA:
+        q = f'CREATE TABLE "{table_name}"('
+        for field in DB_SCHEMA[table_name]:
+            q += f'"{field}" {DB_SCHEMA[table_name][field]}, '
+        if table_name == "artists":
+            q += 'PRIMARY KEY("artist_id")'
+        else:
+            q = q.rstrip(", ")
+        q += ");"
+        cur.execute(q)
+
+
+def read_csv_chunks(file_name, chunk_size=CSV_CHUNK_SIZE):
+    """
+    Reads a csv file a fixed number of rows at a time, so that only one chunk
+    is held in memory. Empty fields are read as None, to be stored as NULL.
+    :param file_name: str, the csv file to read
+    :param chunk_size: int, the number of rows in each chunk
+    :return: A generator of (header, rows) pairs, where header is the list of
+             column names and rows is a list of at most chunk_size rows
+    """
+    import csv
+    with open(file_name, newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        chunk = []
+        for row in reader:
+            chunk.append([value if value != "" else None for value in row])
+            if len(chunk) == chunk_size:
+                yield header, chunk
+                chunk = []
+        if chunk:
+            yield header, chunk
+
+
+def load_csv(cur, table_name, file_name, changes):
+    """
+    Loads a csv file into a table, one chunk at a time, and records the file's
+    fingerprint in the load state tables. A new database has every chunk inserted
+    with executemany; an existing one has only the chunks whose digest changed
+    since the last load upserted, after which the rows whose keys were not in any
+    chunk are deleted. The csv header names the columns; columns missing from it,
+    like the artists' artist_id, are left to their defaults.
+    :param cur: sqlite3 cursor for the database
+    :param table_name: str, the table to load
+    :param file_name: str, the csv file to read
+    :param changes: dict, the changes made by load_data so far, which this adds to
+    :return: None
+    """
+    import hashlib
+    stat = os.stat(file_name)
+    fingerprint = (stat.st_size, stat.st_mtime_ns)
+    stored = cur.execute('SELECT size, mtime_ns FROM load_files WHERE table_name = ?;', (table_name,)).fetchone()
+    if not changes["rebuilt"] and stored == fingerprint:
+        return
+    digests = dict(cur.execute('SELECT chunk, digest FROM load_chunks WHERE table_name = ?;', (table_name,)))
+    # The keys of the rows in the file, so the rows no longer in it can be found and deleted
+    keys = set()
+    chunk_number = -1
+    for chunk_number, (header, chunk) in enumerate(read_csv_chunks(file_name)):
+        for column in header:
+            if column not in DB_SCHEMA[table_name]:
+                raise ValueError(f"{file_name} has a column {column} that is not in the {table_name} table.")
+        digest = hashlib.sha1(repr((header, chunk)).encode()).hexdigest()
+        if not changes["rebuilt"]:
+            # Every chunk's keys are kept, changed or not, as the rows of a chunk that did not
+            # change are still in the file
+            keys.update(chunk_keys(table_name, header, chunk, chunk_number * CSV_CHUNK_SIZE))
+        if changes["rebuilt"]:
+            q = f'INSERT INTO "{table_name}"({", ".join(header)}) VALUES ({", ".join("?" * len(header))});'
+            cur.executemany(q, chunk)
+            changes["rows"] += len(chunk)
+        elif digests.get(chunk_number) != digest:
+            changes["rows"] += upsert_chunk(cur, table_name, header, chunk, chunk_number * CSV_CHUNK_SIZE, changes)
+        else:
+            continue
+        cur.execute('INSERT OR REPLACE INTO load_chunks VALUES (?, ?, ?);', (table_name, chunk_number, digest))
+    if not changes["rebuilt"]:
+        delete_missing(cur, table_name, keys, changes)
+    # Forget the digests of chunks past the end of a file that got shorter
+    cur.execute('DELETE FROM load_chunks WHERE table_name = ? AND chunk > ?;', (table_name, chunk_number))
+    cur.execute('INSERT OR REPLACE INTO load_files VALUES (?, ?, ?);', (table_name,) + fingerprint)
+
+
+def chunk_keys(table_name, header, chunk, first_row):
+    """
+    Lists the keys in UPSERT_KEYS of the rows of a chunk. Artists without an
+    artist_id column are keyed by their row in the csv file.
+    :param table_name: str, the table the chunk is loaded into
+    :param header: list, the column names of the chunk
+    :param chunk: list, the rows of the chunk
+    :param first_row: int, the row number in the csv file of the first row of the chunk
+    :return: list, the key of each row
+    """
+    key = UPSERT_KEYS[table_name]
+    if key not in header:
+        return [first_row + number + 1 for number in range(len(chunk))]
+    key_index = header.index(key)
+    if DB_SCHEMA[table_name][key] == "INTEGER":
+        # Read from the csv as text, but stored, and read back from the table, as integers
+        return [None if row[key_index] is None else int(row[key_index]) for row in chunk]
+    return [row[key_index] for row in chunk]
+
+
+def delete_missing(cur, table_name, keys, changes):
+    """
+    Deletes the rows of a table whose keys are no longer in its csv file, once
+    the file's rows have been upserted. When the artists are keyed by their row,
+    removing a line shifts the rows after it up, leaving the last rows to be
+    deleted here.
+    :param cur: sqlite3 cursor for the database
+    :param table_name: str, the table to delete from
+    :param keys: set, the keys of the rows in the csv file
+    :param changes: dict, the changes made by load_data so far, which this adds to
+    :return: None
+    """
+    key = UPSERT_KEYS[table_name]
+    name_col = NAME_COLUMNS[table_name]
+    # Every key in the file has a row by now, so if there are no more rows than keys,
+    # there are no others, and the table's keys need not be read
+    if cur.execute(f'SELECT COUNT(*) FROM "{table_name}";').fetchone()[0] == len(keys):
+        return
+    missing = [(row[0],) for row in cur.execute(f'SELECT DISTINCT {key} FROM "{table_name}";')
+               if row[0] not in keys]
+    for row_key in missing:
+        deleted = cur.execute(f'SELECT {name_col}, artist_id FROM "{table_name}" WHERE {key} = ?;', row_key).fetchall()
+        for name, artist_id in deleted:
+            if name is not None:
+                changes["removed"][table_name].append(name)
+            # The artist's totals change with its songs, and a deleted artist loses its credits and rollups
+            changes["artist_ids" if table_name == "songs" else "deleted_ids"].add(artist_id)
+        changes["rows"] += len(deleted)
+    cur.executemany(f'DELETE FROM "{table_name}" WHERE {key} = ?;', missing)
+
+
+def upsert_chunk(cur, table_name, header, chunk, first_row, changes):
+    """
+    Upserts the rows of a chunk in one executemany: rows whose key in UPSERT_KEYS
+    is new are inserted, and the rest update the row with that key, unless their
+    values are all the same, as when a line removed earlier in the file shifts
+    them into another chunk. Artists without an artist_id column are numbered by
+    their row in the csv file, as they are when the database is first loaded.
+    :param cur: sqlite3 cursor for the database
+    :param table_name: str, the table to upsert into
+    :param header: list, the column names of the chunk
+    :param chunk: list, the rows of the chunk
+    :param first_row: int, the row number in the csv file of the first row of the chunk
+    :param changes: dict, the changes made by load_data so far, which this adds to
+    :return: int, the number of rows inserted or updated
+    """
+    key = UPSERT_KEYS[table_name]
+    name_col = NAME_COLUMNS[table_name]
+    if key not in header:
+        header = [key] + header
+        chunk = [[first_row + number + 1] + row for number, row in enumerate(chunk)]
+    values = [column for column in header if column != key]
+    q = f'INSERT INTO "{table_name}"({", ".join(header)}) VALUES ({", ".join("?" * len(header))}) ' \
+        f'ON CONFLICT({key}) DO UPDATE SET {", ".join(f"{column} = excluded.{column}" for column in values)} ' \
+        f'WHERE {" OR ".join(f"{column} IS NOT excluded.{column}" for column in values)};'
+    cur.execute(LOAD_CHANGES_TABLE)
+    for trigger in LOAD_CHANGES_TRIGGERS:
+        cur.execute(trigger.format(table=table_name, name_col=name_col))
+    try:
+        cur.executemany(q, chunk)
+        upserted = cur.rowcount
+        for old_name, new_name, old_artist, new_artist in cur.execute('SELECT * FROM load_changes ORDER BY rowid;'):
+            if old_name != new_name:
+                if old_name is not None:
+                    changes["removed"][table_name].append(old_name)
+                changes["added"][table_name].append(new_name)
+            # The totals of the artist, and of the one a song moved away from, are counted again
+            changes["artist_ids"].update(artist for artist in (old_artist, new_artist) if artist is not None)
+    finally:
+        cur.execute('DELETE FROM load_changes;')
+        for trigger in ("insert", "update"):
+            cur.execute(f'DROP TRIGGER IF EXISTS "load_{table_name}_{trigger}";')
+    return upserted
+
+
+def refresh_artist_totals(cur, artist_ids, full):
+    """
+    Counts the num_hit_songs and total_weeks of artists from their rows in the
+    songs table, which are the only source of the totals: the values in
+    artists.csv are replaced.
+    :param cur: sqlite3 cursor for the database
+    :param artist_ids: set, the ids of the artists to count again
+    :param full: bool, whether to count the totals of every artist instead
+    :return: None
+    """
+    q = 'UPDATE artists SET ' \
+        'num_hit_songs = (SELECT COUNT(*) FROM songs WHERE songs.artist_id = artists.artist_id), ' \
+        'total_weeks = (SELECT COALESCE(SUM(weeks_on_chart), 0) FROM songs WHERE songs.artist_id = artists.artist_id)'
+    if full:
+        cur.execute(q + ';')
+    else:
+        cur.executemany(q + ' WHERE artist_id = ?;',
+                        [(int(artist_id),) for artist_id in artist_ids if artist_id is not None])
+
+
+def split_credit(name):
+    """
+    Splits a credit into the individual artists in it. Artists are separated by
+    commas; an act like "Macklemore & Ryan Lewis" stays whole.
+    :param name: str, the artist_names of a row of the artists table
+    :return: list, the individual artists' names
+    """
+    return [part.strip() for part in name.split(",") if part.strip() != ""]
+
+
+def credited_performers(cur, artist_ids):
+    """
+    Finds the individual artists credited on the given rows of the artists table.
+    :param cur: sqlite3 cursor for the database
+    :param artist_ids: set, the ids of the rows of the artists table
+    :return: set, the performer_ids of the individual artists
+    """
+    if cur.execute(CREDITS_EXIST_QUERY).fetchone() is None:
+        return set()
+    performer_ids = set()
+    for artist_id in artist_ids:
+        if artist_id is not None:
+            performer_ids.update(row[0] for row in cur.execute('SELECT performer_id FROM artist_credits '
+                                                               'WHERE artist_id = ?;', (int(artist_id),)))
+    return performer_ids
+
+
+def refresh_credits(cur, credits, deleted_ids, full):
+    """
+    Links the given credits (rows of the artists table) to the individual
+    artists in them, adding any artists not seen before, unlinks the deleted
+    rows, then removes the individual artists no longer credited anywhere.
+    :param cur: sqlite3 cursor for the database
+    :param credits: list, the artist_names of the new or renamed rows of the artists table
+    :param deleted_ids: set, the artist_ids of the rows deleted from the artists table
+    :param full: bool, whether to relink every row of the artists table instead
+    :return: None
+    """
+    if cur.execute(CREDITS_EXIST_QUERY).fetchone() is None:
+        full = True
+    for q in CREDIT_TABLES:
+        cur.execute(q)
+    if full:
+        cur.execute('DELETE FROM artist_credits;')
+        rows = cur.execute('SELECT artist_id, artist_names FROM artists WHERE artist_names IS NOT NULL;').fetchall()
+    else:
+        rows = []
+        for name in credits:
+            rows += cur.execute('SELECT artist_id, artist_names FROM artists WHERE artist_names = ?;',
+                                (name,)).fetchall()
+        cur.executemany('DELETE FROM artist_credits WHERE artist_id = ?;',
+                        [(row[0],) for row in rows] + [(artist_id,) for artist_id in deleted_ids])
+    links = [(performer, row[0]) for row in rows for performer in split_credit(row[1])]
+    cur.executemany('INSERT OR IGNORE INTO performers(performer_name) VALUES (?);',
+                    [(performer,) for performer, artist_id in links])
+    cur.executemany('INSERT OR IGNORE INTO artist_credits SELECT performer_id, ? FROM performers '
+                    'WHERE performer_name = ?;', [(artist_id, performer) for performer, artist_id in links])
+    cur.execute('DELETE FROM performers WHERE performer_id NOT IN (SELECT performer_id FROM artist_credits);')
+
+
+def create_indexes(cur):
+    """
+    Creates every index in DB_INDEXES and KEY_INDEXES that does not exist yet,
+    then, if any were created, refreshes the planner statistics so SQLite picks
+    them up. An update leaves the planner statistics as they were, since ANALYZE
+    reads every index.
+    :param cur: sqlite3 cursor for the database
+    :return: None
+    """
+    created = False
+    for indexes, kind in ((DB_INDEXES, "INDEX"), (KEY_INDEXES, "UNIQUE INDEX")):
+        for index_name in indexes:
+            if cur.execute("SELECT 1 FROM sqlite_master WHERE name = ?;", (index_name,)).fetchone() is None:
+                table, column = indexes[index_name]
+                try:
+                    cur.execute(f'CREATE {kind} "{index_name}" ON "{table}"({column});')
+                except sql.IntegrityError:
+                    raise ValueError(f"The {table} table has more than one row with the same {column}.")
+                created = True
+    if created:
+        cur.execute("ANALYZE;")
+
+
+def snapshot_query(query):
+    """
+    Lets a query function be given a snapshot.Snapshot in place of the cursor,
+    handing the query to the snapshot's method of the same name.
+    :param query: function, a query function taking the cursor first
+    :return: function, the query function, answering from a snapshot too
+    """
+    @functools.wraps(query)
+    def run(cur, *args, **kwargs):
+        if getattr(cur, "is_snapshot", False):
+            return getattr(cur, query.__name__)(*args, **kwargs)
+        return query(cur, *args, **kwargs)
+    return run
+
+
+@snapshot_query
+def build_name_index(cur, table):
+    """
+    Builds an in-memory NameIndex over the names in a table.
+    :param cur: sqlite3 cursor for querying
+    :param table: str, the table to index, either artists or songs
+    :return: NameIndex of the table's names, in row order
+    """
+    search_col = NAME_COLUMNS[table]
+    retrieved = cur.execute(f'SELECT {search_col} FROM {table} ORDER BY rowid;')
+    return NameIndex((row[0] for row in retrieved if row[0] is not None), table == "artists")
+
+
+def explain(cur, q, params=()):
+    """
+    Returns the query plan SQLite would use for the given query.
+    :param cur: sqlite3 cursor for querying
+    :param q: str, the SQL query to explain
+    :param params: tuple or dict, the values bound to the query's parameters
+    :return: A list of strings, one per step of the query plan, or None on error
+    """
+    try:
+        retrieved = cur.execute("EXPLAIN QUERY PLAN " + q, params).fetchall()
+    except sql.DatabaseError:
+        return None
+    return [row[3] for row in retrieved]
+
 
+def query_plans(cur):
+    """
+    Explains each of the lookup queries used by the query functions below,
+    using a placeholder name as the searched value.
+    :param cur: sqlite3 cursor for querying
+    :return: A dictionary of query description/list of query plan steps.
+    """
+    plans = {}
+    for table in NAME_COLUMNS:
+        plans[f"{table} lookup"] = explain(cur, _select_query(table, ("rowid",)), ("name",))
+        plans[f"{table} prefix search"] = explain(cur, _search_query(table, False),
+                                                  {"prefix": "name%", "limit": -1, "offset": 0})
+        plans[f"{table} find"] = explain(cur, find_query(table, "RELEVANCE"), ('"name"', PAGE_SIZE))
+    plans["artists search"] = explain(cur, _search_query("artists", True),
+                                      {"prefix": "name%", "limit": -1, "offset": 0})
+    plans["songlist join"] = explain(cur, SONGLIST_QUERY, ("name",))
+    plans["artist totals"] = explain(cur, PERFORMER_TOTALS_QUERY.format(match="= ?"), ("name",))
+    plans["artist songlist"] = explain(cur, PERFORMER_SONGLIST_QUERY.format(match="= ?"), ("name",))
+    plans["songlist page"] = explain(cur, SONGLIST_PAGE_QUERY, {"name": "name", "limit": PAGE_SIZE, "offset": 0})
+    plans["author join"] = explain(cur, AUTHOR_QUERY, ("name",))
+    return plans
+
+
+@functools.cache
+def _select_query(table, columns):
+    """
+    Builds the parameterized select statement for a table and tuple of columns.
+    The statements are cached so each distinct query is one string, which lets
+    sqlite3 reuse its prepared statement.
+    :param table: str, the table to select from
+    :param columns: tuple, the columns to select alongside the name column
+    :return: str, the SQL query
+    """
+    if table not in NAME_COLUMNS:
+        raise sql.ProgrammingError(f"Unknown table {table}")
+    for column in columns:
+        if column != "rowid" and column not in DB_SCHEMA[table]:
+            raise sql.ProgrammingError(f"Unknown column {column}")
+    search_col = NAME_COLUMNS[table]
+    all_cols = f'{search_col}, {", ".join(columns)}'
+    return f'SELECT {all_cols} FROM {table} WHERE {search_col} = ?;'
 
+
+@functools.cache
+def _search_query(table, featured):
+    """
+    Builds the parameterized search statement for a table, binding the named
+    parameters prefix, limit and offset. The names starting with the prefix
+    come first, then, for a featured search of the artists, the credits with an
+    individual artist after the first starting with it, found by a prefix match
+    on the performers table. Each half is in the order of the NOCASE index on the
+    names, ties going to the earlier row.
+    :param table: str, the table to search
+    :param featured: bool, whether to match the featured artists too
+    :return: str, the SQL query
+    """
+    if table not in NAME_COLUMNS or (featured and table != "artists"):
+        raise sql.ProgrammingError(f"Unknown table {table}")
+    search_col = NAME_COLUMNS[table]
+    q = f'SELECT {search_col} FROM {table} WHERE {search_col} LIKE :prefix ORDER BY {search_col} COLLATE NOCASE, rowid '
+    if featured:
+        # The unary + keeps the planner from scanning the whole NOCASE index to skip the sort,
+        # so the featured credits are found from the performers' prefix match and then sorted
+        q = f'SELECT * FROM ({q}) UNION ALL SELECT * FROM (SELECT artist_names FROM artists WHERE artist_id IN ' \
+            f'(SELECT artist_id FROM performers JOIN artist_credits ON artist_credits.performer_id = ' \
+            f'performers.performer_id WHERE performer_name LIKE :prefix) AND NOT artist_names LIKE :prefix ' \
+            f'ORDER BY +artist_names COLLATE NOCASE, artist_id) '
+    return q + 'LIMIT :limit OFFSET :offset;'
+
+
+@snapshot_query
 def select(cur, searchable, table, columns):
     """
     Executes and returns a generic select statement as defined
@@ -111,17 +901,10 @@ def select(cur, searchable, table, columns):
              values.
     """
     all_results = {}
-    # Formulate the SQL query, including columns and the searchable column
-    search_col = ""
-    if table == "artists":
-        search_col = "artist_names"
-    elif table == "songs":
-        search_col = "track_name"
-    all_cols = f'{search_col}, {", ".join(columns)}'
-    # Create and execute the query
+    # Create and execute the query, binding the searchable as a parameter
     try:
-        q = f'SELECT {all_cols} FROM {table} WHERE {search_col}="{searchable}";'
-        retrieved = cur.execute(q).fetchall()
+        q = _select_query(table, tuple(columns))
+        retrieved = cur.execute(q, (searchable,)).fetchall()
     except sql.DatabaseError:
         # There was a problem retrieving the data. Return null
         all_results = None
@@ -137,6 +920,7 @@ def select(cur, searchable, table, columns):
         return all_results
 
 
+@snapshot_query
 def join_songlist(cur, searchable):
     """
     Executes and returns a join select statement for the "songlist" functionality.
@@ -150,26 +934,48 @@ def join_songlist(cur, searchable):
     all_results = {}
     # Create and execute the query
     try:
-        q = f'SELECT artist_names, track_name FROM artists INNER JOIN songs ON artists.artist_id = songs.artist_id ' \
-            f'WHERE artist_names = "{searchable}";'
-        retrieved = cur.execute(q).fetchall()
-    except sql.DatabaseError:
-        # There was a problem retrieving the data. Return null
-        all_results = None
-    else:
+        retrieved = fetch_rows(cur.execute(SONGLIST_QUERY, (searchable,)))
         # Interpret the query into a dictionary of artist names and lists for displaying
         for row in retrieved:
             name = row[0]
-            if name in all_results:
+            if name not in all_results:
+                # Create a new songlist for this artist
+                all_results[name] = []
+            if row[1] is not None:
                 # Add this song to this artist's songlist
                 all_results[name].append(row[1])
-            else:
-                # Create a new songlist for this artist
-                all_results[name] = [row[1]]
+    except sql.DatabaseError:
+        # There was a problem retrieving the data. Return null
+        all_results = None
     finally:
         return all_results
 
 
+@snapshot_query
+def iter_songlist(cur, searchable, limit=-1, offset=0):
+    """
+    Streams an artist's songs, a page at a time if a limit is given: every song
+    an individual artist is credited on, or the songs of a whole credit. Whether
+    the artist exists is answered by the same statement, and the songs are fetched
+    from the cursor as they are read, so the whole songlist is never held in memory.
+    :param cur: sqlite3 cursor for querying; it must not run another query until
+                the songs have all been read
+    :param searchable: str, the artist name
+    :param limit: int, the most songs to return, or -1 for all of them
+    :param offset: int, the number of songs to skip
+    :return: A dictionary of the artist name/generator of song names, empty if the
+             artist does not exist, or None if there was a problem
+    """
+    try:
+        retrieved = cur.execute(SONGLIST_PAGE_QUERY, {"name": searchable, "limit": limit, "offset": offset})
+        if retrieved.fetchone() is None:
+            return {}
+    except sql.DatabaseError:
+        return None
+    return {searchable: (row[1] for row in fetch_rows(retrieved))}
+
+
+@snapshot_query
 def join_author(cur, searchable):
     """
     Executes and returns a join select statement for the "author" functionality.
@@ -177,97 +983,374 @@ def join_author(cur, searchable):
     :param cur: sqlite3 cursor for querying
     :param searchable: str, The item that will be searched for when making
                         the statement, the song name.
-    :return: str, the name of the artist
+    :return: str, the name of the artist, or an empty string if the song does not exist
     """
     result = ""
     # Create and execute the query
     try:
-        q = f'SELECT artist_names FROM artists INNER JOIN songs ON artists.artist_id = songs.artist_id ' \
-            f'WHERE track_name = "{searchable}";'
-        retrieved = cur.execute(q).fetchall()
+        retrieved = cur.execute(AUTHOR_QUERY, (searchable,)).fetchone()
     except sql.DatabaseError:
         # There was a problem retrieving the data. Return null
         result = None
     else:
         # Interpret the query result into a single string
-        result = retrieved[0][0]
+        if retrieved is not None:
+            result = retrieved[0]
     finally:
         return result
 
 
+def _batch_names(cur, searchables):
+    """
+    Prepares a batch of names for an IN clause. Small batches are bound as
+    parameters, one per name; large ones are inserted into a temporary table
+    first, so the statement stays the same size however many names there are.
+    :param cur: sqlite3 cursor for querying
+    :param searchables: list, the names, without duplicates
+    :return: tuple, the SQL to follow IN and the parameters it binds
+    """
+    if len(searchables) <= BATCH_IN_LIMIT:
+        return "(" + ", ".join("?" * len(searchables)) + ")", tuple(searchables)
+    cur.execute(BATCH_NAMES_TABLE)
+    cur.execute("DELETE FROM batch_names;")
+    cur.executemany("INSERT OR IGNORE INTO batch_names VALUES (?);", [(name,) for name in searchables])
+    return "(SELECT name FROM batch_names)", ()
+
+
+def _in_order(results, searchables):
+    """
+    Puts the results of a batch lookup back into the order the names were given in.
+    :param results: dict, the results keyed by name
+    :param searchables: list, the names in the order they were given
+    :return: dict, the results of the names that were found, in order
+    """
+    return {name: results[name] for name in searchables if name in results}
+
+
+@snapshot_query
+def select_many(cur, searchables, table, columns):
+    """
+    The batch form of select: looks up many names in one statement.
+    :param cur: sqlite3 cursor for querying
+    :param searchables: list, the names to look up
+    :param table: str, The table that should be queried by this select statement
+    :param columns: list, A list of all columns that should be selected from this query.
+    :return: A dictionary of dictionaries in the shape select returns, holding the
+             names that were found in the order they were given, or None on an error.
+    """
+    searchables = list(dict.fromkeys(searchables))
+    all_results = {}
+    try:
+        # Check the table and columns the same way select does
+        _select_query(table, tuple(columns))
+        names, params = _batch_names(cur, searchables)
+        q = SELECT_BATCH_QUERY.format(all_cols=", ".join([NAME_COLUMNS[table]] + list(columns)), table=table,
+                                      search_col=NAME_COLUMNS[table], names=names)
+        for row in cur.execute(q, params):
+            all_results[row[0]] = {columns[col]: row[col + 1] for col in range(len(columns))}
+    except sql.DatabaseError:
+        return None
+    return _in_order(all_results, searchables)
+
+
+@snapshot_query
+def select_performers(cur, searchables, columns):
+    """
+    Looks up the totals of individual artists, counting every song they are
+    credited on, alone or with others.
+    :param cur: sqlite3 cursor for querying
+    :param searchables: list, the individual artists' names
+    :param columns: list, the totals to return, num_hit_songs and/or total_weeks
+    :return: A dictionary of dictionaries in the shape select returns, holding the
+             names that were found in the order they were given, or None on an error.
+    """
+    searchables = list(dict.fromkeys(searchables))
+    all_results = {}
+    try:
+        for column in columns:
+            if column not in ("num_hit_songs", "total_weeks"):
+                raise sql.ProgrammingError(f"Unknown column {column}")
+        names, params = _batch_names(cur, searchables)
+        cur.execute(PERFORMER_TOTALS_QUERY.format(match="IN " + names), params)
+        for row in fetch_rows(cur):
+            totals = {"num_hit_songs": row[1], "total_weeks": row[2]}
+            all_results[row[0]] = {column: totals[column] for column in columns}
+    except sql.DatabaseError:
+        return None
+    return _in_order(all_results, searchables)
+
+
+@snapshot_query
+def join_performer_songlists(cur, searchables):
+    """
+    Finds every song individual artists are credited on, alone or with others.
+    :param cur: sqlite3 cursor for querying
+    :param searchables: list, the individual artists' names
+    :return: A dictionary of artist name/songlist for the names that were found,
+             in the order they were given, or None on an error.
+    """
+    searchables = list(dict.fromkeys(searchables))
+    all_results = {}
+    try:
+        names, params = _batch_names(cur, searchables)
+        cur.execute(PERFORMER_SONGLIST_QUERY.format(match="IN " + names), params)
+        for row in fetch_rows(cur):
+            songlist = all_results.setdefault(row[0], [])
+            if row[1] is not None:
+                songlist.append(row[1])
+    except sql.DatabaseError:
+        return None
+    return _in_order(all_results, searchables)
+
+
+def artist_totals(cur, searchables, columns):
+    """
+    Looks up the hits and weeks of artists: those of an individual artist over every
+    song they are credited on, or for a whole credit such as "24kGoldn, iann dior",
+    those of its row in the artists table.
+    :param cur: sqlite3 cursor for querying
+    :param searchables: list, the artist names
+    :param columns: list, the totals to return, num_hit_songs and/or total_weeks
+    :return: A dictionary of dictionaries in the shape select returns, holding the
+             names that were found in the order they were given, or None on an error.
+    """
+    return _with_credits(select_performers(cur, searchables, columns), searchables,
+                         lambda missing: select_many(cur, missing, "artists", columns))
+
+
+def artist_songlists(cur, searchables):
+    """
+    Finds the songlists of artists: every song an individual artist is credited on,
+    or the songs of a whole credit such as "24kGoldn, iann dior".
+    :param cur: sqlite3 cursor for querying
+    :param searchables: list, the artist names
+    :return: A dictionary of artist name/songlist for the names that were found,
+             in the order they were given, or None on an error.
+    """
+    return _with_credits(join_performer_songlists(cur, searchables), searchables,
+                         lambda missing: join_songlist_many(cur, missing))
+
+
+def _with_credits(results, searchables, credit_lookup):
+    """
+    Completes the results of a lookup of individual artists with the names that
+    are whole credits instead.
+    :param results: dict, the results for the individual artists, or None on an error
+    :param searchables: list, every name looked up
+    :param credit_lookup: function, looks up a list of names as whole credits
+    :return: dict, the results of every name found, in the order given, or None on an error
+    """
+    if results is None:
+        return None
+    missing = [name for name in dict.fromkeys(searchables) if name not in results]
+    if missing:
+        credits = credit_lookup(missing)
+        if credits is None:
+            return None
+        results.update(credits)
+    return _in_order(results, list(dict.fromkeys(searchables)))
+
+
+@snapshot_query
+def join_songlist_many(cur, searchables):
+    """
+    The batch form of join_songlist: finds the songlists of many artists in one statement.
+    :param cur: sqlite3 cursor for querying
+    :param searchables: list, the artist names
+    :return: A dictionary of artist name/songlist for the artists that were found,
+             in the order they were given, or None on an error.
+    """
+    searchables = list(dict.fromkeys(searchables))
+    all_results = {}
+    try:
+        names, params = _batch_names(cur, searchables)
+        for row in cur.execute(SONGLIST_BATCH_QUERY.format(names=names), params):
+            songlist = all_results.setdefault(row[0], [])
+            if row[1] is not None:
+                songlist.append(row[1])
+    except sql.DatabaseError:
+        return None
+    return _in_order(all_results, searchables)
+
+
+@snapshot_query
+def join_author_many(cur, searchables):
+    """
+    The batch form of join_author: finds the artists of many songs in one statement.
+    :param cur: sqlite3 cursor for querying
+    :param searchables: list, the song names
+    :return: A dictionary of song name/artist name for the songs that were found,
+             in the order they were given, or None on an error.
+    """
+    searchables = list(dict.fromkeys(searchables))
+    try:
+        names, params = _batch_names(cur, searchables)
+        all_results = dict(cur.execute(AUTHOR_BATCH_QUERY.format(names=names), params))
+    except sql.DatabaseError:
+        return None
+    return _in_order(all_results, searchables)
+
+
+@snapshot_query
 def search(cur, table, searchable):
     """
     Searches for a given substring in the names for a given table. The returned
-    names which contain the substring will be returned as a list of string names.
+    names which start with the substring, followed by, for the artists, the credits
+    with an individual artist after the first starting with it, will be returned as a
+    list of string names.
+    A searchable that is empty or contains a % wildcard is only matched from the start.
     :param cur: sqlite3 cursor for querying
     :param table: the table that this will search.
     :param searchable: str, The substring that will be searched for in names
     :return: a list of the names in the table that are returned by the search
     """
-    result = []
-    search_col = ""
-    if table == "artists":
-        search_col = "artist_names"
-    elif table == "songs":
-        search_col = "track_name"
-    # Create and execute the query
+    names = iter_search(cur, table, searchable)
+    return None if names is None else list(names)
+
+
+@snapshot_query
+def iter_search(cur, table, searchable, limit=-1, offset=0):
+    """
+    Streams the results of search, a page at a time if a limit is given, fetching
+    the names from the cursor as they are read.
+    :param cur: sqlite3 cursor for querying; it must not run another query until
+                the names have all been read
+    :param table: the table that this will search.
+    :param searchable: str, The substring that will be searched for in names
+    :param limit: int, the most names to return, or -1 for all of them
+    :param offset: int, the number of names to skip
+    :return: a generator of the names, or None if there was a problem
+    """
     try:
-        q = f'SELECT {search_col} FROM {table} WHERE {search_col} LIKE "{searchable}%";'
-        retrieved = cur.execute(q).fetchall()
+        # Every artist a search with a wildcard, or an empty one, could find through a featured
+        # credit already starts with it, so the featured half is left out of the statement
+        featured = table == "artists" and searchable != "" and "%" not in searchable
+        retrieved = cur.execute(_search_query(table, featured),
+                                {"prefix": searchable + "%", "limit": limit, "offset": offset})
     except sql.DatabaseError:
         # There was a problem retrieving the data. Return null.
-        result = None
-    else:
-        # Interpret the query result into a list of strings
-        for name in retrieved:
-            result.append(name[0])
-    finally:
-        return result
+        return None
+    return (row[0] for row in fetch_rows(retrieved))
+
 
+def fetch_rows(cursor, size=FETCH_SIZE):
+    """
+    Reads the rows of an executed query a few at a time, instead of all at once.
+    :param cursor: sqlite3 cursor the query was executed on
+    :param size: int, the number of rows to fetch at a time
+    :return: a generator of the rows
+    """
+    rows = cursor.fetchmany(size)
+    while rows:
+        yield from rows
+        rows = cursor.fetchmany(size)
 
+
+@snapshot_query
 def data(cur, keyword):
     """
-    Executes and returns a select statement for the desired data keyword given by the user.
-    The results of the desired data will be returned in a string output to be easily displayed.
+    Returns the desired data keyword given by the user, formatted in a string output
+    to be easily displayed. The value is read from the statistics table kept by
+    load_data, or computed from the songs and artists tables for a database loaded
+    before that table existed.
     :param cur: sqlite3 cursor for querying
-    :param keyword: keyword, user provided keyword for desired data.
+    :param keyword: keyword, user provided keyword for desired data, one of DATA_KEYWORDS.
     :return: A string with the appropriate format for desired data.
     """
-    all_results = {}
-
-    # if statement for keywords
-    if keyword == "artists":
-        try:
-            # Create artist query
-            q = f'SELECT COUNT(*) FROM artists;'
-            retrieved = cur.execute(q).fetchall()
-        except sql.DatabaseError:
-            # There was a problem retrieving the data. Return null
-            all_results = None
-        else:
-            # Format output and store
-            all_results = f'The total number of artists stored is: {retrieved[0][0]}'
-    elif keyword == "songs":
-        try:
-            # Create artist query
-            q = f'SELECT COUNT(*) FROM songs;'
-            retrieved = cur.execute(q).fetchall()
-        except sql.DatabaseError:
-            # There was a problem retrieving the data. Return null
-            all_results = None
-        else:
-            # Format output and store
-            all_results = f'The total number of songs stored is: {retrieved[0][0]}'
-    elif keyword == "duration":
+    statistic, q, output = DATA_KEYWORDS[keyword]
+    try:
         try:
-            # Create artist query
-            q = f'SELECT AVG(duration_ms) FROM songs;'
+            retrieved = cur.execute(STATISTIC_QUERY, (statistic,)).fetchall()
+        except sql.OperationalError:
+            # There is no statistics table yet
+            retrieved = []
+        if not retrieved:
             retrieved = cur.execute(q).fetchall()
-        except sql.DatabaseError:
-            # There was a problem retrieving the data. Return null
-            all_results = None
-        else:
-            # Format output and store
-            all_results = f'The average duration of songs store in ms is: {retrieved[0][0]}'
-    # return results to parser
+    except sql.DatabaseError:
+        # There was a problem retrieving the data. Return null
+        return None
+    # Format output and return results to parser
+    return output.format(retrieved[0][0])
+
+
+def top_artists(cur, limit):
+    """
+    Returns the individual artists with the most total weeks on the charts, over
+    every credit they appear on, from the rollups kept by load_data.
+    :param cur: sqlite3 cursor for querying
+    :param limit: int, the number of artists to return
+    :return: A dictionary of dictionaries, keyed by artist name in order of total weeks,
+             containing the artist's total_weeks, songs and best_rank
+    """
+    all_results = {}
+    try:
+        retrieved = cur.execute(TOP_ARTISTS_QUERY, (limit,)).fetchall()
+    except sql.DatabaseError:
+        # There was a problem retrieving the data, such as the rollups not being built yet
+        return None
+    for row in retrieved:
+        all_results[row[0]] = {"total_weeks": row[1], "songs": row[2], "best_rank": row[3]}
     return all_results
+
+
+def rank_distribution(cur):
+    """
+    Returns how many songs peaked in each band of RANK_BUCKET_SIZE ranks,
+    from the distribution kept by load_data.
+    :param cur: sqlite3 cursor for querying
+    :return: A dictionary of rank band/number of songs, in rank order
+    """
+    try:
+        retrieved = cur.execute('SELECT bucket_start, bucket_end, songs FROM rank_distribution '
+                                'ORDER BY bucket_start;').fetchall()
+    except sql.DatabaseError:
+        # There was a problem retrieving the data, such as the distribution not being built yet
+        return None
+    return {f"{row[0]}-{row[1]}": row[2] for row in retrieved}
+
+
+def refresh_statistics(cur, performer_ids, full):
+    """
+    Brings the statistics tables up to date. The rollups of the individual artists
+    are rebuilt for every one of them, or only for the given ones. The running totals and rank
+    distribution are counted in full for a new database, after which triggers keep
+    them current, so an update only derives the other statistics from them and
+    from the duration index.
+    :param cur: sqlite3 cursor for the database
+    :param performer_ids: set, the ids of the individual artists whose songs or credits
+                          changed, including those no longer credited anywhere
+    :param full: bool, whether to rebuild the rollups for every individual artist
+    :return: None
+    """
+    for q in STATISTICS_TABLES:
+        cur.execute(q)
+    if full or cur.execute('SELECT 1 FROM performer_statistics LIMIT 1;').fetchone() is None:
+        cur.execute('DELETE FROM performer_statistics;')
+        cur.execute(PERFORMER_STATISTICS_QUERY.format(where=""))
+    else:
+        q = PERFORMER_STATISTICS_QUERY.format(where="WHERE performers.performer_id = ?")
+        performer_ids = [(performer_id,) for performer_id in performer_ids]
+        # Rollups of artists no longer credited anywhere are not replaced, so they are removed first
+        cur.executemany('DELETE FROM performer_statistics WHERE performer_id = ?;', performer_ids)
+        cur.executemany(q, performer_ids)
+    if full or cur.execute(STATISTICS_TRIGGERS_EXIST_QUERY).fetchone() is None:
+        # Without the triggers, as for a database loaded before they existed, nothing kept the totals
+        cur.executemany('INSERT OR REPLACE INTO statistics VALUES (?, ?);',
+                        zip(RUNNING_STATISTICS, cur.execute(RUNNING_STATISTICS_QUERY).fetchone()))
+        cur.execute('DELETE FROM rank_distribution;')
+        cur.execute(f'INSERT INTO rank_distribution SELECT (peak_rank - 1) / {RANK_BUCKET_SIZE} * {RANK_BUCKET_SIZE} + 1, '
+                    f'(peak_rank - 1) / {RANK_BUCKET_SIZE} * {RANK_BUCKET_SIZE} + {RANK_BUCKET_SIZE}, COUNT(*) '
+                    f'FROM songs WHERE peak_rank >= 1 GROUP BY (peak_rank - 1) / {RANK_BUCKET_SIZE};')
+        for q in STATISTICS_TRIGGERS:
+            cur.execute(q)
+    running = dict(cur.execute(f'SELECT name, value FROM statistics WHERE name IN '
+                               f'({", ".join("?" * len(RUNNING_STATISTICS))});', RUNNING_STATISTICS))
+    count = running["duration_count"]
+    # MIN and MAX are asked for separately, so each reads one end of the duration index
+    statistics = {
+        "avg_duration": running["total_duration"] / count if count else None,
+        "median_duration": cur.execute(MEDIAN_DURATION_AT_QUERY, (2 - count % 2, (count - 1) // 2)).fetchone()[0],
+        "min_duration": cur.execute('SELECT MIN(duration_ms) FROM songs;').fetchone()[0],
+        "max_duration": cur.execute('SELECT MAX(duration_ms) FROM songs;').fetchone()[0]
+    }
+    cur.executemany('INSERT OR REPLACE INTO statistics VALUES (?, ?);', statistics.items())
@@ -0,0 +1,243 @@
+"""
+full_text.py
+
+Full-text search over the artist and song names, backed by SQLite FTS5.
+Each table has an external-content FTS5 index of its name column, built by
+load_data and kept up to date by triggers, and an fts5vocab table listing
+the words in it. Names are split into words ignoring case and accents, so
+"me" finds "Easy On Me" and "volvi" finds "Volví". Three kinds of match are
+supported:
+    - words, every word must appear in the name, the last one possibly as a prefix
+    - phrase, the words must appear together, in order
+    - fuzzy, every word must appear, allowing a few typos in each, one of them
+      possibly at the first letter
+Matches are ranked by relevance (bm25), or by a column of the table.
+"""
+
+import re
+import sqlite3 as sql
+import unicodedata
+
+# The FTS5 index of each table, and the column it indexes
+SEARCH_TABLES = {
+    "artists": ("artists_fts", "artist_names"),
+    "songs": ("songs_fts", "track_name")
+}
+
+# The orders results can be given in, as ORDER BY clauses; rank is the bm25 relevance
+FIND_ORDERS = {
+    "artists": {
+        "RELEVANCE": "rank",
+        "WEEKS": "artists.total_weeks DESC, rank",
+        "HITS": "artists.num_hit_songs DESC, rank"
+    },
+    "songs": {
+        "RELEVANCE": "rank",
+        "RANK": "songs.peak_rank, rank",
+        "WEEKS": "songs.weeks_on_chart DESC, rank"
+    }
+}
+
+# The kinds of match, each with the keyword that asks for it
+MATCH_KINDS = {
+    "FIND": "words",
+    "PHRASE": "phrase",
+    "FUZZY": "fuzzy"
+}
+
+# The statements creating each table's index, vocabulary and the triggers that keep them in sync
+SEARCH_INDEX_STATEMENTS = [
+    'CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({column}, content=\'{table}\', '
+    'content_rowid=\'rowid\', tokenize=\'unicode61 remove_diacritics 2\');',
+    'CREATE VIRTUAL TABLE IF NOT EXISTS {fts}_vocab USING fts5vocab({fts}, \'row\');',
+    'CREATE TRIGGER IF NOT EXISTS {fts}_insert AFTER INSERT ON {table} BEGIN '
+    'INSERT INTO {fts}(rowid, {column}) VALUES (new.rowid, new.{column}); END;',
+    'CREATE TRIGGER IF NOT EXISTS {fts}_delete AFTER DELETE ON {table} BEGIN '
+    'INSERT INTO {fts}({fts}, rowid, {column}) VALUES (\'delete\', old.rowid, old.{column}); END;',
+    'CREATE TRIGGER IF NOT EXISTS {fts}_update AFTER UPDATE OF {column} ON {table} BEGIN '
+    'INSERT INTO {fts}({fts}, rowid, {column}) VALUES (\'delete\', old.rowid, old.{column}); '
+    'INSERT INTO {fts}(rowid, {column}) VALUES (new.rowid, new.{column}); END;'
+]
+
+FIND_QUERY = 'SELECT {table}.{column} FROM {fts} JOIN {table} ON {table}.rowid = {fts}.rowid ' \
+             'WHERE {fts} MATCH ? ORDER BY {order} LIMIT ?;'
+VOCAB_QUERY = 'SELECT term FROM {fts}_vocab WHERE term >= ? AND term < ?;'
+# The first word from a point in the vocabulary on, which fts5vocab lists in order
+NEXT_TERM_QUERY = 'SELECT term FROM {fts}_vocab WHERE term >= ? LIMIT 1;'
+
+# Sorts after every character that can appear in a word, marking the end of a prefix range
+PREFIX_END = "\U0010ffff"
+
+WORD_PATTERN = re.compile(r"\w+")
+
+
+def create_search_indexes(cur, rebuild):
+    """
+    Creates the FTS5 index and vocabulary of each table, and the triggers that
+    keep the index up to date as rows change. A new index is filled from its
+    table; so is an existing one when rebuild is given.
+    :param cur: sqlite3 cursor for the database
+    :param rebuild: bool, whether to refill the indexes that already existed
+    :return: None
+    """
+    for table in SEARCH_TABLES:
+        fts, column = SEARCH_TABLES[table]
+        exists = cur.execute("SELECT 1 FROM sqlite_master WHERE name = ?;", (fts,)).fetchone() is not None
+        for statement in SEARCH_INDEX_STATEMENTS:
+            cur.execute(statement.format(fts=fts, table=table, column=column))
+        if rebuild or not exists:
+            cur.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild');")
+
+
+def find_query(table, order):
+    """
+    Builds the statement finding the names in a table that match an FTS5 query.
+    :param table: str, the table to search
+    :param order: str, a key of FIND_ORDERS for the table
+    :return: str, the SQL query, taking the match expression and a limit
+    """
+    fts, column = SEARCH_TABLES[table]
+    return FIND_QUERY.format(table=table, column=column, fts=fts, order=FIND_ORDERS[table][order])
+
+
+def words(text):
+    """
+    Splits text into words the way the FTS5 indexes do: in lower case, without accents.
+    :param text: str, the text to split
+    :return: list, the words
+    """
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(character for character in text if not unicodedata.combining(character))
+    return WORD_PATTERN.findall(text)
+
+
+def edit_distance(first, second, limit):
+    """
+    Counts the insertions, deletions, substitutions and swaps of neighbouring letters
+    turning one word into another, giving up once the count is sure to be over a limit.
+    :param first: str, a word
+    :param second: str, another word
+    :param limit: int, the largest distance of interest
+    :return: int, the distance, or limit + 1 if it is larger than the limit
+    """
+    if abs(len(first) - len(second)) > limit:
+        return limit + 1
+    before = None
+    previous = list(range(len(second) + 1))
+    for i in range(1, len(first) + 1):
+        current = [i] + [0] * len(second)
+        for j in range(1, len(second) + 1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1,
+                             previous[j - 1] + (first[i - 1] != second[j - 1]))
+            if i > 1 and j > 1 and first[i - 1] == second[j - 2] and first[i - 2] == second[j - 1]:
+                current[j] = min(current[j], before[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        before, previous = previous, current
+    return min(previous[-1], limit + 1)
+
+
+def typos_allowed(word):
+    """
+    Decides how many typos a fuzzy search forgives in a word.
+    :param word: str, a word of a fuzzy search
+    :return: int, the edit distance allowed for the word, more for longer words
+    """
+    if len(word) <= 2:
+        return 0
+    if len(word) <= 5:
+        return 1
+    return 2
+
+
+def first_letters(cur, fts):
+    """
+    Lists the letters the words in an index start with, seeking from each letter to
+    the next rather than reading the whole vocabulary.
+    :param cur: sqlite3 cursor for querying
+    :param fts: str, the FTS5 index whose vocabulary to look in
+    :return: list, the first letters, in order
+    """
+    letters = []
+    term = cur.execute(NEXT_TERM_QUERY.format(fts=fts), ("",)).fetchone()
+    while term is not None:
+        letters.append(term[0][0])
+        term = cur.execute(NEXT_TERM_QUERY.format(fts=fts), (term[0][0] + PREFIX_END,)).fetchone()
+    return letters
+
+
+def similar_terms(cur, table, word):
+    """
+    Finds the words in a table's index within the allowed edit distance of a word.
+    Words are only compared from a few ranges of the vocabulary rather than all of
+    it: those with the same first letter, and, when a typo is allowed, those that
+    would have it at the first letter. These start with the word's second letter
+    (an extra first letter was typed), with any letter and then the word's second
+    letter (the first letter is wrong, as "nasy" for "easy"), or with any letter
+    and then the word's first letter (the first letter was left out). A word whose
+    first two letters are both wrong is not found.
+    :param cur: sqlite3 cursor for querying
+    :param table: str, the table whose vocabulary to look in
+    :param word: str, the word, as returned by words
+    :return: list, the similar words
+    """
+    fts = SEARCH_TABLES[table][0]
+    limit = typos_allowed(word)
+    prefixes = [word[0]]
+    if limit > 0:
+        prefixes.append(word[1])
+        for letter in first_letters(cur, fts):
+            prefixes += [letter + word[1], letter + word[0]]
+    terms = set()
+    for prefix in dict.fromkeys(prefixes):
+        terms.update(term for (term,) in cur.execute(VOCAB_QUERY.format(fts=fts), (prefix, prefix + PREFIX_END)))
+    return sorted(term for term in terms if edit_distance(word, term, limit) <= limit)
+
+
+def match_expression(cur, table, text, kind):
+    """
+    Builds the FTS5 match expression for a search. Every word is quoted, so
+    nothing typed can be read as FTS5 query syntax.
+    :param cur: sqlite3 cursor for querying, to look up similar words for a fuzzy search
+    :param table: str, the table to search
+    :param text: str, the text to search for
+    :param kind: str, a value of MATCH_KINDS
+    :return: str, the match expression, or None if nothing can match
+    """
+    found = words(text)
+    if not found:
+        return None
+    if kind == "phrase":
+        return '"' + " ".join(found) + '"'
+    if kind == "words":
+        # The last word may be unfinished; names with it whole still rank higher
+        last = '"' + found[-1] + '"'
+        return " AND ".join(['"' + word + '"' for word in found[:-1]] + ["(" + last + " OR " + last + "*)"])
+    expression = []
+    for word in found:
+        terms = similar_terms(cur, table, word)
+        if not terms:
+            return None
+        expression.append("(" + " OR ".join('"' + term + '"' for term in terms) + ")")
+    return " AND ".join(expression)
+
+
+def find(cur, table, text, kind, order, limit):
+    """
+    Searches a table's names with its FTS5 index.
+    :param cur: sqlite3 cursor for querying
+    :param table: str, the table to search, either artists or songs
+    :param text: str, the text to search for
+    :param kind: str, a value of MATCH_KINDS
+    :param order: str, a key of FIND_ORDERS for the table
+    :param limit: int, the most names to return
+    :return: list, the matching names in order, or None if there was a problem
+             (such as a database loaded before the indexes existed)
+    """
+    try:
+        expression = match_expression(cur, table, text, kind)
+        if expression is None:
+            return []
+        return [row[0] for row in cur.execute(find_query(table, order), (expression, limit)).fetchall()]
+    except sql.DatabaseError:
+        return None
@@ -0,0 +1,168 @@
+"""
+history.py
+
+The history of the weekly charts. load_data holds one view of the charts:
+each song's peak rank and weeks on the charts. Here, each weekly chart csv is
+appended to the chart_history table as the next week instead, leaving the
+weeks before it untouched, so a song's rank can be followed from week to week.
+
+chart_history is partitioned by week: its primary key starts with the week,
+and being a WITHOUT ROWID table, its rows are stored in primary key order, so
+each week's chart is one contiguous range of the table. It is indexed on
+(week, track_name) and (week, artist_names) within a week, and on
+(track_name, week) for one song over a range of weeks. When a week is added,
+the week's totals of each individual artist are rolled up into artist_weeks,
+so following an artist, or finding the artists trending up, reads a few rows
+of rollups instead of scanning the history.
+
+A weekly chart csv has a header naming at least the rank, track_name and
+artist_names columns, as Spotify's weekly chart exports do; other columns are
+ignored. It is loaded with "file_name" LOAD WEEK n, which only accepts a week
+later than every week loaded so far.
+"""
+
+import sqlite3 as sql
+
+from db_handler import read_csv_chunks, split_credit
+
+HISTORY_TABLES = [
+    'CREATE TABLE IF NOT EXISTS chart_history(week INTEGER NOT NULL, rank INTEGER NOT NULL, '
+    'track_name TEXT NOT NULL, artist_names TEXT, PRIMARY KEY(week, rank)) WITHOUT ROWID;',
+    'CREATE INDEX IF NOT EXISTS idx_chart_history_week_track ON chart_history(week, track_name);',
+    'CREATE INDEX IF NOT EXISTS idx_chart_history_week_artist ON chart_history(week, artist_names);',
+    'CREATE INDEX IF NOT EXISTS idx_chart_history_track_week ON chart_history(track_name, week);',
+    'CREATE TABLE IF NOT EXISTS artist_weeks(week INTEGER NOT NULL, performer_name TEXT NOT NULL, '
+    'songs INTEGER, best_rank INTEGER, points INTEGER, PRIMARY KEY(week, performer_name)) WITHOUT ROWID;',
+    'CREATE INDEX IF NOT EXISTS idx_artist_weeks_performer_week ON artist_weeks(performer_name, week);'
+]
+
+# The columns a weekly chart csv must have
+CHART_COLUMNS = ("rank", "track_name", "artist_names")
+
+# A song at rank r earns an artist CHART_POINTS + 1 - r points for the week,
+# and at least 1; an artist trends up when their points grow
+CHART_POINTS = 200
+
+LATEST_WEEK_QUERY = 'SELECT MAX(week) FROM chart_history;'
+PREVIOUS_WEEK_QUERY = 'SELECT MAX(week) FROM chart_history WHERE week < ?;'
+SONG_RANKS_QUERY = 'SELECT week, MIN(rank) FROM chart_history WHERE track_name = ? AND week BETWEEN ? AND ? ' \
+                   'GROUP BY week ORDER BY week;'
+ARTIST_RANKS_QUERY = 'SELECT week, best_rank, songs FROM artist_weeks WHERE performer_name = ? ' \
+                     'AND week BETWEEN ? AND ? ORDER BY week;'
+TRENDING_QUERY = 'SELECT later.performer_name, later.points - COALESCE(earlier.points, 0) AS gain, ' \
+                 'later.points, later.best_rank FROM artist_weeks AS later LEFT JOIN artist_weeks AS earlier ' \
+                 'ON earlier.week = ? AND earlier.performer_name = later.performer_name ' \
+                 'WHERE later.week = ? AND gain > 0 ORDER BY gain DESC, later.best_rank LIMIT ?;'
+
+
+def load_week(database_name, file_name, week):
+    """
+    Appends a weekly chart csv to the history as the given week, and rolls up
+    the week's totals of each individual artist, in one transaction.
+    :param database_name: str, the path of the database, which must already be loaded
+    :param file_name: str, the weekly chart csv
+    :param week: int, the week of the chart, later than every week already loaded
+    :return: int, the number of songs on the week's chart
+    """
+    conx = sql.connect(database_name)
+    curr = conx.cursor()
+    try:
+        for q in HISTORY_TABLES:
+            curr.execute(q)
+        curr.execute("BEGIN;")
+        latest = curr.execute(LATEST_WEEK_QUERY).fetchone()[0]
+        if latest is not None and week <= latest:
+            raise ValueError(f"Week {week} is not after week {latest}, the latest loaded; "
+                             "the history is only added to.")
+        rows = []
+        for header, chunk in read_csv_chunks(file_name):
+            if any(column not in header for column in CHART_COLUMNS):
+                raise ValueError(file_name + " needs the columns " + ", ".join(CHART_COLUMNS) + ".")
+            positions = [header.index(column) for column in CHART_COLUMNS]
+            try:
+                rows += [(week, int(row[positions[0]]), row[positions[1]], row[positions[2]]) for row in chunk]
+            except (TypeError, ValueError):
+                raise ValueError(file_name + " has a rank that is not a number.")
+        if not rows:
+            raise ValueError(file_name + " holds no chart rows.")
+        curr.executemany('INSERT INTO chart_history VALUES (?, ?, ?, ?);', rows)
+        curr.executemany('INSERT INTO artist_weeks VALUES (?, ?, ?, ?, ?);', roll_up(rows))
+        conx.commit()
+    except sql.IntegrityError:
+        raise ValueError(file_name + " has a song without a name, or two songs at the same rank.")
+    finally:
+        # Closing without committing rolls back a failed load
+        curr.close()
+        conx.close()
+    return len(rows)
+
+
+def roll_up(rows):
+    """
+    Totals one week's chart for each individual artist on it.
+    :param rows: list, the (week, rank, track_name, artist_names) rows of the week
+    :return: list, a (week, performer_name, songs, best_rank, points) row for each artist
+    """
+    totals = {}
+    for week, rank, track_name, artist_names in rows:
+        for performer in split_credit(artist_names or ""):
+            songs, best_rank, points = totals.get(performer, (0, rank, 0))
+            totals[performer] = (songs + 1, min(best_rank, rank), points + max(CHART_POINTS + 1 - rank, 1))
+    return [(rows[0][0], performer) + totals[performer] for performer in totals]
+
+
+def song_ranks(cur, searchable, first, last):
+    """
+    Follows a song's rank through a range of weeks, with an indexed range scan of its history.
+    :param cur: sqlite3 cursor for querying
+    :param searchable: str, the song name
+    :param first: int, the first week of the range
+    :param last: int, the last week of the range
+    :return: A dictionary of week/rank for the weeks the song was on the chart, in
+             week order, or None if there was a problem (such as no weeks loaded)
+    """
+    try:
+        return dict(cur.execute(SONG_RANKS_QUERY, (searchable, first, last)).fetchall())
+    except sql.DatabaseError:
+        return None
+
+
+def artist_ranks(cur, searchable, first, last):
+    """
+    Follows an individual artist's best rank through a range of weeks, from the weekly rollups.
+    :param cur: sqlite3 cursor for querying
+    :param searchable: str, the artist name
+    :param first: int, the first week of the range
+    :param last: int, the last week of the range
+    :return: A dictionary of week/dictionary of the artist's best_rank and songs that
+             week, for the weeks they were on the chart, in week order, or None on an error
+    """
+    try:
+        retrieved = cur.execute(ARTIST_RANKS_QUERY, (searchable, first, last)).fetchall()
+    except sql.DatabaseError:
+        return None
+    return {row[0]: {"best_rank": row[1], "songs": row[2]} for row in retrieved}
+
+
+def trending_artists(cur, limit, first=None, last=None):
+    """
+    Finds the individual artists whose chart points grew the most from one week
+    to another, comparing the two weeks' rollups.
+    :param cur: sqlite3 cursor for querying
+    :param limit: int, the most artists to return
+    :param first: int, the week to compare from, or None for the week before last
+    :param last: int, the week to compare to, or None for the latest week loaded
+    :return: A dictionary of artist name/dictionary of their gain, points and best_rank
+             in the later week, the largest gain first, or None on an error
+    """
+    try:
+        if last is None:
+            last = cur.execute(LATEST_WEEK_QUERY).fetchone()[0]
+            first = cur.execute(PREVIOUS_WEEK_QUERY, (last,)).fetchone()[0] if last is not None else None
+            if first is None:
+                # Fewer than two weeks have been loaded
+                return {}
+        retrieved = cur.execute(TRENDING_QUERY, (first, last, limit)).fetchall()
+    except sql.DatabaseError:
+        return None
+    return {row[0]: {"gain": row[1], "points": row[2], "best_rank": row[3]} for row in retrieved}
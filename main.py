@@ -1,8 +1,44 @@
-from parse import parse_input
-from db_handler import DBConnection
+import argparse
+import sys
 
+# The query modules are imported by the mode that needs them, so each mode only
+# pays for loading its own
 
-if __name__ == "__main__":
+# The socket the daemon listens on and client.py connects to
+DAEMON_SOCKET = "music.sock"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Query the top charts of 2022.")
+    parser.add_argument("--batch", metavar="FILE",
+                        help="run the commands in FILE (- for standard input) instead of prompting for them")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="number of processes to split a batch of commands across")
+    parser.add_argument("--serve", action="store_true",
+                        help="answer commands from clients over a TCP port or Unix socket")
+    parser.add_argument("--host", default="127.0.0.1", help="address for --serve to listen on")
+    parser.add_argument("--port", type=int, default=8205, help="TCP port for --serve to listen on")
+    parser.add_argument("--socket", metavar="PATH", help="Unix socket for --serve to listen on instead of a port")
+    parser.add_argument("--daemon", action="store_true",
+                        help="serve on the Unix socket " + DAEMON_SOCKET + " with warm connections, for client.py")
+    parser.add_argument("--pool", type=int, default=4,
+                        help="number of database connections --serve runs commands on")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="number of processes --serve runs commands on, each with its own connection, "
+                             "instead of threads")
+    parser.add_argument("--snapshot", metavar="PATH",
+                        help="answer commands from the snapshot at PATH instead of the database")
+    parser.add_argument("--export-snapshot", metavar="PATH",
+                        help="write a snapshot of the loaded database to PATH, then exit")
+    parser.add_argument("--profile", action="store_true",
+                        help="time every command from the start, as if PROFILE ON was entered")
+    return parser.parse_args()
+
+
+def run_interactive(profile, snapshot):
+    from parse import parse_input
+    from db_handler import DBConnection
+    from profiler import CommandProfiler
     print("--------------------------------------------------")
     print("Welcome to the Query Interface!")
     print("--------------------------------------------------")
@@ -10,12 +46,66 @@ if __name__ == "__main__":
     print("--------------------------------------------------")
     print("Then type \"HELP\" to view commands!")
     print("--------------------------------------------------")
-    conx = DBConnection()
+    if snapshot is None:
+        conx = DBConnection()
+    else:
+        from snapshot import SnapshotConnection
+        conx = SnapshotConnection(snapshot)
+    if profile:
+        conx.set_profiler(CommandProfiler())
     # Continue taking user input until they decide to exit
     user_command = input("Enter a command: ")
     if user_command.upper() != "EXIT":
         while user_command.upper() != "EXIT":
             parse_input(conx, user_command)
             user_command = input("Enter a command: ")
-        # Close the database connection before exiting
+    # Close the database connection before exiting
+    if conx.open:
         conx.close_connection()
+
+
+def run_batch_file(file_name, jobs, profile, source):
+    from batch import read_commands, run_batch
+    if file_name == "-":
+        commands = read_commands(sys.stdin)
+    else:
+        with open(file_name, encoding="utf-8") as command_file:
+            commands = read_commands(command_file)
+    sys.stdout.write(run_batch(commands, jobs=jobs, profile=profile, **source))
+
+
+def export(snapshot_name):
+    import os
+    from db_handler import DATABASE_NAME
+    from snapshot import export_snapshot
+    if not os.path.exists(DATABASE_NAME):
+        sys.exit("You haven't loaded the data yet. Please execute LOAD DATA.")
+    size = export_snapshot(DATABASE_NAME, snapshot_name)
+    print(f"Wrote a snapshot of {DATABASE_NAME} to {snapshot_name} ({size} bytes).")
+
+
+def check_snapshot(snapshot_name):
+    from snapshot import Snapshot
+    try:
+        Snapshot(snapshot_name).close()
+    except (OSError, ValueError) as error:
+        sys.exit("Could not open the snapshot: " + str(error))
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    # The commands are answered from the database unless a snapshot is given
+    source = {}
+    if args.snapshot is not None:
+        check_snapshot(args.snapshot)
+        source = {"database_name": args.snapshot, "snapshot": True}
+    if args.export_snapshot is not None:
+        export(args.export_snapshot)
+    elif args.serve or args.daemon:
+        from server import run_server
+        run_server(host=args.host, port=args.port, socket_path=DAEMON_SOCKET if args.daemon else args.socket,
+                   pool_size=args.pool, profile=args.profile, warm=args.daemon, processes=args.workers, **source)
+    elif args.batch is not None:
+        run_batch_file(args.batch, args.jobs, args.profile, source)
+    else:
+        run_interactive(args.profile, args.snapshot)
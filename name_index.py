@@ -0,0 +1,178 @@
+"""
+name_index.py
+
+An in-memory index of the artist or song names in one table, so the SEARCH
+commands can be answered without querying the database. Names are kept in
+sorted arrays of keys folded the way SQLite's NOCASE collation folds them, and
+looked up by binary search, so a search finds the same names, in the same
+order, as the database's LIKE "prefix%" search. Artist credits like
+"24kGoldn, iann dior" are also split into their comma-separated parts so that
+featured artists can be found by their own name, as the performers table finds
+them for the database's searches.
+"""
+
+import bisect
+import itertools
+
+# Sorts after every character that can appear in a name, marking the end of a prefix range
+PREFIX_END = "\U0010ffff"
+
+# Lowers only the ASCII letters, as SQLite's LIKE and NOCASE do
+ASCII_LOWER = str.maketrans("ABCDEFGHIJKLMNOPQRSTUVWXYZ", "abcdefghijklmnopqrstuvwxyz")
+
+
+def nocase(text):
+    """
+    Folds text the way SQLite's NOCASE collation does, lowering only ASCII letters.
+    :param text: str, a name or search text
+    :return: str, the folded text
+    """
+    return text.translate(ASCII_LOWER)
+
+
+def credit_tokens(name):
+    """
+    Splits a name into its comma-separated parts.
+    :param name: str, an artist or song name
+    :return: A list of the stripped, folded parts of the name
+    """
+    return [nocase(token.strip()) for token in name.split(",")]
+
+
+class NameIndex:
+    """
+    A class for looking up the names from one table by prefix or substring,
+    ignoring case.
+    Attributes:
+        - names, a list of every distinct name in the order it was first added;
+                 removed names are left as None so the positions of the others
+                 do not change
+        - positions, a dictionary of name/position in names
+        - counts, a dictionary of name/number of rows with the name
+        - keys, a sorted list of (folded name, position) pairs
+        - credits, a boolean value indicating if the names are artist credits
+        - tokens, a sorted list of (folded credit, position) pairs for every
+                  comma-separated part of a name after the first, when the
+                  names are credits
+    Methods:
+        - add, adds a row's name to the index
+        - remove, removes a row's name from the index, dropping the name once
+                  no row has it
+        - credit_tokens, splits a name into the tokens its featured artists are found by
+        - search, finds the names that start with some text, followed by
+                  the names with a later credit starting with it
+        - iter_search, finds the same names as search, one at a time
+        - search_page, finds one page of the names search finds
+        - substring, finds the names that contain some text
+    """
+    def __init__(self, names=(), credits=False):
+        self.credits = credits
+        self.names = []
+        self.positions = {}
+        self.counts = {}
+        self.keys = []
+        self.tokens = []
+        for name in names:
+            if name not in self.positions:
+                self.positions[name] = len(self.names)
+                self.names.append(name)
+            self.counts[name] = self.counts.get(name, 0) + 1
+        # Sort once when building, rather than inserting each name in order
+        for position in range(len(self.names)):
+            self.keys.append((nocase(self.names[position]), position))
+            for token in self.credit_tokens(self.names[position]):
+                self.tokens.append((token, position))
+        self.keys.sort()
+        self.tokens.sort()
+
+    def __len__(self):
+        return len(self.positions)
+
+    def add(self, name):
+        self.counts[name] = self.counts.get(name, 0) + 1
+        if name in self.positions:
+            return
+        position = len(self.names)
+        self.positions[name] = position
+        self.names.append(name)
+        bisect.insort(self.keys, (nocase(name), position))
+        for token in self.credit_tokens(name):
+            bisect.insort(self.tokens, (token, position))
+
+    def remove(self, name):
+        if name not in self.positions:
+            return
+        self.counts[name] -= 1
+        if self.counts[name] > 0:
+            # Another row still has the name
+            return
+        del self.counts[name]
+        position = self.positions.pop(name)
+        self.names[position] = None
+        self.keys.pop(bisect.bisect_left(self.keys, (nocase(name), position)))
+        for token in self.credit_tokens(name):
+            self.tokens.pop(bisect.bisect_left(self.tokens, (token, position)))
+
+    def credit_tokens(self, name):
+        # Only artist credits have featured artists to find
+        return credit_tokens(name)[1:] if self.credits else []
+
+    def search(self, text):
+        """
+        Finds the names starting with the given text, then, for artist credits, the
+        names with a comma-separated part after the first starting with it. Each group
+        is in NOCASE order, ties going to the name added first, and a name is returned
+        once for each row that has it, as the database's search returns them.
+        :param text: str, the text to search for
+        :return: A list of the matching names
+        """
+        return list(self.iter_search(text))
+
+    def iter_search(self, text):
+        """
+        Finds the same names as search, without building a list of them, so the
+        names can be printed as they are found.
+        :param text: str, the text to search for
+        :return: A generator of the matching names
+        """
+        starts = _prefix_range(self.keys, nocase(text))
+        featured = []
+        if text != "":
+            matched = set(starts)
+            featured = sorted(set(_prefix_range(self.tokens, nocase(text))) - matched,
+                              key=lambda position: (nocase(self.names[position]), position))
+        names = (self.names[position] for position in itertools.chain(starts, featured))
+        return (name for name in names for _ in range(self.counts[name]))
+
+    def search_page(self, text, limit, offset):
+        """
+        Finds one page of the names search finds, skipping the names before it
+        rather than copying them.
+        :param text: str, the text to search for
+        :param limit: int, the most names to return
+        :param offset: int, the number of names to skip
+        :return: A list of the matching names on the page
+        """
+        return list(itertools.islice(self.iter_search(text), offset, offset + limit))
+
+    def substring(self, text):
+        """
+        Finds the names containing the given text anywhere, in the order
+        the names were added.
+        :param text: str, the text to search for
+        :return: A list of the matching names
+        """
+        text = text.lower()
+        return sorted((name for name in self.positions if text in name.lower()), key=self.positions.get)
+
+
+def _prefix_range(pairs, text):
+    """
+    Uses binary search to find the pairs whose key starts with the given text.
+    :param pairs: list, a sorted list of (key, position) pairs
+    :param text: str, the folded prefix
+    :return: A list of the positions of the matching pairs
+    """
+    start = bisect.bisect_left(pairs, (text,))
+    end = bisect.bisect_left(pairs, (text + PREFIX_END,))
+    return [position for key, position in pairs[start:end]]
@@ -9,111 +9,617 @@ from our queries to present to the user in a user-friendly way.
 """
 
 from db_handler import *
+from commands import CommandParser, InvalidInput, MANY, NUMBER
+from full_text import find, FIND_ORDERS, MATCH_KINDS
+from analytics import ARTIST_ORDERS, SONG_ORDERS
+from history import load_week, song_ranks, artist_ranks, trending_artists
+from profiler import CommandProfiler, STAGES
 import os
 
 
-class InvalidInput(Exception):
-    pass
+# The meta data commands, each with the data keyword it is answered by
+DATA_COMMANDS = {
+    "TOTAL ARTISTS": "artists",
+    "TOTAL SONGS": "songs",
+    "AVG DURATION": "duration",
+    "MEDIAN DURATION": "median",
+    "SHORTEST DURATION": "shortest",
+    "LONGEST DURATION": "longest"
+}
 
 
-def parse_input(conx, user_input):
+def parse_input(conx, user_input, out=None):
     """
-        Takes user input and parses it to decipher meaning based on the first 3 words.
-        Based on the potential inputs, it parses it into specific sections and provides
-        thorough input validation. Once user input is understood, calls specific database
-        queries to get the valid information back from the database. Calls various
-        display functions to then format output for the user.
+        Runs a command given by the user, recording its stages in the connection's
+        profiler when profiling is on.
         :param conx: for the database
         :param user_input: str, user input
+        :param out: the stream to print to, standard output if None
     """
-    user_input = user_input.strip()
-    if user_input.upper() == 'LOAD DATA':
-        load_data()
-        print("Successfully loaded data.")
-    elif os.path.exists("music.db"):
+    profiler = conx.profiler
+    if profiler is None:
+        run_input(conx, user_input, out)
+    else:
+        profiler.begin(user_input.strip())
+        run_input(conx, user_input, out)
+        profiler.end(command_kind(user_input), conx.con if conx.open else None)
+
+
+def run_input(conx, user_input, out=None):
+    """
+        Compiles the user input into a command, checking it against the dispatch
+        table, then runs the command's handler. Compiled commands are remembered,
+        so repeating a command does not parse it again. Every command but LOAD DATA
+        needs the database to have been loaded, and opens the connection to it.
+        :param conx: for the database
+        :param user_input: str, user input
+        :param out: the stream to print to, standard output if None
+    """
+    try:
+        command = PARSER.compile(user_input.strip())
+    except InvalidInput as error:
+        command = None
+        invalid = error
+    if command is None or command.needs_database:
+        if not os.path.exists(conx.database_name):
+            print("You haven't loaded the data yet. Please execute LOAD DATA.", file=out)
+            return
         if conx.open is False:
             conx.open_connection()
-        if user_input.upper() == 'HELP':
-            display_help()
-        elif user_input.upper() == 'TOTAL ARTISTS':
-            display_data(data(conx.cur, "artists"))
-        elif user_input.upper() == 'TOTAL SONGS':
-            display_data(data(conx.cur, "songs"))
-        elif user_input.upper() == 'AVG DURATION':
-            display_data(data(conx.cur, "duration"))
+        # Once per command, so the command's lookups do not each ask whether the data changed
+        conx.check_data_version()
+    try:
+        if command is None:
+            raise invalid
+        command.handler(conx, command, out)
+    except InvalidInput as error:
+        print(" Invalid Input: " + str(error) + " Please try again.", file=out)
+
+
+def run_load(conx, command, out=None):
+    """
+        LOAD DATA: loads the csv files into the database, then brings the
+        connection's name indexes and result cache up to date.
+    """
+    if conx.read_only:
+        print("LOAD DATA is not available on a read-only connection, such as a snapshot.", file=out)
+        return
+    try:
+        loaded = load_data(conx.database_name)
+    except (OSError, ValueError) as error:
+        # A csv file that is missing or has a column the table does not, which
+        # leaves the database as it was
+        raise InvalidInput(str(error))
+    if loaded["rebuilt"]:
+        # The database was created anew, so reconnect to the new file
+        if conx.open:
+            conx.close_connection()
+        conx.reset_name_indexes()
+    elif conx.open:
+        # Keep the name indexes, updated in place, but not the cached results or columns
+        conx.cache.clear()
+        conx.columns = None
+        conx.update_name_indexes(loaded["added"], loaded["removed"])
+        conx.sync_data_version()
+    if loaded["rows"] == 0:
+        print("Successfully loaded data.", file=out)
+    else:
+        print(f"Successfully loaded data: {loaded['rows']} rows in {loaded['seconds']:.2f}s "
+              f"({loaded['rows'] / max(loaded['seconds'], 1e-9):.0f} rows/s).", file=out)
+
+
+def run_load_week(conx, command, out=None):
+    """
+        "file_name" LOAD WEEK n: appends a weekly chart csv to the chart history as week n.
+    """
+    if conx.read_only:
+        print("LOAD WEEK is not available on a read-only connection, such as a snapshot.", file=out)
+        return
+    week = command.numbers[0]
+    if week < 1:
+        raise InvalidInput("Weeks are numbered from 1.")
+    try:
+        songs = load_week(conx.database_name, command.names[0], week)
+    except (OSError, ValueError) as error:
+        raise InvalidInput(str(error))
+    print(f"Successfully loaded week {week}: {songs} songs.", file=out)
+
+
+def run_help(conx, command, out=None):
+    """
+        HELP: lists the commands.
+    """
+    display_help(out)
+
+
+def run_data(conx, command, out=None):
+    """
+        The meta data commands, such as TOTAL SONGS.
+    """
+    display_data(conx.cached(command.keywords, data, conx.cur, DATA_COMMANDS[command.kind()]), out)
+
+
+def run_distribution(conx, command, out=None):
+    """
+        RANK DISTRIBUTION: how many songs peaked in each band of ranks.
+    """
+    display_distribution(conx.cached(("RANK DISTRIBUTION",), rank_distribution, conx.cur), out)
+
+
+def run_top_artists(conx, command, out=None):
+    """
+        TOP n ARTISTS: the n individual artists with the most weeks on the charts, over
+        every credit they appear on, read from the rollups kept by load_data.
+    """
+    limit = command.numbers[0]
+    if limit == 0:
+        raise InvalidInput("Command not recognised.")
+    display_top(conx.cached(("TOP ARTISTS", limit), top_artists, conx.cur, limit), out)
+
+
+def run_song_ranks(conx, command, out=None):
+    """
+        "song_name" SONG RANKS a TO b: the song's rank in each week from a to b.
+    """
+    name = command.names[0]
+    first, last = week_range(command)
+    display_ranks(name, conx.cached(("SONG RANKS", name, first, last), song_ranks, conx.cur, name, first, last),
+                  out)
+
+
+def run_artist_ranks(conx, command, out=None):
+    """
+        "artist_name" ARTIST RANKS a TO b: the individual artist's best rank in each week from a to b.
+    """
+    name = command.names[0]
+    first, last = week_range(command)
+    display_ranks(name, conx.cached(("ARTIST RANKS", name, first, last), artist_ranks, conx.cur, name, first,
+                                    last), out)
+
+
+def run_trending(conx, command, out=None):
+    """
+        TRENDING n ARTISTS: the n individual artists whose chart points grew the most from
+        the week before last to the latest week, or with WEEKS a TO b, from week a to week b.
+    """
+    limit = command.numbers[0]
+    if limit == 0:
+        raise InvalidInput("Command not recognised.")
+    weeks = week_range(command) if len(command.numbers) > 1 else (None, None)
+    display_trending(conx.cached(("TRENDING ARTISTS", limit) + weeks, trending_artists, conx.cur, limit, *weeks),
+                     out)
+
+
+def run_top_artists_by(conx, command, out=None):
+    """
+        TOP n ARTISTS BY SONGS, WEEKS, RANK or DURATION: the n individual artists with
+        the most songs, weeks, best peak rank or longest songs, from the song columns.
+    """
+    limit = command.numbers[0]
+    order = command.keywords[-1]
+    display_top(conx.cached(("TOP ARTISTS BY", limit, order), analyze, conx, "top_artists", limit, order), out)
+
+
+def run_top_songs(conx, command, out=None):
+    """
+        TOP n SONGS BY WEEKS, RANK or DURATION: the n songs with the most weeks, best
+        peak rank or longest duration, from the song columns.
+    """
+    limit = command.numbers[0]
+    order = command.keywords[-1]
+    display_top(conx.cached(("TOP SONGS BY", limit, order), analyze, conx, "top_songs", limit, order), out)
+
+
+def run_duration_histogram(conx, command, out=None):
+    """
+        DURATION HISTOGRAM: how many songs last each band of durations.
+    """
+    display_histogram(conx.cached(("DURATION HISTOGRAM",), analyze, conx, "duration_histogram"), out)
+
+
+def run_correlation(conx, command, out=None):
+    """
+        RANK WEEKS CORRELATION: how peak rank and weeks on the charts go together.
+    """
+    display_correlation(conx.cached(("RANK WEEKS CORRELATION",), analyze, conx, "rank_weeks_correlation"), out)
+
+
+def run_query_plans(conx, command, out=None):
+    """
+        QUERY PLANS: how the database answers each kind of lookup.
+    """
+    display_plans(query_plans(conx.cur), out)
+
+
+def run_cache_stats(conx, command, out=None):
+    """
+        CACHE STATS: the hits, misses and evictions of the result cache.
+    """
+    display({"Result cache": conx.cache.stats()}, out)
+
+
+def run_profile_on(conx, command, out=None):
+    """
+        PROFILE ON: starts timing every command.
+    """
+    if conx.profiler is None:
+        conx.set_profiler(CommandProfiler())
+    print("Profiling is on. Slow commands are logged to " + conx.profiler.slow_log + ".", file=out)
+
+
+def run_profile_off(conx, command, out=None):
+    """
+        PROFILE OFF: stops timing commands.
+    """
+    conx.set_profiler(None)
+    print("Profiling is off.", file=out)
+
+
+def run_stats(conx, command, out=None):
+    """
+        STATS: the profiler's timings for each kind of command.
+    """
+    display_stats(conx.profiler, out)
+
+
+def run_stats_json(conx, command, out=None):
+    """
+        STATS JSON: everything the profiler has recorded.
+    """
+    print("{}" if conx.profiler is None else conx.profiler.dump(), file=out)
+
+
+def run_lookup(conx, command, out=None):
+    """
+        The ARTIST and SONG commands that select columns of a name, such as
+        "Adele" ARTIST HITS. The columns are given by LOOKUP_COLUMNS. Given a list
+        of names, they are all looked up in one query. An artist's hits and weeks
+        count every song they are credited on, alone or with others.
+    """
+    table = ENTITY_TABLES[command.keywords[0]]
+    columns = LOOKUP_COLUMNS[command.keywords]
+    names = command.arguments()
+    if table == "artists":
+        result = conx.cached(("ARTIST TOTALS", names) + tuple(columns), artist_totals, conx.cur, names, columns)
+    elif len(names) == 1 and command.name_file is None:
+        display(lookup(conx, names[0], table, columns), out)
+        return
+    else:
+        result = conx.cached(("SELECT", table, names) + tuple(columns), select_many, conx.cur, names, table,
+                             columns)
+    if len(names) == 1 and command.name_file is None:
+        display(found(result, names[0], table), out)
+    else:
+        display_many(result, out)
+        display_missing(result, names, table, out)
+
+
+def run_songlist(conx, command, out=None):
+    """
+        "artist_name" ARTIST SONGLIST: every song the artist is credited on, or
+        the songs of each artist in a list, in one query. A single artist's songs
+        are streamed from the database as they are printed, instead of being held
+        in the result cache.
+    """
+    names = command.arguments()
+    if len(names) == 1 and command.name_file is None:
+        name = names[0]
+        display_songlist(found(iter_songlist(conx.cur, name), name, "artists"), out)
+    else:
+        result = conx.cached(("ARTIST", "SONGLIST", names), artist_songlists, conx.cur, names)
+        display_songlist(result, out)
+        display_missing(result, names, "artists", out)
+
+
+def run_author(conx, command, out=None):
+    """
+        "song_name" SONG AUTHOR: the song's artist, or the artist of each song in
+        a list, in one query.
+    """
+    names = command.arguments()
+    if len(names) == 1 and command.name_file is None:
+        name = names[0]
+        display_author(name, found(conx.cached(("SONG", "AUTHOR", name), join_author, conx.cur, name),
+                                   name, "songs"), out)
+    else:
+        result = conx.cached(("SONG", "AUTHOR", names), join_author_many, conx.cur, names)
+        if result is None:
+            display_author(None, None, out)
         else:
-            try:
-                if user_input.count("\"") != 2:
-                    raise InvalidInput("Command not recognised.")
-                # Find the name between the given quotation marks (to include names with spaces)
-                name = user_input[(user_input.find('"') + 1):user_input.rfind('"')]
-                # Find the keywords given after the name
-                user_input = user_input[(user_input.rfind('"') + 1):].upper().strip().split()
-                if len(user_input) < 2:
-                    raise InvalidInput("Invalid number of commands.")
-                match user_input[0]:
-                    case 'ARTIST':
-                        table = "artists"
-                        if user_input[1] != 'SEARCH' and select(conx.cur, name, table, ["total_weeks"]) == {}:
-                            raise InvalidInput("\"" + str(name) + "\" was not found in the " + table + " database.")
-                        match user_input[1]:
-                            case 'SONGLIST':
-                                display_songlist(join_songlist(conx.cur, name))
-                            case 'HITS':
-                                display(select(conx.cur, name, table, ["num_hit_songs"]))
-                            case 'WEEKS':
-                                display(select(conx.cur, name, table, ["total_weeks"]))
-                            case 'INFO':
-                                display(select(conx.cur, name, table, ["num_hit_songs", "total_weeks"]))
-                            case 'SEARCH':
-                                if name == "" or name.count("%") != 0:
-                                    display_search(search(conx.cur, table, name))
-                                else:
-                                    display_search(search(conx.cur, table, name) + search(conx.cur, table, "%, " + name))
-                            case _:
-                                raise InvalidInput(user_input[1])
-                    case 'SONG':
-                        table = "songs"
-                        if user_input[1] != 'SEARCH' and select(conx.cur, name, table, ["weeks_on_chart"]) == {}:
-                            raise InvalidInput("\"" + str(name) + "\" was not found in the " + table + " database.")
-                        match user_input[1]:
-                            case 'AUTHOR':
-                                display_author(name, join_author(conx.cur, name))
-                            case 'DURATION':
-                                display(select(conx.cur, name, table, ["duration_ms"]))
-                            case 'RANK':
-                                display(select(conx.cur, name, table, ["peak_rank"]))
-                            case 'WEEK':
-                                display(select(conx.cur, name, table, ["weeks_on_chart"]))
-                            case 'INFO':
-                                display(select(conx.cur, name, table, ["duration_ms", "peak_rank", "weeks_on_chart"]))
-                            case 'SEARCH':
-                                if name == "" or name.count("%") != 0:
-                                    display_search(search(conx.cur, table, name))
-                                else:
-                                    display_search(search(conx.cur, table, name) + search(conx.cur, table, "%, " + name))
-                            case _:
-                                raise InvalidInput(user_input[1])
-                    case _:
-                        raise InvalidInput(user_input[0])
-            except InvalidInput as error:
-                print(" Invalid Input: " + str(error) + " Please try again.")
-    else:
-        print("You haven't loaded the data yet. Please execute LOAD DATA.")
-
-
-def display(dict_input):
+            for song in result:
+                display_author(song, result[song], out)
+        display_missing(result, names, "songs", out)
+
+
+def run_find(conx, command, out=None):
+    """
+        The full-text searches, "text" ARTIST/SONG FIND, PHRASE or FUZZY, optionally
+        followed by BY and the order: RELEVANCE (the default), RANK, WEEKS or HITS.
+    """
+    table = ENTITY_TABLES[command.keywords[0]]
+    kind = MATCH_KINDS[command.keywords[1]]
+    order = command.keywords[3] if len(command.keywords) > 2 else "RELEVANCE"
+    name = command.names[0]
+    display_search(conx.cached((table, kind, name, order), find, conx.cur, table, name, kind, order, PAGE_SIZE), out)
+
+
+def run_songlist_page(conx, command, out=None):
+    """
+        "artist_name" ARTIST SONGLIST PAGE n: the nth page of PAGE_SIZE of the artist's songs.
+    """
+    name = command.names[0]
+    page = page_number(command)
+    display_songlist(found(conx.cached(("ARTIST", "SONGLIST", name, "PAGE", page), songlist_page, conx, name, page),
+                           name, "artists"), out)
+
+
+def run_search(conx, command, out=None):
+    """
+        The SEARCH commands: names starting with the given text. The names are
+        streamed from the name index, or from the database for searches with a %
+        or _ wildcard, as they are printed, instead of being held in the result cache.
+    """
+    table = ENTITY_TABLES[command.keywords[0]]
+    name = command.names[0]
+    if has_wildcard(name):
+        display_search(iter_search(conx.cur, table, name), out)
+    else:
+        display_search(conx.name_index(table).iter_search(name), out)
+
+
+def run_search_page(conx, command, out=None):
+    """
+        "search_string" ARTIST/SONG SEARCH PAGE n: the nth page of PAGE_SIZE of a search.
+    """
+    table = ENTITY_TABLES[command.keywords[0]]
+    name = command.names[0]
+    page = page_number(command)
+    display_search(conx.cached((table, "SEARCH", name, "PAGE", page), search_page, conx, table, name, page), out)
+
+
+def run_contains(conx, command, out=None):
+    """
+        The CONTAINS commands: names with the given text anywhere in them, all of
+        them or the nth page of PAGE_SIZE given PAGE n.
+    """
+    table = ENTITY_TABLES[command.keywords[0]]
+    name = command.names[0]
+    names = conx.cached((table, "CONTAINS", name), name_contains, conx, table, name)
+    if command.numbers and names is not None:
+        page = page_number(command)
+        names = names[(page - 1) * PAGE_SIZE:page * PAGE_SIZE]
+    display_search(names, out)
+
+
+# The table each kind of name is looked up in
+ENTITY_TABLES = {
+    "ARTIST": "artists",
+    "SONG": "songs"
+}
+
+# The columns selected by each lookup command
+LOOKUP_COLUMNS = {
+    ("ARTIST", "HITS"): ["num_hit_songs"],
+    ("ARTIST", "WEEKS"): ["total_weeks"],
+    ("ARTIST", "INFO"): ["num_hit_songs", "total_weeks"],
+    ("SONG", "DURATION"): ["duration_ms"],
+    ("SONG", "RANK"): ["peak_rank"],
+    ("SONG", "WEEK"): ["weeks_on_chart"],
+    ("SONG", "INFO"): ["duration_ms", "peak_rank", "weeks_on_chart"]
+}
+
+# The dispatch table: the keywords of each command, with NUMBER for a number, mapped to
+# its handler, the number of quoted names it takes and whether it needs the database
+COMMANDS = {
+    ("LOAD", "DATA"): (run_load, 0, False),
+    ("HELP",): (run_help, 0, True),
+    ("RANK", "DISTRIBUTION"): (run_distribution, 0, True),
+    ("TOP", NUMBER, "ARTISTS"): (run_top_artists, 0, True),
+    ("QUERY", "PLANS"): (run_query_plans, 0, True),
+    ("CACHE", "STATS"): (run_cache_stats, 0, True),
+    ("PROFILE", "ON"): (run_profile_on, 0, True),
+    ("PROFILE", "OFF"): (run_profile_off, 0, True),
+    ("STATS",): (run_stats, 0, True),
+    ("STATS", "JSON"): (run_stats_json, 0, True),
+    ("ARTIST", "SONGLIST"): (run_songlist, MANY, True),
+    ("ARTIST", "SONGLIST", "PAGE", NUMBER): (run_songlist_page, 1, True),
+    ("ARTIST", "SEARCH"): (run_search, 1, True),
+    ("ARTIST", "SEARCH", "PAGE", NUMBER): (run_search_page, 1, True),
+    ("ARTIST", "CONTAINS"): (run_contains, 1, True),
+    ("ARTIST", "CONTAINS", "PAGE", NUMBER): (run_contains, 1, True),
+    ("SONG", "AUTHOR"): (run_author, MANY, True),
+    ("SONG", "SEARCH"): (run_search, 1, True),
+    ("SONG", "SEARCH", "PAGE", NUMBER): (run_search_page, 1, True),
+    ("SONG", "CONTAINS"): (run_contains, 1, True),
+    ("SONG", "CONTAINS", "PAGE", NUMBER): (run_contains, 1, True)
+}
+COMMANDS.update({tuple(command.split()): (run_data, 0, True) for command in DATA_COMMANDS})
+COMMANDS.update({("TOP", NUMBER, "ARTISTS", "BY", order): (run_top_artists_by, 0, True) for order in ARTIST_ORDERS})
+COMMANDS.update({("TOP", NUMBER, "SONGS", "BY", order): (run_top_songs, 0, True) for order in SONG_ORDERS})
+COMMANDS[("DURATION", "HISTOGRAM")] = (run_duration_histogram, 0, True)
+COMMANDS[("RANK", "WEEKS", "CORRELATION")] = (run_correlation, 0, True)
+COMMANDS[("LOAD", "WEEK", NUMBER)] = (run_load_week, 1, True)
+COMMANDS[("SONG", "RANKS", NUMBER, "TO", NUMBER)] = (run_song_ranks, 1, True)
+COMMANDS[("ARTIST", "RANKS", NUMBER, "TO", NUMBER)] = (run_artist_ranks, 1, True)
+COMMANDS[("TRENDING", NUMBER, "ARTISTS")] = (run_trending, 0, True)
+COMMANDS[("TRENDING", NUMBER, "ARTISTS", "WEEKS", NUMBER, "TO", NUMBER)] = (run_trending, 0, True)
+COMMANDS.update({keywords: (run_lookup, MANY, True) for keywords in LOOKUP_COLUMNS})
+for entity in ENTITY_TABLES:
+    for match in MATCH_KINDS:
+        COMMANDS[(entity, match)] = (run_find, 1, True)
+        for order in FIND_ORDERS[ENTITY_TABLES[entity]]:
+            COMMANDS[(entity, match, "BY", order)] = (run_find, 1, True)
+
+PARSER = CommandParser(COMMANDS)
+
+
+def lookup(conx, name, table, columns):
+    """
+        Selects the given columns for a name through the connection's result cache,
+        checking that the name was found.
+        :param conx: for the database
+        :param name: str, the artist or song name to look up
+        :param table: str, the table to look the name up in
+        :param columns: list, the columns to select
+        :return: dict, the result of the select
+    """
+    result = conx.cached(("SELECT", table, name) + tuple(columns), select, conx.cur, name, table, columns)
+    return found(result, name, table)
+
+
+def week_range(command):
+    """
+        Checks the range of weeks of a history command.
+        :param command: Command, a command ending in a TO b
+        :return: tuple, the first and last week, counting from 1
+    """
+    first, last = command.numbers[-2:]
+    if first < 1:
+        raise InvalidInput("Weeks are numbered from 1.")
+    if first > last:
+        raise InvalidInput("The first week is after the last.")
+    return first, last
+
+
+def page_number(command):
+    """
+        Checks the page number of a paged command.
+        :param command: Command, a command ending in PAGE n
+        :return: int, the page number, counting from 1
+    """
+    if command.numbers[-1] < 1:
+        raise InvalidInput("Pages are numbered from 1.")
+    return command.numbers[-1]
+
+
+def search_page(conx, table, name, page):
+    """
+        Answers a paged SEARCH command. Names containing a % or _ wildcard are searched
+        for in the database, which only reads up to the end of the page.
+        :param conx: for the database
+        :param table: str, the table to search
+        :param name: str, the text to search for
+        :param page: int, the page number, counting from 1
+        :return: list, the matching names on the page
+    """
+    if has_wildcard(name):
+        names = iter_search(conx.cur, table, name, PAGE_SIZE, (page - 1) * PAGE_SIZE)
+        return None if names is None else list(names)
+    return conx.name_index(table).search_page(name, PAGE_SIZE, (page - 1) * PAGE_SIZE)
+
+
+def has_wildcard(name):
+    """
+        Checks a search for the wildcards of LIKE, which only the database's search matches.
+        :param name: str, the text to search for
+        :return: bool, whether the text has a % or _ in it
+    """
+    return "%" in name or "_" in name
+
+
+def songlist_page(conx, name, page):
+    """
+        Answers a paged SONGLIST command, reading only the songs on the page.
+        :param conx: for the database
+        :param name: str, the artist name
+        :param page: int, the page number, counting from 1
+        :return: A dictionary of the artist name/list of the songs on the page, empty if
+                 the artist does not exist, or None if there was a problem
+    """
+    songlist = iter_songlist(conx.cur, name, PAGE_SIZE, (page - 1) * PAGE_SIZE)
+    return None if songlist is None else {artist: list(songlist[artist]) for artist in songlist}
+
+
+def analyze(conx, method, *args):
+    """
+        Runs an analytics method on the connection's song columns, loading them if needed.
+        :param conx: for the database
+        :param method: str, the name of the SongColumns method
+        :param args: the method's arguments
+        :return: the method's result, or None if the connection has no song columns
+    """
+    columns = conx.song_columns()
+    return None if columns is None else getattr(columns, method)(*args)
+
+
+def name_contains(conx, table, name):
+    """
+        Answers a CONTAINS command from the connection's in-memory name index.
+        :param conx: for the database
+        :param table: str, the table to search
+        :param name: str, the text to search for
+        :return: list, the matching names
+    """
+    return conx.name_index(table).substring(name)
+
+
+def command_kind(user_input):
+    """
+        Names the kind of a command for the profiler, leaving out its quoted names.
+        :param user_input: str, user input
+        :return: str, the command's keywords, such as ARTIST INFO, or INVALID
+    """
+    try:
+        return PARSER.compile(user_input.strip()).kind()
+    except InvalidInput:
+        return "INVALID"
+
+
+def loads_data(user_input):
+    """
+        Tells whether a command writes to the database, as LOAD DATA and LOAD WEEK do,
+        for the modes that only read it.
+        :param user_input: str, user input
+        :return: bool, whether the command is a LOAD command
+    """
+    try:
+        return PARSER.compile(user_input.strip()).keywords[0] == "LOAD"
+    except InvalidInput:
+        return False
+
+
+def toggles_profiling(user_input):
+    """
+        Tells whether a command starts or stops profiling, as PROFILE ON and PROFILE OFF do.
+        Profiling is set on the connection a command runs on, so the modes that spread
+        commands over many connections can only profile from the start, with --profile.
+        :param user_input: str, user input
+        :return: bool, whether the command is a PROFILE command
+    """
+    try:
+        return PARSER.compile(user_input.strip()).keywords[0] == "PROFILE"
+    except InvalidInput:
+        return False
+
+
+def found(result, name, table):
+    """
+        Checks the result of a lookup query for the name it was given. The lookup
+        queries return an empty result when the name does not exist, so this
+        replaces a separate existence check before each query.
+        :param result: the result of the lookup query
+        :param name: str, the artist or song name that was looked up
+        :param table: str, the table the name was looked up in
+        :return: the result, unchanged
+    """
+    if result == {} or result == "":
+        raise InvalidInput("\"" + str(name) + "\" was not found in the " + table + " database.")
+    return result
+
+
+def display(dict_input, out=None):
     """
         Takes all the output from the SQL calls as arguments. Display then iterates
         through entire output to format it into a presentable manner to then present
         to the user.
         :param dict_input: dict, a dictionary of dictionaries that contains
                             the columns (keys) and values at those columns
+        :param out: the stream to print to, standard output if None
     """
 
     # for error handling if select sends over nothing
     if dict_input is None:
-        print("Error in Selection. Please try again.")
+        print("Error in Selection. Please try again.", file=out)
     else:
         format_string = ""
         first_comma = False
@@ -131,112 +637,340 @@ def display(dict_input):
             for x in dict_input[dictionaries]:
                 format_string = format_string + " " + x + ": " + str(dict_input[dictionaries][x])
 
-        print(format_string)
+        print(format_string, file=out)
 
 
-def display_songlist(dict_input):
+def display_many(dict_input, out=None):
     """
-        Iterates through input (a dictionary of songs), formatting to a string that
-        is then presented to the user with the information of that artists' list of songs.
-        :param dict_input: dict, a dictionary of songs
+        Presents the results of a batch lookup, one name per line, each followed
+        by its columns and values.
+        :param dict_input: dict, a dictionary of dictionaries keyed by name
+        :param out: the stream to print to, standard output if None
     """
     if dict_input is None:
-        print("Error in selection. Please try again.")
+        print("Error in Selection. Please try again.", file=out)
+    else:
+        for name in dict_input:
+            print(name + ": " + ", ".join(x + ": " + str(dict_input[name][x]) for x in dict_input[name]),
+                  file=out)
+
+
+def display_missing(dict_input, names, table, out=None):
+    """
+        Lists the names of a batch lookup that were not found.
+        :param dict_input: dict, the results of the batch lookup keyed by name
+        :param names: tuple, the names that were looked up
+        :param table: str, the table they were looked up in
+        :param out: the stream to print to, standard output if None
+    """
+    if dict_input is not None:
+        missing = [name for name in dict.fromkeys(names) if name not in dict_input]
+        if missing:
+            print("Not found in the " + table + " database: " + ", ".join("\"" + name + "\"" for name in missing),
+                  file=out)
+
+
+def display_songlist(dict_input, out=None):
+    """
+        Iterates through input (a dictionary of songs), printing the information of
+        each artist's list of songs as it goes, so a songlist can be streamed.
+        :param dict_input: dict, a dictionary of artist name/songs, where the songs may be
+                           any iterable
+        :param out: the stream to print to, standard output if None
+    """
+    if dict_input is None:
+        print("Error in selection. Please try again.", file=out)
     else:
-        format_sting = ""
         for artist in dict_input:
-            format_sting += "Songlist for " + artist + ": " + ", ".join(dict_input[artist]) + "\n"
-        print(format_sting, end="")
+            if dict_input[artist] is None:
+                print("Error in selection. Please try again.", file=out)
+                continue
+            print("Songlist for " + artist + ": ", end="", file=out)
+            separator = ""
+            for song in dict_input[artist]:
+                print(separator + song, end="", file=out)
+                separator = ", "
+            print(file=out)
+
+
+def display_ranks(name, dict_input, out=None):
+    """
+        Presents a song's or artist's rank in each week they were on the chart.
+        :param name: str, the song or artist name
+        :param dict_input: dict, a dictionary of week/rank, or of week/dictionary of
+                           best_rank and songs for an artist
+        :param out: the stream to print to, standard output if None
+    """
+    if dict_input is None:
+        print("Error in data calculation. Please try again. (Has LOAD WEEK been run?)", file=out)
+    elif not dict_input:
+        print(name + " was not on the charts in those weeks.", file=out)
+    else:
+        ranks = []
+        for week in dict_input:
+            if isinstance(dict_input[week], dict):
+                ranks.append(f"week {week}: #{dict_input[week]['best_rank']} ({dict_input[week]['songs']} songs)")
+            else:
+                ranks.append(f"week {week}: #{dict_input[week]}")
+        print("Ranks of " + name + ": " + ", ".join(ranks), file=out)
 
 
-def display_author(song_name, artist_name):
+def display_trending(dict_input, out=None):
+    """
+        Presents a numbered list of the artists trending up, with their gain in chart points.
+        :param dict_input: dict, a dictionary of dictionaries keyed by artist name, largest gain first
+        :param out: the stream to print to, standard output if None
+    """
+    if dict_input is None:
+        print("Error in data calculation. Please try again. (Has LOAD WEEK been run?)", file=out)
+    elif not dict_input:
+        print("No artists are trending up. (Have two weeks been loaded with LOAD WEEK?)", file=out)
+    else:
+        display_top(dict_input, out)
+
+
+def display_author(song_name, artist_name, out=None):
     """
         Takes in a song name and an artist name, and displays the artist
         of that specific song in our song database.
         :param song_name: the name of the given song
         :param artist_name: the name of the given artist
+        :param out: the stream to print to, standard output if None
     """
     if artist_name is None:
-        print("Error in selection. Please try again.")
+        print("Error in selection. Please try again.", file=out)
     else:
-        print(f"{song_name} was performed by {artist_name}")
+        print(f"{song_name} was performed by {artist_name}", file=out)
 
 
-def display_data(data_result):
+def display_data(data_result, out=None):
     """
         Made for our metadata, display_data prints out
         the results from our query
         :param data_result: the calculations from the data query.
+        :param out: the stream to print to, standard output if None
     """
 
     if data_result is None:
-        print("Error in data calculation. Please try again.")
+        print("Error in data calculation. Please try again.", file=out)
     else:
-        print(data_result)
+        print(data_result, file=out)
 
 
-def display_search(list_input):
+def display_search(list_input, out=None):
     """
         For our SEARCH keyword, display_search formats the results of the search
-        and then presents it to the user.
-        :param list_input: list, a list of strings that are the results from the search.
+        and then presents it to the user, a line at a time as the results are read.
+        :param list_input: a list or other iterable of strings that are the results from the search.
+        :param out: the stream to print to, standard output if None
     """
 
-    # list_input is list of strings
-    format_string = "Relevant Results: "
-
     # if list_input didn't return well
     if list_input is None:
-        format_string = "Bad Input. Try Again."
-        print(format_string)
+        print("Bad Input. Try Again.", file=out)
     else:
+        line = "Relevant Results: "
+        results = 0
+        # counter keeps the lines to a 5 maximum,
+        # for better presentation for the user
+        counter = 0
+        for x in list_input:
+            results += 1
+            counter += 1
+            if counter == 5:
+                # Print each full line, rather than building one string of every result
+                print(line, file=out)
+                line = ""
+                counter = 0
+            line = line + "\"" + x + "\" | "
         # if list_input is empty
-        if len(list_input) == 0:
-            format_string = "No Relevant Results."
-            print(format_string)
+        if results == 0:
+            print("No Relevant Results.", file=out)
+        else:
+            print(line, file=out)
+
+
+def display_distribution(dict_input, out=None):
+    """
+        Presents how many songs peaked in each band of ranks.
+        :param dict_input: dict, a dictionary of rank band/number of songs
+        :param out: the stream to print to, standard output if None
+    """
+    if dict_input is None:
+        print("Error in data calculation. Please try again. (Has LOAD DATA been run?)", file=out)
+    else:
+        format_string = ""
+        for band in dict_input:
+            format_string += "Peak rank " + band + ": " + str(dict_input[band]) + " songs\n"
+        print(format_string, end="", file=out)
+
+
+def display_top(dict_input, out=None):
+    """
+        Presents a numbered list of the top artists with their totals.
+        :param dict_input: dict, a dictionary of dictionaries keyed by artist name, in ranked order
+        :param out: the stream to print to, standard output if None
+    """
+    if dict_input is None:
+        print("Error in data calculation. Please try again. (Has LOAD DATA been run?)", file=out)
+    else:
+        format_string = ""
+        position = 0
+        for artist in dict_input:
+            position += 1
+            format_string += str(position) + ". " + artist + " -- "
+            format_string += ", ".join(x + ": " + str(dict_input[artist][x]) for x in dict_input[artist]) + "\n"
+        print(format_string, end="", file=out)
+
+
+def display_histogram(dict_input, out=None):
+    """
+        Presents how many songs last each band of durations, with a bar for each.
+        :param dict_input: dict, a dictionary of (band start, band end) in milliseconds/number of songs
+        :param out: the stream to print to, standard output if None
+    """
+    if dict_input is None:
+        print("Error in data calculation. Please try again. (Has LOAD DATA been run?)", file=out)
+    else:
+        largest = max(dict_input.values(), default=0)
+        for start, end in dict_input:
+            songs = dict_input[(start, end)]
+            bar = "#" * round(40 * songs / largest) if largest else ""
+            print(f"{start // 60000}:{start // 1000 % 60:02d}-{end // 60000}:{end // 1000 % 60:02d}: "
+                  f"{songs} songs {bar}", file=out)
+
+
+def display_correlation(dict_input, out=None):
+    """
+        Presents the correlations of peak rank with weeks on the charts.
+        :param dict_input: dict, the number of "songs" and the "pearson" and "spearman" correlations
+        :param out: the stream to print to, standard output if None
+    """
+    if dict_input is None:
+        print("Error in data calculation. Please try again. (Has LOAD DATA been run?)", file=out)
+    else:
+        correlations = []
+        for method in ("pearson", "spearman"):
+            value = dict_input[method]
+            correlations.append(method.capitalize() + ": " + ("n/a" if value is None else f"{value:.3f}"))
+        print("Peak rank and weeks on the charts over " + str(dict_input["songs"]) + " songs -- " +
+              ", ".join(correlations) + " (negative means better ranked songs stay longer)", file=out)
+
+
+def display_stats(profiler, out=None):
+    """
+        Presents the timings the profiler has recorded for each kind of command:
+        the number run, then the mean and 95th percentile of each stage in milliseconds.
+        :param profiler: CommandProfiler, or None if profiling is off
+        :param out: the stream to print to, standard output if None
+    """
+    if profiler is None:
+        print("Profiling is off. Enter PROFILE ON to start recording.", file=out)
+    else:
+        stats = profiler.stats()
+        format_string = ""
+        for kind in stats:
+            format_string += kind + " (" + str(stats[kind]["total"]["count"]) + " run, " + \
+                str(stats[kind]["rows"]) + " rows, " + str(stats[kind]["steps"]) + " vm steps):"
+            for stage in STAGES:
+                format_string += f" {stage} {stats[kind][stage]['mean_ms']:.3f}/{stats[kind][stage]['p95_ms']}ms"
+            format_string += "\n"
+        print(format_string, end="", file=out)
+
+
+def display_plans(plans, out=None):
+    """
+        Presents the query plans SQLite uses for each of our lookup queries,
+        so the user can check that the indexes are being used.
+        :param plans: dict, a dictionary of query description/list of plan steps
+        :param out: the stream to print to, standard output if None
+    """
+    format_string = ""
+    for query in plans:
+        if plans[query] is None:
+            format_string += query + ": could not be explained\n"
         else:
-            # counter keeps the lines to a 5 maximum,
-            # for better presentation for the user
-            counter = 0
-            for x in list_input:
-                counter += 1
-                if counter == 5:
-                    format_string = format_string + "\n"
-                    counter = 0
-                format_string = format_string + "\"" + x + "\" | "
-            print(format_string)
+            format_string += query + ": " + " | ".join(plans[query]) + "\n"
+    print(format_string, end="", file=out)
 
 
-def display_help():
+def display_help(out=None):
     """
         Presents the user with a list of the available commands
         for the program.
+        :param out: the stream to print to, standard output if None
     """
-    print("--------------------------------------------------")
-    print("General Assistance:")
-    print("HELP -- brings up general help page")
-    print("LOAD DATA -- loads all the required data")
-    print("EXIT -- to exit the program\n")
-
-    print("Artist Queries:")
-    print("\"search_string\" ARTIST SEARCH -- returns all artists with the given character(s)")
-    print("\"artist_name\" ARTIST SONGLIST -- returns specific artist's list of songs")
-    print("\"artist_name\" ARTIST HITS -- returns specific artist's # of top songs")
-    print("\"artist_name\" ARTIST WEEKS -- returns specific artist's # weeks as a top artist")
-    print("\"artist_name\" ARTIST INFO -- returns complete artist's info")
-    print("- Example Input: \"Adele\" ARTIST HITS -- would return number of Adele's hits, so 3.\n")
-
-    print("Song Queries:")
-    print("\"search_string\" SONG SEARCH -- returns all songs with the given character(s)")
-    print("\"song_name\" SONG AUTHOR -- returns specific song's author")
-    print("\"song_name\" SONG DURATION -- returns specific song's duration (in MS, milliseconds)")
-    print("\"song_name\" SONG RANK -- returns specific song's rank on top song list")
-    print("\"song_name\" SONG WEEK -- returns specific song's weeks on top song list")
-    print("\"song_name\" SONG INFO -- returns complete song's info")
-    print("- Example Input: \"Butter\" SONG DURATION -- would return the duration of the song \"Butter\", so 164442.\n")
-
-    print("Meta Data Queries:")
-    print("TOTAL ARTISTS -- returns the total number of artists in the database")
-    print("TOTAL SONGS -- returns the total number of songs in the database")
-    print("AVG DURATION -- reruns the average length of all of the songs (in MS, milliseconds)")
-    print("--------------------------------------------------\n")
+    print("--------------------------------------------------", file=out)
+    print("General Assistance:", file=out)
+    print("HELP -- brings up general help page", file=out)
+    print("LOAD DATA -- loads all the required data", file=out)
+    print("EXIT -- to exit the program\n", file=out)
+
+    print("Artist Queries:", file=out)
+    print("\"search_string\" ARTIST SEARCH -- returns all artists with the given character(s)", file=out)
+    print("\"artist_name\" ARTIST SONGLIST -- returns every song the artist is credited on, alone or with others", file=out)
+    print("\"artist_name\" ARTIST HITS -- returns specific artist's # of top songs, counting collaborations", file=out)
+    print("\"artist_name\" ARTIST WEEKS -- returns specific artist's # weeks as a top artist, counting collaborations", file=out)
+    print("\"artist_name\" ARTIST INFO -- returns complete artist's info", file=out)
+    print("\"search_string\" ARTIST CONTAINS -- returns all artists with the character(s) anywhere in their name", file=out)
+    print("- Example Input: \"Adele\" ARTIST HITS -- would return number of Adele's hits, so 3.\n", file=out)
+
+    print("Song Queries:", file=out)
+    print("\"search_string\" SONG SEARCH -- returns all songs with the given character(s)", file=out)
+    print("\"song_name\" SONG AUTHOR -- returns specific song's author", file=out)
+    print("\"song_name\" SONG DURATION -- returns specific song's duration (in MS, milliseconds)", file=out)
+    print("\"song_name\" SONG RANK -- returns specific song's rank on top song list", file=out)
+    print("\"song_name\" SONG WEEK -- returns specific song's weeks on top song list", file=out)
+    print("\"song_name\" SONG INFO -- returns complete song's info", file=out)
+    print("\"search_string\" SONG CONTAINS -- returns all songs with the character(s) anywhere in their name", file=out)
+    print("- Example Input: \"Butter\" SONG DURATION -- would return the duration of the song \"Butter\", so 164442.\n", file=out)
+
+    print("Full-Text Queries:", file=out)
+    print("\"words\" SONG FIND -- returns the songs with all of the words in their name, best match first", file=out)
+    print("\"words\" SONG PHRASE -- returns the songs with the words together, in order, in their name", file=out)
+    print("\"words\" SONG FUZZY -- the same as FIND, but forgiving typos", file=out)
+    print("... FIND BY RANK, ... FIND BY WEEKS -- orders the songs by peak rank or weeks on the charts", file=out)
+    print("ARTIST FIND, ARTIST PHRASE, ARTIST FUZZY -- the same for artists, which can be ordered "
+          "BY WEEKS or BY HITS", file=out)
+    print("- Example Input: \"me\" SONG FIND BY RANK -- would return \"Easy On Me\" among others.\n", file=out)
+
+    print("Batch and Paged Queries:", file=out)
+    print("\"name\", \"name\", ... ARTIST INFO -- any ARTIST or SONG query but SEARCH and CONTAINS, "
+          "for a list of names at once", file=out)
+    print("\"file_name\" FILE ARTIST INFO -- the same, for the names in a file, one per line", file=out)
+    print("... SONGLIST PAGE n, ... SEARCH PAGE n, ... CONTAINS PAGE n -- only the nth page of "
+          + str(PAGE_SIZE) + " results", file=out)
+    print("- Example Input: \"Adele\", \"Drake\" ARTIST HITS -- would return the number of hits of each.\n", file=out)
+
+    print("Chart History Queries:", file=out)
+    print("\"file_name\" LOAD WEEK n -- adds a weekly chart csv (rank, track_name, artist_names) as week n, "
+          "after every week loaded so far", file=out)
+    print("\"song_name\" SONG RANKS a TO b -- returns the song's rank in each week from a to b", file=out)
+    print("\"artist_name\" ARTIST RANKS a TO b -- returns the artist's best rank in each week from a to b", file=out)
+    print("TRENDING n ARTISTS -- returns the n artists whose chart points grew most since the week before", file=out)
+    print("TRENDING n ARTISTS WEEKS a TO b -- the same, from week a to week b", file=out)
+    print("- Example Input: \"Easy On Me\" SONG RANKS 1 TO 4 -- would return its rank in the first 4 weeks.\n",
+          file=out)
+
+    print("Meta Data Queries:", file=out)
+    print("TOTAL ARTISTS -- returns the total number of artists in the database", file=out)
+    print("TOTAL SONGS -- returns the total number of songs in the database", file=out)
+    print("AVG DURATION -- reruns the average length of all of the songs (in MS, milliseconds)", file=out)
+    print("MEDIAN DURATION -- returns the median length of all of the songs (in MS, milliseconds)", file=out)
+    print("SHORTEST DURATION -- returns the length of the shortest song (in MS, milliseconds)", file=out)
+    print("LONGEST DURATION -- returns the length of the longest song (in MS, milliseconds)", file=out)
+    print("RANK DISTRIBUTION -- returns how many songs peaked in each band of 10 ranks", file=out)
+    print("TOP n ARTISTS -- returns the n individual artists with the most weeks on the charts, counting the "
+          "songs they are featured on, from the totals kept by LOAD DATA", file=out)
+    print("TOP n ARTISTS BY SONGS/WEEKS/RANK/DURATION -- ranks the same individual artists by the most songs, "
+          "most weeks, best peak rank or longest songs on average, computed from the songs when first asked", file=out)
+    print("TOP n SONGS BY WEEKS/RANK/DURATION -- returns the n songs with the most weeks, best peak rank "
+          "or longest duration", file=out)
+    print("DURATION HISTOGRAM -- returns how many songs last each band of 30 seconds", file=out)
+    print("RANK WEEKS CORRELATION -- returns how strongly peak rank and weeks on the charts go together", file=out)
+    print("QUERY PLANS -- shows how the database answers each kind of lookup", file=out)
+    print("CACHE STATS -- shows the hits, misses and evictions of the query result cache", file=out)
+    print("PROFILE ON / PROFILE OFF -- starts or stops timing each command and logging slow ones", file=out)
+    print("STATS -- shows the mean/95th percentile time of each stage of each kind of command", file=out)
+    print("STATS JSON -- shows everything the profiler has recorded, as JSON", file=out)
+    print("--------------------------------------------------\n", file=out)
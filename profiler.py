@@ -0,0 +1,259 @@
+"""
+profiler.py
+
+Opt-in instrumentation for parse_input. While a connection has a
+CommandProfiler, every command is timed by stage:
+    - parse, reading the command, up to its first query
+    - sql, running statements and fetching their rows in SQLite
+    - shape, building the query results from the fetched rows
+    - display, formatting and printing the results
+along with the rows fetched and the SQLite virtual machine steps taken, a
+measure of the rows scanned. The timings are collected into histograms per
+kind of command, and commands slower than a threshold are written to a slow
+query log together with the query plans of their statements.
+"""
+
+import threading
+import time
+
+# Upper bounds, in milliseconds, of the histogram buckets; the last bucket has no bound
+BUCKET_BOUNDS_MS = [0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000]
+
+STAGES = ["total", "parse", "sql", "shape", "display"]
+
+SLOW_COMMAND_MS = 50.0
+SLOW_LOG_FILE = "slow_queries.log"
+
+# SQLite calls the progress handler once every this many virtual machine steps
+PROGRESS_STEPS = 100
+
+
+class Histogram:
+    """
+    A class for counting durations into the buckets given by BUCKET_BOUNDS_MS.
+    Attributes:
+        - counts, a list of the number of durations in each bucket
+        - total, the sum of the durations in milliseconds
+        - largest, the longest duration in milliseconds
+    Methods:
+        - add, counts a duration
+        - percentile, estimates a percentile as the upper bound of the bucket it falls in
+        - summary, returns the count, mean, percentiles and buckets in a dictionary
+    """
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_BOUNDS_MS) + 1)
+        self.total = 0.0
+        self.largest = 0.0
+
+    def add(self, ms):
+        bucket = 0
+        while bucket < len(BUCKET_BOUNDS_MS) and ms > BUCKET_BOUNDS_MS[bucket]:
+            bucket += 1
+        self.counts[bucket] += 1
+        self.total += ms
+        self.largest = max(self.largest, ms)
+
+    def percentile(self, fraction):
+        target = fraction * sum(self.counts)
+        seen = 0
+        for bucket in range(len(BUCKET_BOUNDS_MS)):
+            seen += self.counts[bucket]
+            if seen >= target:
+                return BUCKET_BOUNDS_MS[bucket]
+        return self.largest
+
+    def summary(self):
+        count = sum(self.counts)
+        return {
+            "count": count,
+            "mean_ms": self.total / count if count else 0.0,
+            "p50_ms": self.percentile(0.50),
+            "p95_ms": self.percentile(0.95),
+            "p99_ms": self.percentile(0.99),
+            "max_ms": self.largest,
+            "buckets": {("<=" + str(BUCKET_BOUNDS_MS[bucket]) if bucket < len(BUCKET_BOUNDS_MS) else
+                         ">" + str(BUCKET_BOUNDS_MS[-1])): self.counts[bucket]
+                        for bucket in range(len(self.counts)) if self.counts[bucket]}
+        }
+
+
+class CommandProfiler:
+    """
+    A class for recording the stages of each command and collecting them by kind
+    of command. One profiler may be shared by connections on several threads;
+    each thread records its own command.
+    Attributes:
+        - slow_ms, the total time in milliseconds above which a command is logged
+        - slow_log, the path of the slow query log
+        - kinds, a dictionary of command kind/dictionary of stage/Histogram,
+                 plus the total "rows" and "steps" of that kind
+        - lock, a lock guarding kinds and the slow query log
+        - local, the thread-local record of the command being run
+    Methods:
+        - begin, starts recording a command
+        - query_started, marks the end of the parse stage
+        - add_query, adds time spent running a query, including its SQL
+        - add_sql, adds a statement run by SQLite
+        - add_rows, adds to the rows fetched
+        - add_steps, adds to the virtual machine steps taken
+        - end, finishes the command's record and adds it to the histograms
+        - stats, returns a summary of each kind of command
+        - dump, returns the summary as JSON
+    """
+    def __init__(self, slow_ms=SLOW_COMMAND_MS, slow_log=SLOW_LOG_FILE):
+        self.slow_ms = slow_ms
+        self.slow_log = slow_log
+        self.kinds = {}
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def begin(self, command):
+        self.local.record = {
+            "command": command,
+            "start": time.perf_counter(),
+            "parsed": None,
+            "query": 0.0,
+            "sql": 0.0,
+            "rows": 0,
+            "steps": 0,
+            "statements": []
+        }
+
+    def recording(self):
+        return getattr(self.local, "record", None)
+
+    def query_started(self):
+        record = self.recording()
+        if record is not None and record["parsed"] is None:
+            record["parsed"] = time.perf_counter()
+
+    def add_query(self, seconds):
+        record = self.recording()
+        if record is not None:
+            record["query"] += seconds
+
+    def add_sql(self, q, params, seconds):
+        record = self.recording()
+        if record is not None:
+            record["sql"] += seconds
+            if not q.lstrip().upper().startswith("PRAGMA"):
+                record["statements"].append((q, params))
+
+    def add_rows(self, rows, seconds):
+        record = self.recording()
+        if record is not None:
+            record["rows"] += rows
+            record["sql"] += seconds
+
+    def add_steps(self, steps):
+        record = self.recording()
+        if record is not None:
+            record["steps"] += steps
+
+    def end(self, kind, con=None):
+        """
+        Finishes recording the current command, adding its stages to the
+        histograms of its kind and logging it if it was slow.
+        :param kind: str, the kind of command, such as ARTIST INFO
+        :param con: sqlite3 connection to explain the command's statements with, if it was slow
+        :return: None
+        """
+        record = self.recording()
+        if record is None:
+            return
+        self.local.record = None
+        finished = time.perf_counter()
+        parsed = record["parsed"] if record["parsed"] is not None else finished
+        stages = {
+            "total": (finished - record["start"]) * 1000,
+            "parse": (parsed - record["start"]) * 1000,
+            "sql": record["sql"] * 1000,
+            "shape": max(record["query"] - record["sql"], 0.0) * 1000,
+            "display": max(finished - parsed - record["query"], 0.0) * 1000
+        }
+        with self.lock:
+            if kind not in self.kinds:
+                self.kinds[kind] = {stage: Histogram() for stage in STAGES}
+                self.kinds[kind].update({"rows": 0, "steps": 0})
+            for stage in STAGES:
+                self.kinds[kind][stage].add(stages[stage])
+            self.kinds[kind]["rows"] += record["rows"]
+            self.kinds[kind]["steps"] += record["steps"]
+            if stages["total"] >= self.slow_ms:
+                self.log_slow(record, stages, con)
+
+    def log_slow(self, record, stages, con):
+        entry = time.strftime("%Y-%m-%d %H:%M:%S") + " " + record["command"] + "\n"
+        entry += "  " + ", ".join(f"{stage} {stages[stage]:.3f}ms" for stage in STAGES)
+        entry += f", rows {record['rows']}, vm steps {record['steps']}\n"
+        for q, params in record["statements"]:
+            entry += f"  SQL: {q} {params!r}\n"
+            if con is not None:
+                try:
+                    for row in con.execute("EXPLAIN QUERY PLAN " + q, params).fetchall():
+                        entry += f"    PLAN: {row[3]}\n"
+                except Exception:
+                    entry += "    PLAN: could not be explained\n"
+        with open(self.slow_log, "a", encoding="utf-8") as f:
+            f.write(entry)
+
+    def stats(self):
+        with self.lock:
+            summary = {}
+            for kind in self.kinds:
+                summary[kind] = {stage: self.kinds[kind][stage].summary() for stage in STAGES}
+                summary[kind]["rows"] = self.kinds[kind]["rows"]
+                summary[kind]["steps"] = self.kinds[kind]["steps"]
+            return summary
+
+    def dump(self):
+        import json
+        return json.dumps(self.stats(), indent=2)
+
+
+class ProfilingCursor:
+    """
+    A class wrapping a sqlite3 cursor to time the statements it runs and count
+    the rows they return for a CommandProfiler. Anything else is passed through
+    to the wrapped cursor.
+    Attributes:
+        - cursor, the wrapped sqlite3 cursor
+        - profiler, the CommandProfiler to report to
+    """
+    def __init__(self, cursor, profiler):
+        self.cursor = cursor
+        self.profiler = profiler
+
+    def __getattr__(self, attribute):
+        return getattr(self.cursor, attribute)
+
+    def __iter__(self):
+        rows = 0
+        for row in self.cursor:
+            rows += 1
+            yield row
+        self.profiler.add_rows(rows, 0.0)
+
+    def execute(self, q, params=()):
+        start = time.perf_counter()
+        self.cursor.execute(q, params)
+        self.profiler.add_sql(q, params, time.perf_counter() - start)
+        return self
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = self.cursor.fetchall()
+        self.profiler.add_rows(len(rows), time.perf_counter() - start)
+        return rows
+
+    def fetchmany(self, size):
+        start = time.perf_counter()
+        rows = self.cursor.fetchmany(size)
+        self.profiler.add_rows(len(rows), time.perf_counter() - start)
+        return rows
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = self.cursor.fetchone()
+        self.profiler.add_rows(0 if row is None else 1, time.perf_counter() - start)
+        return row
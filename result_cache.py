@@ -0,0 +1,70 @@
+"""
+result_cache.py
+
+A bounded cache of query results, so that repeated commands can be answered
+without querying the database again. The least recently used result is evicted
+once the cache is full, and results expire after a time to live.
+"""
+
+import time
+from collections import OrderedDict
+
+CACHE_SIZE = 1024
+CACHE_TTL = 300.0
+
+
+class ResultCache:
+    """
+    A class for a least recently used cache of query results with a time to live.
+    Attributes:
+        - size, the most results the cache holds
+        - ttl, the number of seconds a result is kept for
+        - entries, an OrderedDict of key/(expiry time, result), least recently used first
+        - hits, the number of lookups answered from the cache
+        - misses, the number of lookups that were not in the cache or had expired
+        - evictions, the number of results dropped to make room for others
+    Methods:
+        - get, looks up a key, returning whether it was found and its result
+        - put, stores the result for a key
+        - clear, drops every result, after the data they came from has changed
+        - stats, returns the counters in a dictionary
+    """
+    def __init__(self, size=CACHE_SIZE, ttl=CACHE_TTL):
+        self.size = size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self.entries[key]
+            self.misses += 1
+            return False, None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return True, entry[1]
+
+    def put(self, key, result):
+        self.entries[key] = (time.monotonic() + self.ttl, result)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self.entries.clear()
+
+    def stats(self):
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions
+        }
@@ -0,0 +1,220 @@
+"""
+server.py
+
+An asyncio server that answers the same commands as the interactive prompt,
+for many clients at once, over a local TCP port or Unix socket. Each line a
+client sends is one command. Commands run on a thread pool, each thread
+borrowing a read-only database connection from a pool, so a slow command does
+not hold up the others. For commands that keep Python busy rather than
+waiting on the database, they can instead run on a pool of worker processes
+(workers.py), one per core. A client may send several commands without waiting
+(pipelining); the responses come back in the order the commands were sent.
+
+Each response is the command's output followed by a line holding a single ".".
+Output lines that start with "." have another "." added in front of them.
+"""
+
+import asyncio
+import io
+import os
+import queue
+from concurrent.futures import ThreadPoolExecutor
+
+from db_handler import DBConnection, DATABASE_NAME, NAME_COLUMNS
+from parse import parse_input, loads_data, toggles_profiling
+from profiler import CommandProfiler
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8205
+POOL_SIZE = 4
+
+# Most commands a single client may have waiting for a response at once
+MAX_PIPELINED = 64
+
+END_OF_RESPONSE = ".\n"
+
+
+class ConnectionPool:
+    """
+    A class for sharing a fixed number of read-only database connections
+    between threads.
+    Attributes:
+        - connections, a queue of the DBConnection objects not in use
+        - profiler, the CommandProfiler shared by every connection, or None
+    Methods:
+        - warm, opens every connection and builds its name indexes ahead of the first command
+        - run, runs a command on a free connection and returns its output
+        - close, closes every connection
+    """
+    def __init__(self, database_name=DATABASE_NAME, size=POOL_SIZE, profile=False, snapshot=False):
+        self.connections = queue.Queue()
+        self.profiler = CommandProfiler() if profile else None
+        if snapshot:
+            # Imported here, as only snapshot servers need it
+            from snapshot import SnapshotConnection
+        for _ in range(size):
+            conx = SnapshotConnection(database_name) if snapshot else DBConnection(database_name, read_only=True)
+            conx.set_profiler(self.profiler)
+            self.connections.put(conx)
+
+    def warm(self):
+        connections = []
+        while not self.connections.empty():
+            conx = self.connections.get()
+            if os.path.exists(conx.database_name):
+                if not conx.open:
+                    conx.open_connection()
+                # Recorded first, so the first command does not take the indexes for stale ones
+                conx.check_data_version()
+                for table in NAME_COLUMNS:
+                    conx.name_index(table)
+            connections.append(conx)
+        for conx in connections:
+            self.connections.put(conx)
+
+    def run(self, command):
+        out = io.StringIO()
+        conx = self.connections.get()
+        try:
+            if loads_data(command):
+                print("LOAD DATA and LOAD WEEK are not available from the server. Run them from main.py.", file=out)
+            elif toggles_profiling(command):
+                # Another thread may be running a command on any of the other connections
+                print("PROFILE ON and PROFILE OFF are not available from the server. "
+                      "Start it with --profile to profile every command.", file=out)
+            else:
+                parse_input(conx, command, out)
+        except Exception as error:
+            print("Error: " + str(error), file=out)
+        finally:
+            self.connections.put(conx)
+        return out.getvalue()
+
+    def close(self):
+        while not self.connections.empty():
+            conx = self.connections.get()
+            if conx.open:
+                conx.close_connection()
+
+
+def format_response(output):
+    """
+        Dot-stuffs a command's output and adds the end of response line.
+        :param output: str, the output of the command
+        :return: str, the response to send to the client
+    """
+    lines = ("." + line if line.startswith(".") else line for line in output.splitlines())
+    return "".join(line + "\n" for line in lines) + END_OF_RESPONSE
+
+
+class QueryServer:
+    """
+    A class for the asyncio server fronting a ConnectionPool or a WorkerPool.
+    Attributes:
+        - pool, the ConnectionPool or WorkerPool commands run on
+        - executor, the ThreadPoolExecutor the commands run in
+    Methods:
+        - handle_client, reads a client's commands and writes back the responses
+        - serve, listens on a TCP port or Unix socket until cancelled
+    """
+    def __init__(self, database_name=DATABASE_NAME, pool_size=POOL_SIZE, profile=False, warm=False, snapshot=False,
+                 processes=0):
+        if processes > 0:
+            # Imported here, as only servers with worker processes need them; the workers start warm
+            from workers import WorkerPool
+            self.pool = WorkerPool(database_name, processes, profile, snapshot)
+            pool_size = processes
+        else:
+            self.pool = ConnectionPool(database_name, pool_size, profile, snapshot)
+            if warm:
+                self.pool.warm()
+        self.executor = ThreadPoolExecutor(max_workers=pool_size)
+
+    async def handle_client(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        # Responses are queued as futures in the order their commands arrived
+        pending = asyncio.Queue(MAX_PIPELINED)
+
+        async def write_responses():
+            while True:
+                future = await pending.get()
+                if future is None:
+                    break
+                writer.write(format_response(await future).encode())
+                await writer.drain()
+
+        writer_task = asyncio.create_task(write_responses())
+
+        async def enqueue(item):
+            # Waits for room in the queue, unless the writer stops first, as then the
+            # queue would never empty; returns whether the item was queued
+            put = asyncio.ensure_future(pending.put(item))
+            await asyncio.wait((put, writer_task), return_when=asyncio.FIRST_COMPLETED)
+            if put.done():
+                return True
+            put.cancel()
+            return False
+
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    # A line longer than the stream's limit: answer the commands before it and stop
+                    break
+                if not line:
+                    break
+                command = line.decode(errors="replace").strip()
+                if command.upper() == "EXIT":
+                    break
+                if not await enqueue(loop.run_in_executor(self.executor, self.pool.run, command)):
+                    break
+            if await enqueue(None):
+                await writer_task
+        except ConnectionError:
+            # The client went away
+            pass
+        finally:
+            writer_task.cancel()
+            # Collects the writer's own error, such as the client closing its end
+            await asyncio.gather(writer_task, return_exceptions=True)
+            writer.close()
+
+    async def serve(self, host=DEFAULT_HOST, port=DEFAULT_PORT, socket_path=None):
+        if socket_path is not None:
+            server = await asyncio.start_unix_server(self.handle_client, path=socket_path)
+        else:
+            server = await asyncio.start_server(self.handle_client, host, port)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.executor.shutdown()
+            self.pool.close()
+            if socket_path is not None and os.path.exists(socket_path):
+                os.remove(socket_path)
+
+
+def run_server(database_name=DATABASE_NAME, host=DEFAULT_HOST, port=DEFAULT_PORT, socket_path=None,
+               pool_size=POOL_SIZE, profile=False, warm=False, snapshot=False, processes=0):
+    """
+        Runs the query server until interrupted.
+        :param database_name: str, the path of the database, which must already be loaded
+        :param host: str, the address to listen on
+        :param port: int, the TCP port to listen on
+        :param socket_path: str, the path of a Unix socket to listen on instead of a TCP port
+        :param pool_size: int, the number of database connections and threads
+        :param profile: bool, whether to profile every command, with one profile shared
+                        by the whole pool
+        :param warm: bool, whether to open the connections and build their name indexes
+                     before listening, as the daemon does
+        :param snapshot: bool, whether database_name is a snapshot to answer the commands from
+        :param processes: int, the number of worker processes to run the commands on instead
+                          of the pool's threads, or 0 to use the threads; each process keeps
+                          its own profile
+    """
+    server = QueryServer(database_name, pool_size, profile, warm, snapshot, processes)
+    try:
+        asyncio.run(server.serve(host, port, socket_path))
+    except KeyboardInterrupt:
+        pass
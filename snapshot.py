@@ -0,0 +1,603 @@
+"""
+snapshot.py
+
+A compact, read-only copy of the database for query nodes that never load
+data. export_snapshot writes the artists and songs tables to one binary file,
+which a SnapshotConnection memory-maps and answers the lookup, songlist,
+author, search and data commands from, without SQLite. Many processes mapping
+the same file share one copy of it in the page cache, and opening it only
+reads the section table, so starting up costs next to nothing.
+
+The file is little-endian. It starts with the magic bytes and FORMAT_VERSION,
+then a table of the sections in it, each a name, offset and length. Sections
+are aligned to 8 bytes and, apart from the string data and the statistics,
+are arrays of 64-bit integers, read in place:
+    - strings.data, every distinct string, UTF-8 encoded, back to back
+    - strings.offsets, where each string starts, plus where the last one ends
+    - <table>.<column>, one value per row: a string number for the name columns,
+      otherwise the value, with NULL stored as NULL_VALUE
+    - <table>.hash, an open-addressing hash table of name/row + 1, keyed by CRC-32
+    - <table>.unique, the first row of each distinct name, and .sorted,
+      .tokens.key, .tokens.row, the name index of the table over every row, as
+      in name_index.py
+    - artists.songs.start, artists.songs, the songs of each artist row, and
+      songs.artist_row, the artist row of each song
+    - performers.name, .hash, .credits.start, .credits, the individual artists
+      of the credits and the artist rows they are credited on
+    - statistics, the output of each data keyword, as JSON
+
+A snapshot is a copy: LOAD DATA does not change it, and it has to be exported
+again after the database is. The queries SQLite answers directly, such as the
+full-text searches, rollups and analytics, are not available from a snapshot.
+"""
+
+import array
+import bisect
+import itertools
+import json
+import mmap
+import os
+import re
+import sqlite3 as sql
+import struct
+import sys
+import zlib
+
+from db_handler import DBConnection, DATABASE_NAME, DATA_KEYWORDS, DB_SCHEMA, NAME_COLUMNS, data, split_credit
+from name_index import PREFIX_END, credit_tokens, nocase
+
+SNAPSHOT_NAME = "music.snap"
+
+MAGIC = b"SONGSNAP"
+FORMAT_VERSION = 2
+
+# The magic bytes, format version and number of sections
+HEADER = struct.Struct("<8sII")
+# A section's name, offset and length in bytes
+SECTION = struct.Struct("<32sQQ")
+
+# Stands in for NULL in an integer column
+NULL_VALUE = -2 ** 63
+
+# The sections that are bytes rather than 64-bit integers
+BYTE_SECTIONS = ("strings.data", "statistics")
+
+
+
+def name_hash(name):
+    """
+    Hashes a name for the hash tables. CRC-32 is used rather than hash(), which
+    changes from one process to the next.
+    :param name: bytes, the UTF-8 encoded name
+    :return: int, the hash
+    """
+    return zlib.crc32(name)
+
+
+def hash_table(names):
+    """
+    Builds an open-addressing hash table of names, with linear probing. Rows
+    sharing a name are found in row order.
+    :param names: list, the name of each row, None for a NULL name
+    :return: array, the slots, each holding a row + 1 or 0 if empty
+    """
+    size = 1
+    while size < 2 * len(names):
+        size *= 2
+    slots = array.array("q", [0]) * size
+    for row in range(len(names)):
+        if names[row] is None:
+            continue
+        slot = name_hash(names[row].encode()) & (size - 1)
+        while slots[slot]:
+            slot = (slot + 1) & (size - 1)
+        slots[slot] = row + 1
+    return slots
+
+
+def group_rows(groups, count):
+    """
+    Flattens a list of lists of rows into a start array and one array of rows,
+    so the rows of group i are rows[start[i]:start[i + 1]].
+    :param groups: list, a list of rows for each group
+    :param count: int, the number of groups
+    :return: tuple, the start array and the rows array
+    """
+    start = array.array("q", [0])
+    rows = array.array("q")
+    for group in range(count):
+        rows.extend(groups[group])
+        start.append(len(rows))
+    return start, rows
+
+
+def export_snapshot(database_name=DATABASE_NAME, snapshot_name=SNAPSHOT_NAME):
+    """
+    Writes a snapshot of a loaded database. The snapshot is written beside the
+    old one and then moved over it, so processes still reading the old one are
+    not disturbed, and pick the new one up on their next command.
+    :param database_name: str, the path of the database
+    :param snapshot_name: str, the path to write the snapshot to
+    :return: int, the size of the snapshot in bytes
+    """
+    conx = DBConnection(database_name, read_only=True)
+    conx.open_connection()
+    try:
+        tables = {}
+        for table in DB_SCHEMA:
+            columns = ", ".join(DB_SCHEMA[table])
+            tables[table] = conx.cur.execute(f'SELECT {columns} FROM {table} ORDER BY rowid;').fetchall()
+        statistics = {keyword: data(conx.cur, keyword) for keyword in DATA_KEYWORDS}
+    finally:
+        conx.close_connection()
+
+    strings = {}
+
+    def intern(text):
+        if text is None:
+            return -1
+        return strings.setdefault(text, len(strings))
+
+    sections = {}
+    for table in DB_SCHEMA:
+        rows = tables[table]
+        for position, column in enumerate(DB_SCHEMA[table]):
+            if DB_SCHEMA[table][column] == "TEXT":
+                values = [intern(row[position]) for row in rows]
+            else:
+                values = [NULL_VALUE if row[position] is None else int(row[position]) for row in rows]
+            sections[f"{table}.{column}"] = array.array("q", values)
+        names = [row[list(DB_SCHEMA[table]).index(NAME_COLUMNS[table])] for row in rows]
+        sections[f"{table}.hash"] = hash_table(names)
+        # The name index, with the same keys and tokens as the in-memory one, but over every row
+        # rather than every distinct name, so a name shared by rows is found once per row
+        first_rows = {}
+        for row in range(len(names)):
+            if names[row] is not None:
+                first_rows.setdefault(names[row], row)
+        rows = [row for row in range(len(names)) if names[row] is not None]
+        tokens = sorted((token, row) for row in rows if table == "artists"
+                        for token in credit_tokens(names[row])[1:])
+        sections[f"{table}.unique"] = array.array("q", first_rows.values())
+        sections[f"{table}.sorted"] = array.array("q", sorted(rows, key=lambda row: (nocase(names[row]), row)))
+        sections[f"{table}.tokens.key"] = array.array("q", [intern(token) for token, row in tokens])
+        sections[f"{table}.tokens.row"] = array.array("q", [row for token, row in tokens])
+
+    # The songs of each artist row, in row order, found through the artist_id they share
+    artists, songs = tables["artists"], tables["songs"]
+    songs_by_id = {}
+    for row in range(len(songs)):
+        songs_by_id.setdefault(songs[row][0], []).append(row)
+    sections["artists.songs.start"], sections["artists.songs"] = \
+        group_rows([songs_by_id.get(artist[0], []) if artist[0] is not None else [] for artist in artists],
+                   len(artists))
+    # And the other way, the artist row of each song, or -1 if it has none
+    artist_rows = {}
+    for row in range(len(artists)):
+        artist_rows.setdefault(artists[row][0], row)
+    sections["songs.artist_row"] = array.array("q", [artist_rows.get(song[0], -1) if song[0] is not None else -1
+                                                     for song in songs])
+
+    # The individual artists of each credit, as refresh_credits links them
+    performers = {}
+    for row in range(len(artists)):
+        if artists[row][1] is None:
+            continue
+        for performer in split_credit(artists[row][1]):
+            credited = performers.setdefault(performer, {})
+            credited.setdefault(artists[row][0], row)
+    performer_names = list(performers)
+    sections["performers.name"] = array.array("q", [intern(name) for name in performer_names])
+    sections["performers.hash"] = hash_table(performer_names)
+    sections["performers.credits.start"], sections["performers.credits"] = \
+        group_rows([sorted(performers[name].values()) for name in performer_names], len(performer_names))
+
+    encoded = [text.encode() for text in strings]
+    offsets = array.array("q", [0])
+    for text in encoded:
+        offsets.append(offsets[-1] + len(text))
+    sections["strings.offsets"] = offsets
+    sections["strings.data"] = b"".join(encoded)
+    sections["statistics"] = json.dumps(statistics).encode()
+
+    for name in sections:
+        if isinstance(sections[name], array.array) and sys.byteorder != "little":
+            sections[name].byteswap()
+
+    # Lay the sections out after the header and section table, each aligned to 8 bytes
+    offset = HEADER.size + SECTION.size * len(sections)
+    layout = []
+    for name in sections:
+        offset += -offset % 8
+        length = len(sections[name]) * (sections[name].itemsize if isinstance(sections[name], array.array) else 1)
+        layout.append((name, offset, length))
+        offset += length
+    temporary_name = snapshot_name + ".tmp"
+    with open(temporary_name, "wb") as snapshot_file:
+        snapshot_file.write(HEADER.pack(MAGIC, FORMAT_VERSION, len(sections)))
+        for name, offset, length in layout:
+            snapshot_file.write(SECTION.pack(name.encode(), offset, length))
+        for name, offset, length in layout:
+            snapshot_file.write(b"\0" * (offset - snapshot_file.tell()))
+            snapshot_file.write(sections[name])
+        size = snapshot_file.tell()
+    os.replace(temporary_name, snapshot_name)
+    return size
+
+
+def nocase_key(pair):
+    """
+    Orders names the way SQLite's NOCASE indexes do, ties going to the earlier row.
+    :param pair: tuple, a name and its row
+    :return: tuple, the sort key
+    """
+    return nocase(pair[0]), pair[1]
+
+
+def like_pattern(pattern):
+    """
+    Compiles a LIKE pattern into a regular expression that matches it the way
+    SQLite does: % is any text, _ is any one character, and only ASCII letters
+    ignore case.
+    :param pattern: str, the LIKE pattern
+    :return: a compiled regular expression, to fullmatch against names
+    """
+    parts = []
+    for character in pattern:
+        if character == "%":
+            parts.append(".*")
+        elif character == "_":
+            parts.append(".")
+        elif character.lower() != character.upper() and character.isascii():
+            parts.append("[" + character.lower() + character.upper() + "]")
+        else:
+            parts.append(re.escape(character))
+    return re.compile("".join(parts), re.DOTALL)
+
+
+class Snapshot:
+    """
+    A class for a memory-mapped snapshot. It takes the place of the cursor in the
+    query functions of db_handler, which hand their work to its method of the same name.
+    Attributes:
+        - map, the mmap of the file
+        - sections, a dictionary of section name/memoryview of it, cast to 64-bit
+                    integers for the integer sections
+        - statistics, a dictionary of data keyword/output
+    Methods:
+        - load, maps a snapshot file, in place of the one mapped before
+        - string, the string with a given number
+        - value, a column of a row, or None for NULL
+        - name, the name of a row of the artists, songs or performers
+        - rows, the rows with a given name, from the table's hash table
+        - credit_songs, the song rows of an artist row
+        - performer_songs, the song rows of every credit of an individual artist
+        - songs, the song rows of an individual artist, or else of a whole credit
+        - select, select_many, select_performers, join_songlist, join_songlist_many,
+          join_performer_songlists, iter_songlist, join_author, join_author_many,
+          search, iter_search, data and build_name_index, as in db_handler
+        - execute, raises sql.NotSupportedError, for the queries that need the database
+        - close, unmaps the file
+    """
+    is_snapshot = True
+
+    def __init__(self, snapshot_name=SNAPSHOT_NAME):
+        self.load(snapshot_name)
+
+    def load(self, snapshot_name):
+        with open(snapshot_name, "rb") as snapshot_file:
+            self.map = mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self.map)
+        magic, version, count = HEADER.unpack_from(view) if len(view) >= HEADER.size else (b"", 0, 0)
+        if magic != MAGIC:
+            raise ValueError(snapshot_name + " is not a snapshot.")
+        if version != FORMAT_VERSION:
+            raise ValueError(f"{snapshot_name} is a version {version} snapshot, "
+                             f"but only version {FORMAT_VERSION} can be read.")
+        self.sections = {}
+        for number in range(count):
+            name, offset, length = SECTION.unpack_from(view, HEADER.size + number * SECTION.size)
+            name = name.rstrip(b"\0").decode()
+            section = view[offset:offset + length]
+            if name not in BYTE_SECTIONS:
+                if sys.byteorder == "little":
+                    section = section.cast("q")
+                else:
+                    # Only a little-endian machine can read the integers in place
+                    section = array.array("q", section)
+                    section.byteswap()
+            self.sections[name] = section
+        view.release()
+        self.statistics = json.loads(bytes(self.sections["statistics"]))
+
+    def string(self, number):
+        if number < 0:
+            return None
+        offsets = self.sections["strings.offsets"]
+        return str(self.sections["strings.data"][offsets[number]:offsets[number + 1]], "utf-8")
+
+    def value(self, table, column, row):
+        value = self.sections[f"{table}.{column}"][row]
+        if DB_SCHEMA[table][column] == "TEXT":
+            return self.string(value)
+        return None if value == NULL_VALUE else value
+
+    def name(self, table, row):
+        if table == "performers":
+            return self.string(self.sections["performers.name"][row])
+        return self.value(table, NAME_COLUMNS[table], row)
+
+    def rows(self, table, name):
+        slots = self.sections[f"{table}.hash"]
+        names = self.sections["performers.name" if table == "performers" else f"{table}.{NAME_COLUMNS[table]}"]
+        offsets = self.sections["strings.offsets"]
+        encoded = name.encode()
+        found = []
+        slot = name_hash(encoded) & (len(slots) - 1)
+        while slots[slot]:
+            row = slots[slot] - 1
+            # Compare the bytes in place, rather than decoding every name probed
+            if self.sections["strings.data"][offsets[names[row]]:offsets[names[row] + 1]] == encoded:
+                found.append(row)
+            slot = (slot + 1) & (len(slots) - 1)
+        return sorted(found)
+
+    def credit_songs(self, artist_row):
+        start = self.sections["artists.songs.start"]
+        return self.sections["artists.songs"][start[artist_row]:start[artist_row + 1]]
+
+    def performer_songs(self, performer_row):
+        start = self.sections["performers.credits.start"]
+        credits = self.sections["performers.credits"][start[performer_row]:start[performer_row + 1]]
+        return sorted(song for artist_row in credits for song in self.credit_songs(artist_row))
+
+    def songs(self, name):
+        performers = self.rows("performers", name)
+        if performers:
+            return self.performer_songs(performers[0])
+        return [song for row in self.rows("artists", name) for song in self.credit_songs(row)]
+
+    def select(self, searchable, table, columns):
+        if table not in NAME_COLUMNS or any(column not in DB_SCHEMA[table] for column in columns):
+            return None
+        all_results = {}
+        for row in self.rows(table, searchable):
+            all_results[searchable] = {column: self.value(table, column, row) for column in columns}
+        return all_results
+
+    def select_many(self, searchables, table, columns):
+        all_results = {}
+        for name in dict.fromkeys(searchables):
+            result = self.select(name, table, columns)
+            if result is None:
+                return None
+            all_results.update(result)
+        return all_results
+
+    def select_performers(self, searchables, columns):
+        if any(column not in ("num_hit_songs", "total_weeks") for column in columns):
+            return None
+        all_results = {}
+        for name in dict.fromkeys(searchables):
+            performers = self.rows("performers", name)
+            if not performers:
+                continue
+            songs = self.performer_songs(performers[0])
+            weeks = [self.value("songs", "weeks_on_chart", song) for song in songs]
+            totals = {
+                "num_hit_songs": sum(self.value("songs", "track_name", song) is not None for song in songs),
+                "total_weeks": sum(week for week in weeks if week is not None)
+            }
+            all_results[name] = {column: totals[column] for column in columns}
+        return all_results
+
+    def join_songlist(self, searchable):
+        all_results = {}
+        for row in self.rows("artists", searchable):
+            songlist = all_results.setdefault(searchable, [])
+            for song in self.credit_songs(row):
+                if self.value("songs", "track_name", song) is not None:
+                    songlist.append(self.value("songs", "track_name", song))
+        return all_results
+
+    def join_songlist_many(self, searchables):
+        all_results = {}
+        for name in dict.fromkeys(searchables):
+            all_results.update(self.join_songlist(name))
+        return all_results
+
+    def join_performer_songlists(self, searchables):
+        all_results = {}
+        for name in dict.fromkeys(searchables):
+            performers = self.rows("performers", name)
+            if performers:
+                songs = (self.value("songs", "track_name", song) for song in self.performer_songs(performers[0]))
+                all_results[name] = [song for song in songs if song is not None]
+        return all_results
+
+    def iter_songlist(self, searchable, limit=-1, offset=0):
+        if not self.rows("performers", searchable) and not self.rows("artists", searchable):
+            return {}
+        songs = self.songs(searchable)
+        end = len(songs) if limit < 0 else offset + limit
+        # Read now, as the snapshot may be loaded again before the songs are
+        return {searchable: iter([self.value("songs", "track_name", song) for song in songs[offset:end]])}
+
+    def join_author(self, searchable):
+        rows = self.rows("songs", searchable)
+        if not rows:
+            return ""
+        artist_row = self.sections["songs.artist_row"][rows[0]]
+        return None if artist_row < 0 else self.name("artists", artist_row)
+
+    def join_author_many(self, searchables):
+        all_results = {}
+        for name in dict.fromkeys(searchables):
+            if self.rows("songs", name):
+                all_results[name] = self.join_author(name)
+        return all_results
+
+    def search(self, table, searchable):
+        names = self.iter_search(table, searchable)
+        return None if names is None else list(names)
+
+    def iter_search(self, table, searchable, limit=-1, offset=0):
+        if table not in NAME_COLUMNS:
+            return None
+        end = None if limit < 0 else offset + limit
+        if "_" not in searchable and "%" not in searchable.rstrip("%"):
+            # A prefix search, found by binary search in the sorted name index; only a pattern
+            # with a wildcard before its end needs every name matched against it
+            names = SnapshotNames(self, table)
+            if "%" in searchable:
+                return itertools.islice(names.iter_prefix(searchable.rstrip("%")), offset, end)
+            return itertools.islice(names.iter_search(searchable), offset, end)
+        prefix = like_pattern(searchable + "%")
+        names = [(self.name(table, row), row) for row in range(len(self.sections[f"{table}.{NAME_COLUMNS[table]}"]))]
+        names = [pair for pair in names if pair[0] is not None]
+        starts = [pair for pair in names if prefix.fullmatch(pair[0])]
+        featured = []
+        if table == "artists" and searchable != "" and "%" not in searchable:
+            featured = [pair for pair in names if not prefix.fullmatch(pair[0])
+                        and any(prefix.fullmatch(performer) for performer in split_credit(pair[0]))]
+        # SQLite reads each half in the order of the NOCASE index on the names
+        found = sorted(starts, key=nocase_key) + sorted(featured, key=nocase_key)
+        return (name for name, row in found[offset:end])
+
+    def data(self, keyword):
+        return self.statistics[keyword]
+
+    def build_name_index(self, table):
+        return SnapshotNames(self, table)
+
+    def execute(self, *args):
+        raise sql.NotSupportedError("This query needs the database rather than a snapshot.")
+
+    def close(self):
+        for section in self.sections.values():
+            if isinstance(section, memoryview):
+                section.release()
+        self.map.close()
+
+
+class SnapshotNames:
+    """
+    A class for the name index of one table of a snapshot. It answers the same
+    searches as a NameIndex, from the sorted arrays in the snapshot, and cannot
+    be changed.
+    Attributes:
+        - snapshot, the Snapshot
+        - table, the table whose names are indexed
+    Methods:
+        - search, finds the names that start with some text, followed by
+                  the names with a later credit starting with it
+        - iter_search, finds the same names as search, one at a time
+        - iter_prefix, finds the names that start with some text, without
+                       the names with a later credit starting with it
+        - search_page, finds one page of the names search finds
+        - substring, finds the names that contain some text
+    """
+    def __init__(self, snapshot, table):
+        self.snapshot = snapshot
+        self.table = table
+
+    def __len__(self):
+        return len(self.snapshot.sections[f"{self.table}.unique"])
+
+    def search(self, text):
+        return list(self.iter_search(text))
+
+    def iter_search(self, text):
+        sections = self.snapshot.sections
+        text = nocase(text)
+        starts = self.prefix_rows(text)
+        featured = []
+        if text != "":
+            start, end = _prefix_range(sections[f"{self.table}.tokens.key"], text, self.snapshot.string)
+            featured = sorted(set(sections[f"{self.table}.tokens.row"][start:end]) - set(starts),
+                              key=lambda row: (self.folded_name(row), row))
+        return (self.snapshot.name(self.table, row) for row in itertools.chain(starts, featured))
+
+    def iter_prefix(self, text):
+        return (self.snapshot.name(self.table, row) for row in self.prefix_rows(nocase(text)))
+
+    def prefix_rows(self, text):
+        start, end = _prefix_range(self.snapshot.sections[f"{self.table}.sorted"], text, self.folded_name)
+        return self.snapshot.sections[f"{self.table}.sorted"][start:end]
+
+    def folded_name(self, row):
+        return nocase(self.snapshot.name(self.table, row))
+
+    def search_page(self, text, limit, offset):
+        return list(itertools.islice(self.iter_search(text), offset, offset + limit))
+
+    def substring(self, text):
+        text = text.lower()
+        names = (self.snapshot.name(self.table, row) for row in self.snapshot.sections[f"{self.table}.unique"])
+        return [name for name in names if text in name.lower()]
+
+
+def _prefix_range(keys, text, key):
+    """
+    Uses binary search to find the keys that start with the given text.
+    :param keys: a sorted array
+    :param text: str, the lowercase prefix
+    :param key: function, gives the lowercase text of an entry of the array
+    :return: tuple, the start and end of the matching entries
+    """
+    return bisect.bisect_left(keys, text, key=key), bisect.bisect_left(keys, text + PREFIX_END, key=key)
+
+
+class SnapshotConnection(DBConnection):
+    """
+    A class for answering commands from a snapshot instead of the database. It
+    stands in for a read-only DBConnection, with the Snapshot as its cursor and
+    no SQLite connection.
+    Attributes:
+        - as DBConnection's, with database_name the path of the snapshot,
+          cur the Snapshot, con None and data_version the identity of the file
+    Methods:
+        - as DBConnection's; check_data_version maps the snapshot again once
+          export_snapshot has replaced the file
+    """
+    def __init__(self, snapshot_name=SNAPSHOT_NAME):
+        super().__init__(snapshot_name, read_only=True)
+
+    def open_connection(self):
+        self.data_version = self.file_version()
+        self.cur = Snapshot(self.database_name)
+        self.open = True
+
+    def close_connection(self):
+        self.cur.close()
+        self.open = False
+        self.data_version = None
+
+    def song_columns(self):
+        # The song columns are read with SQL, which a snapshot cannot answer
+        return None
+
+    def file_version(self):
+        stat = os.stat(self.database_name)
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def check_data_version(self):
+        try:
+            data_version = self.file_version()
+        except OSError:
+            # The file is being replaced; keep answering from the old one
+            return
+        if data_version != self.data_version:
+            # Keep the same Snapshot object, which callers may already be holding as the cursor
+            self.cur.close()
+            self.cur.load(self.database_name)
+            self.cache.clear()
+            self.name_indexes = {}
+            self.data_version = data_version
+
+    def sync_data_version(self):
+        self.data_version = self.file_version()
+
+    def set_profiler(self, profiler):
+        # There are no SQL statements to time or count the steps of
+        self.profiler = profiler
@@ -0,0 +1,40 @@
+"""
+Fixtures shared by the tests. The tests load copies of the csv files into a
+temporary directory, so music.db and the csv files in the repository are never
+touched.
+"""
+
+import os
+import shutil
+import sys
+
+import pytest
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+from db_handler import load_data  # noqa: E402
+
+
+@pytest.fixture
+def csv_files(tmp_path):
+    """
+    Copies of the repository's csv files, which a test may change.
+    :return: dict, a dictionary of table name/csv file path, as taken by load_data
+    """
+    files = {}
+    for table in ("artists", "songs"):
+        files[table] = str(tmp_path / f"{table}.csv")
+        shutil.copy(os.path.join(REPO, f"{table}.csv"), files[table])
+    return files
+
+
+@pytest.fixture
+def database(tmp_path, csv_files):
+    """
+    A database loaded from the copied csv files.
+    :return: str, the path of the database
+    """
+    database_name = str(tmp_path / "music.db")
+    load_data(database_name, csv_files)
+    return database_name
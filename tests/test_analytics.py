@@ -0,0 +1,93 @@
+"""
+Tests of the analytics: with some of the values NULL, every aggregation over the
+SongColumns must agree with the same aggregation done in SQL.
+"""
+
+import math
+import sqlite3 as sql
+import statistics
+
+import pytest
+
+from analytics import ARTIST_ORDERS, HISTOGRAM_BUCKET_MS, SONG_ORDERS, SongColumns
+
+# The totals of each individual artist, named as in ARTIST_ORDERS
+ARTIST_TOTALS_QUERY = 'SELECT performer_name, COUNT(*), SUM(COALESCE(weeks_on_chart, 0)), MIN(peak_rank), ' \
+                      'AVG(duration_ms) FROM performers ' \
+                      'JOIN artist_credits ON artist_credits.performer_id = performers.performer_id ' \
+                      'JOIN songs ON songs.artist_id = artist_credits.artist_id GROUP BY performers.performer_id;'
+
+
+@pytest.fixture
+def cursor(database):
+    conx = sql.connect(database)
+    conx.execute('UPDATE songs SET duration_ms = NULL WHERE rowid % 7 = 0;')
+    conx.execute('UPDATE songs SET peak_rank = NULL WHERE rowid % 5 = 0;')
+    conx.execute('UPDATE songs SET weeks_on_chart = NULL WHERE rowid % 3 = 0;')
+    # An artist with neither a duration nor a peak rank for any song
+    conx.execute('UPDATE songs SET duration_ms = NULL, peak_rank = NULL WHERE artist_id = '
+                 '(SELECT artist_id FROM artists WHERE artist_names = \'Adele\');')
+    conx.commit()
+    yield conx.cursor()
+    conx.close()
+
+
+def artist_totals(cur):
+    totals = {}
+    for name, songs, weeks, best_rank, avg_duration in cur.execute(ARTIST_TOTALS_QUERY):
+        totals[name] = {"songs": songs, "total_weeks": weeks, "best_rank": best_rank,
+                        "avg_duration": None if avg_duration is None else round(avg_duration)}
+    return totals
+
+
+@pytest.mark.parametrize("order", ARTIST_ORDERS)
+def test_top_artists(cursor, order):
+    column, largest = ARTIST_ORDERS[order]
+    totals = artist_totals(cursor)
+    ranked = sorted((values[column] for values in totals.values() if values[column] is not None), reverse=largest)
+    top = SongColumns(cursor).top_artists(1000, order)
+    assert [values[column] for values in top.values()] == ranked
+    assert all(top[name] == totals[name] for name in top)
+
+
+def test_artists_without_a_total_are_left_out(cursor):
+    top = SongColumns(cursor).top_artists(1000, "RANK")
+    assert "Adele" not in top
+    assert "Adele" in SongColumns(cursor).top_artists(1000, "SONGS")
+
+
+@pytest.mark.parametrize("order", SONG_ORDERS)
+def test_top_songs(cursor, order):
+    column, largest = SONG_ORDERS[order]
+    expected = cursor.execute(f'SELECT {column} FROM songs WHERE {column} IS NOT NULL '
+                              f'ORDER BY {column} {"DESC" if largest else "ASC"} LIMIT 20;').fetchall()
+    top = SongColumns(cursor).top_songs(20, order)
+    assert [values[column] for values in top.values()] == [row[0] for row in expected]
+    for name in top:
+        row = cursor.execute('SELECT peak_rank, weeks_on_chart, duration_ms FROM songs WHERE track_name = ?;',
+                             (name,)).fetchone()
+        assert top[name] == {key: value for key, value in zip(("peak_rank", "weeks_on_chart", "duration_ms"), row)
+                             if value is not None}
+
+
+def test_duration_histogram(cursor):
+    counts = dict(cursor.execute(f'SELECT duration_ms / {HISTOGRAM_BUCKET_MS}, COUNT(*) FROM songs '
+                                 f'WHERE duration_ms IS NOT NULL GROUP BY 1;').fetchall())
+    expected = {(band * HISTOGRAM_BUCKET_MS, (band + 1) * HISTOGRAM_BUCKET_MS): counts.get(band, 0)
+                for band in range(min(counts), max(counts) + 1)}
+    assert SongColumns(cursor).duration_histogram() == expected
+
+
+def test_rank_weeks_correlation(cursor):
+    pairs = cursor.execute('SELECT peak_rank, weeks_on_chart FROM songs '
+                           'WHERE peak_rank IS NOT NULL AND weeks_on_chart IS NOT NULL;').fetchall()
+    peak_rank, weeks = [pair[0] for pair in pairs], [pair[1] for pair in pairs]
+
+    def mean_ranks(values):
+        ordered = sorted(values)
+        return [(ordered.index(value) + len(ordered) - ordered[::-1].index(value) + 1) / 2 for value in values]
+
+    result = SongColumns(cursor).rank_weeks_correlation()
+    assert result["songs"] == len(pairs)
+    assert math.isclose(result["pearson"], statistics.correlation(peak_rank, weeks))
+    assert math.isclose(result["spearman"], statistics.correlation(mean_ranks(peak_rank), mean_ranks(weeks)))
@@ -0,0 +1,150 @@
+"""
+Tests of the artist commands: each command makes one round trip to the database
+for its data, and names are answered both as individual artists and as whole
+credits.
+"""
+
+import csv
+import io
+import os
+import re
+
+import pytest
+
+from db_handler import PAGE_SIZE, DBConnection, iter_search, split_credit
+from parse import parse_input
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def performer_songs():
+    """
+    Lists the songs of every individual artist, read from the csv files.
+    :return: dict, a dictionary of individual artist/list of (song, weeks) pairs
+    """
+    with open(os.path.join(REPO, "artists.csv"), newline="", encoding="utf-8") as f:
+        credits = [row["artist_names"] for row in csv.DictReader(f)]
+    songs = {}
+    with open(os.path.join(REPO, "songs.csv"), newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            for performer in split_credit(credits[int(row["artist_id"]) - 1]):
+                songs.setdefault(performer, []).append((row["track_name"], int(row["weeks_on_chart"] or 0)))
+    return songs
+
+
+def output(conx, command):
+    out = io.StringIO()
+    parse_input(conx, command, out)
+    return out.getvalue()
+
+
+@pytest.fixture
+def conx(database):
+    conx = DBConnection(database, read_only=True)
+    yield conx
+    if conx.open:
+        conx.close_connection()
+
+
+def statements(conx, command):
+    """
+    Runs a command, returning its output and the SQL statements it ran.
+    """
+    if not conx.open:
+        conx.open_connection()
+    run = []
+    conx.con.set_trace_callback(run.append)
+    try:
+        return output(conx, command), run
+    finally:
+        conx.con.set_trace_callback(None)
+
+
+@pytest.mark.parametrize("name, songs", [
+    ("Adele", "Easy On Me, Oh My God, Rolling in the Deep"),
+    ("iann dior", "Mood (feat. iann dior)"),
+    ("24kGoldn, iann dior", "Mood (feat. iann dior)")
+])
+def test_songlist_is_one_statement(conx, name, songs):
+    printed, run = statements(conx, f'"{name}" ARTIST SONGLIST')
+    assert printed == f"Songlist for {name}: {songs}\n"
+    # The data version, read once for the command, then the songlist itself
+    assert len(run) == 2
+    assert run[0] == "PRAGMA data_version;"
+
+
+def test_songlist_of_a_missing_artist(conx):
+    printed, run = statements(conx, '"Nobody" ARTIST SONGLIST')
+    assert "was not found in the artists database" in printed
+    assert len(run) == 2
+
+
+def test_cached_lookups_only_read_the_data_version(conx):
+    statements(conx, '"Adele" ARTIST INFO')
+    printed, run = statements(conx, '"Adele" ARTIST INFO')
+    assert printed == " num_hit_songs: 3 total_weeks: 57\n"
+    assert run == ["PRAGMA data_version;"]
+
+
+def test_songlist_pages(conx):
+    songs = output(conx, '"Drake" ARTIST SONGLIST').split(": ", 1)[1].strip().split(", ")
+    first_page = "Songlist for Drake: " + ", ".join(songs[:PAGE_SIZE]) + "\n"
+    assert output(conx, '"Drake" ARTIST SONGLIST PAGE 1') == first_page
+    assert "was not found" in output(conx, '"Nobody" ARTIST SONGLIST PAGE 1')
+
+
+@pytest.mark.parametrize("name, performers", [
+    ("24kGoldn, iann dior", ["24kGoldn", "iann dior"]),
+    ("Future, Drake, Tems", ["Future", "Drake", "Tems"]),
+    ("Macklemore & Ryan Lewis, Macklemore, Ryan Lewis, Ray Dalton",
+     ["Macklemore & Ryan Lewis", "Macklemore", "Ryan Lewis", "Ray Dalton"]),
+    ("Adele", ["Adele"])
+])
+def test_credits_are_split(conx, name, performers):
+    assert split_credit(name) == performers
+    conx.open_connection()
+    linked = conx.cur.execute('SELECT performer_name FROM performers JOIN artist_credits '
+                              'ON artist_credits.performer_id = performers.performer_id '
+                              'JOIN artists ON artists.artist_id = artist_credits.artist_id '
+                              'WHERE artist_names = ?;', (name,)).fetchall()
+    assert sorted(row[0] for row in linked) == sorted(performers)
+
+
+def test_performer_totals_and_songlists(conx):
+    for performer, songs in performer_songs().items():
+        assert output(conx, f'"{performer}" ARTIST HITS') == f" num_hit_songs: {len(songs)}\n"
+        assert output(conx, f'"{performer}" ARTIST WEEKS') == f" total_weeks: {sum(weeks for song, weeks in songs)}\n"
+        songlist = output(conx, f'"{performer}" ARTIST SONGLIST')
+        assert songlist == f"Songlist for {performer}: " + ", ".join(song for song, weeks in songs) + "\n"
+
+
+@pytest.mark.parametrize("text, names", [
+    ("iann", ["24kGoldn, iann dior"]),
+    ("tems", ["Future, Drake, Tems"]),
+    # The credits starting with the text, then those featuring it, each in name order
+    ("Future", ["Future, Drake, Tems", "Drake, Future, Young Thug"]),
+    ("drake", ["Drake, 21 Savage, Project Pat", "Drake, Future, Young Thug", "Drake, Travis Scott",
+               "Drake, WizKid, Kyla", "Future, Drake, Tems"])
+])
+def test_featured_artists_are_found(conx, text, names):
+    conx.open_connection()
+    assert list(iter_search(conx.cur, "artists", text)) == names
+    # The NameIndex the SEARCH command reads finds the same names
+    assert re.findall(r'"(.*?)" \|', output(conx, f'"{text}" ARTIST SEARCH')) == names
+
+
+def test_songs_have_no_featured_half(conx):
+    conx.open_connection()
+    assert list(iter_search(conx.cur, "songs", "iann")) == []
+
+
+def test_top_artists_rank_individual_artists(conx):
+    songs = performer_songs()
+    top = output(conx, "TOP 10 ARTISTS")
+    ranked = re.findall(r"^\d+\. (.*) -- total_weeks: (\d+), songs: (\d+)", top, re.MULTILINE)
+    assert len(ranked) == 10
+    for name, weeks, hits in ranked:
+        assert (int(weeks), int(hits)) == (sum(weeks for song, weeks in songs[name]), len(songs[name]))
+    # Ranked the same as by the totals computed from the songs
+    by_weeks = output(conx, "TOP 10 ARTISTS BY WEEKS")
+    assert [weeks for name, weeks, hits in ranked] == re.findall(r"total_weeks: (\d+)", by_weeks)
@@ -0,0 +1,21 @@
+"""
+Tests of batch mode: commands that load data are recognised however they are
+spaced or cased, and keep a batch with several jobs on one writable connection.
+"""
+
+import os
+
+import pytest
+
+from batch import run_batch
+
+
+@pytest.mark.parametrize("load", ["LOAD DATA", "load  data", "  Load Data  "])
+def test_loading_batch_runs_on_one_connection(csv_files, tmp_path, monkeypatch, load):
+    # LOAD DATA reads the csv files from the working directory
+    monkeypatch.chdir(tmp_path)
+    output = run_batch([load, "TOTAL SONGS", "TOTAL ARTISTS"], "music.db", jobs=2)
+    assert os.path.exists(tmp_path / "music.db")
+    assert "Successfully loaded data" in output
+    assert "The total number of songs stored is: 200" in output
+    assert "The total number of artists stored is: 150" in output
@@ -0,0 +1,43 @@
+"""
+Tests of the fuzzy search: a typo is forgiven wherever it is in a word,
+including at the first letter, where the vocabulary range of the word's own
+first letter cannot find it.
+"""
+
+import sqlite3 as sql
+
+import pytest
+
+from full_text import first_letters, similar_terms
+
+
+@pytest.fixture
+def cursor(database):
+    conx = sql.connect(database)
+    yield conx.cursor()
+    conx.close()
+
+
+@pytest.mark.parametrize("word, term", [
+    ("easy", "easy"),
+    ("eazy", "easy"),
+    # A wrong first letter, an extra one and a missing one
+    ("nasy", "easy"),
+    ("measy", "easy"),
+    ("asy", "easy"),
+    ("xdrake", "drake")
+])
+def test_typos_are_forgiven(cursor, word, term):
+    table = "artists" if term == "drake" else "songs"
+    assert term in similar_terms(cursor, table, word)
+
+
+def test_too_many_typos(cursor):
+    assert "easy" not in similar_terms(cursor, "songs", "nbsy")
+    # Short words must be spelled right
+    assert similar_terms(cursor, "songs", "on") == ["on"]
+
+
+def test_first_letters(cursor):
+    terms = [row[0] for row in cursor.execute('SELECT term FROM songs_fts_vocab;')]
+    assert first_letters(cursor, "songs_fts") == sorted({term[0] for term in terms})
@@ -0,0 +1,152 @@
+"""
+Tests of load_data's incremental updates: after the csv files change, updating
+the database must leave it the same as loading the changed files afresh.
+"""
+
+import io
+import os
+import sqlite3 as sql
+
+import pytest
+
+from db_handler import DATA_KEYWORDS, DBConnection, load_data
+from parse import parse_input
+
+# The tables an update has to keep the same as a fresh load, each in a fixed order
+COMPARED_QUERIES = {
+    "artists": 'SELECT * FROM artists ORDER BY artist_id;',
+    "songs": 'SELECT * FROM songs ORDER BY track_name, artist_id;',
+    "statistics": 'SELECT * FROM statistics ORDER BY name;',
+    "rank_distribution": 'SELECT * FROM rank_distribution ORDER BY bucket_start;',
+    "performer_statistics": 'SELECT performer_name, songs, total_weeks, best_rank, avg_duration '
+                            'FROM performer_statistics JOIN performers '
+                            'ON performers.performer_id = performer_statistics.performer_id ORDER BY performer_name;',
+    "credits": 'SELECT performer_name, artist_id FROM performers JOIN artist_credits '
+               'ON artist_credits.performer_id = performers.performer_id ORDER BY performer_name, artist_id;'
+}
+
+
+def contents(database_name):
+    conx = sql.connect(database_name)
+    try:
+        return {table: conx.execute(COMPARED_QUERIES[table]).fetchall() for table in COMPARED_QUERIES}
+    finally:
+        conx.close()
+
+
+def edit_lines(file_name, edit):
+    with open(file_name, encoding="utf-8") as f:
+        lines = f.readlines()
+    with open(file_name, "w", encoding="utf-8") as f:
+        f.writelines(edit(lines))
+
+
+def assert_same_as_fresh_load(database_name, csv_files, tmp_path):
+    fresh_name = str(tmp_path / "fresh.db")
+    load_data(fresh_name, csv_files)
+    assert contents(database_name) == contents(fresh_name)
+
+
+def test_unchanged_files_are_skipped(database, csv_files):
+    loaded = load_data(database, csv_files)
+    assert not loaded["rebuilt"]
+    assert loaded["rows"] == 0
+
+
+def test_shrink(database, csv_files, tmp_path):
+    # Removing an artist shifts the rows after it up, leaving the last row to be deleted
+    edit_lines(csv_files["artists"], lambda lines: lines[:5] + lines[6:])
+    last = contents(database)["artists"][-1][1]
+    loaded = load_data(database, csv_files)
+    assert last in loaded["removed"]["artists"]
+    updated = contents(database)
+    assert len(updated["artists"]) == 149
+    assert [row[1] for row in updated["artists"]].count(last) == 1
+    assert_same_as_fresh_load(database, csv_files, tmp_path)
+
+
+def test_shrink_songs(database, csv_files, tmp_path):
+    edit_lines(csv_files["songs"], lambda lines: lines[:-3])
+    loaded = load_data(database, csv_files)
+    assert len(loaded["removed"]["songs"]) == 3
+    assert loaded["rows"] == 3
+    # The artists' totals are counted from the songs that are left, not taken from
+    # artists.csv, which still counts the deleted songs
+    conx = sql.connect(database)
+    stale = conx.execute('SELECT COUNT(*) FROM artists WHERE num_hit_songs != (SELECT COUNT(*) FROM songs '
+                         'WHERE songs.artist_id = artists.artist_id);').fetchone()[0]
+    conx.close()
+    assert stale == 0
+    assert_same_as_fresh_load(database, csv_files, tmp_path)
+
+
+def test_artist_totals_come_from_the_songs(database, csv_files, tmp_path):
+    edit_lines(csv_files["artists"], lambda lines: [line.replace("Adele,3,57", "Adele,99,999") for line in lines])
+    load_data(database, csv_files)
+    conx = sql.connect(database)
+    totals = conx.execute('SELECT num_hit_songs, total_weeks FROM artists WHERE artist_names = \'Adele\';').fetchone()
+    conx.close()
+    assert totals == (3, 57)
+    assert_same_as_fresh_load(database, csv_files, tmp_path)
+
+
+def test_rename(database, csv_files, tmp_path):
+    edit_lines(csv_files["songs"], lambda lines: [lines[0], lines[1].replace("Mood", "Moody Renamed")] + lines[2:])
+    loaded = load_data(database, csv_files)
+    assert loaded["added"]["songs"] == ["Moody Renamed (feat. iann dior)"]
+    assert loaded["removed"]["songs"] == ["Mood (feat. iann dior)"]
+    assert_same_as_fresh_load(database, csv_files, tmp_path)
+
+
+def test_append(database, csv_files, tmp_path):
+    edit_lines(csv_files["artists"], lambda lines: lines + ['"New Artist, Adele",1,3\n'])
+    edit_lines(csv_files["songs"], lambda lines: lines + ["151,A New Song,200000,42,3\n"])
+    loaded = load_data(database, csv_files)
+    assert loaded["added"] == {"artists": ["New Artist, Adele"], "songs": ["A New Song"]}
+    assert loaded["removed"] == {"artists": [], "songs": []}
+    assert loaded["rows"] == 2
+    assert_same_as_fresh_load(database, csv_files, tmp_path)
+
+
+def test_changed_values(database, csv_files, tmp_path):
+    # Moves a song to another band of peak ranks and changes its duration and weeks
+    edit_lines(csv_files["songs"], lambda lines: [lines[0], "1,Mood (feat. iann dior),99999,147,3\n"] + lines[2:])
+    loaded = load_data(database, csv_files)
+    assert loaded["rows"] == 1
+    assert_same_as_fresh_load(database, csv_files, tmp_path)
+
+
+def test_rewritten_values_are_not_counted(database, csv_files, tmp_path):
+    # The chunk's digest changes, but its values are stored as the same integers
+    edit_lines(csv_files["songs"], lambda lines: [lines[0], lines[1].replace(",140533,", ",0140533,")] + lines[2:])
+    loaded = load_data(database, csv_files)
+    assert loaded["rows"] == 0
+    assert loaded["added"] == {"artists": [], "songs": []}
+    assert_same_as_fresh_load(database, csv_files, tmp_path)
+
+
+def test_statistics_match_the_tables(database, csv_files):
+    edit_lines(csv_files["songs"], lambda lines: lines[:-1] + ["151,A New Song,,42,3\n"])
+    load_data(database, csv_files)
+    conx = sql.connect(database)
+    for keyword in DATA_KEYWORDS:
+        statistic, q, output = DATA_KEYWORDS[keyword]
+        stored = conx.execute('SELECT value FROM statistics WHERE name = ?;', (statistic,)).fetchone()[0]
+        assert stored == conx.execute(q).fetchone()[0]
+    conx.close()
+
+
+@pytest.mark.parametrize("edit", ["remove", "bad header"])
+def test_load_command_reports_bad_files(csv_files, tmp_path, monkeypatch, edit):
+    # LOAD DATA reads the csv files from the working directory
+    monkeypatch.chdir(tmp_path)
+    if edit == "remove":
+        os.remove(csv_files["songs"])
+    else:
+        edit_lines(csv_files["songs"], lambda lines: [lines[0].replace("track_name", "title")] + lines[1:])
+    conx = DBConnection("music.db")
+    out = io.StringIO()
+    parse_input(conx, "LOAD DATA", out)
+    assert out.getvalue().startswith(" Invalid Input: ")
+    # The half-loaded new database is removed
+    assert not os.path.exists(tmp_path / "music.db")
@@ -0,0 +1,73 @@
+"""
+Tests of the name indexes: a NameIndex, and a snapshot's, must find the same
+names, in the same order and as many times, as the database's search, including
+names shared by several rows, names differing only in case and names with
+letters outside ASCII.
+"""
+
+import sqlite3 as sql
+
+import pytest
+
+from db_handler import build_name_index, iter_search, load_data
+from name_index import NameIndex
+from snapshot import Snapshot, export_snapshot
+
+# Artists added to the csv file: a name on two rows, names equal but for their
+# case, and names SQLite does not fold to lowercase
+EXTRA_ARTISTS = ['Adele,3,57\n', 'Drake,1,1\n', 'ADELE,1,1\n', 'adele,1,1\n', '"Élan, adele",1,1\n', 'élan,1,1\n',
+                 '"Zed, Drake",1,1\n']
+SEARCHES = ["", "a", "A", "adele", "ADELE", "d", "drake", "Drake, F", "iann", "é", "É", "élan", "z", "zz"]
+# Searches with LIKE wildcards, which only the database and a snapshot answer
+WILDCARD_SEARCHES = ["%", "a%", "A%%", "%dele", "ad%e", "dr_ke", "_", "é%"]
+
+
+@pytest.fixture
+def database(tmp_path, csv_files):
+    with open(csv_files["artists"], "a", encoding="utf-8") as artists:
+        artists.writelines(EXTRA_ARTISTS)
+    database_name = str(tmp_path / "music.db")
+    load_data(database_name, csv_files)
+    return database_name
+
+
+@pytest.fixture
+def cursor(database):
+    conx = sql.connect(database)
+    yield conx.cursor()
+    conx.close()
+
+
+@pytest.mark.parametrize("table", ["artists", "songs"])
+@pytest.mark.parametrize("text", SEARCHES)
+def test_same_as_the_database(cursor, table, text):
+    expected = list(iter_search(cursor, table, text))
+    assert build_name_index(cursor, table).search(text) == expected
+
+
+@pytest.mark.parametrize("table", ["artists", "songs"])
+def test_snapshot_same_as_the_database(cursor, database, tmp_path, table):
+    snapshot_name = str(tmp_path / "music.snap")
+    export_snapshot(database, snapshot_name)
+    snapshot = Snapshot(snapshot_name)
+    try:
+        for text in SEARCHES:
+            expected = list(iter_search(cursor, table, text))
+            assert snapshot.build_name_index(table).search(text) == expected
+            assert list(snapshot.iter_search(table, text)) == expected
+        for text in WILDCARD_SEARCHES:
+            assert list(snapshot.iter_search(table, text)) == list(iter_search(cursor, table, text))
+            assert list(snapshot.iter_search(table, text, 3, 2)) == list(iter_search(cursor, table, text, 3, 2))
+    finally:
+        snapshot.close()
+
+
+def test_shared_names_are_removed_with_their_last_row():
+    index = NameIndex(["Drake", "Adele", "Drake"])
+    assert index.search("d") == ["Drake", "Drake"]
+    index.remove("Drake")
+    assert index.search("d") == ["Drake"]
+    index.remove("Drake")
+    assert index.search("d") == []
+    index.add("Drake")
+    assert index.search("") == ["Adele", "Drake"]
@@ -0,0 +1,63 @@
+"""
+Tests of the query server's responses, and that a client's handler always
+finishes, however the client misbehaves.
+"""
+
+import asyncio
+
+from server import MAX_PIPELINED, QueryServer, format_response
+
+
+class ClosedWriter:
+    """
+    A stream writer for a client that has gone away: every drain fails.
+    """
+    def __init__(self):
+        self.written = []
+        self.closed = False
+
+    def write(self, data):
+        self.written.append(data)
+
+    async def drain(self):
+        raise ConnectionResetError("The client closed the connection.")
+
+    def close(self):
+        self.closed = True
+
+
+def handle(database, data):
+    server = QueryServer(database, pool_size=1)
+    writer = ClosedWriter()
+
+    async def run():
+        reader = asyncio.StreamReader(limit=1024)
+        reader.feed_data(data)
+        reader.feed_eof()
+        await asyncio.wait_for(server.handle_client(reader, writer), 10)
+
+    try:
+        asyncio.run(run())
+    finally:
+        server.executor.shutdown()
+        server.pool.close()
+    return writer
+
+
+def test_format_response():
+    assert format_response("a\n.b\n..c\n") == "a\n..b\n...c\n.\n"
+    assert format_response("") == ".\n"
+
+
+def test_handler_finishes_after_the_writer_fails(database):
+    # More commands than fit in the queue, which the dead writer never empties
+    writer = handle(database, b"TOTAL SONGS\n" * (MAX_PIPELINED * 2))
+    assert writer.closed
+    assert len(writer.written) == 1
+
+
+def test_handler_finishes_after_an_over_long_line(database):
+    writer = handle(database, b"TOTAL SONGS\n" + b"x" * 4096 + b"\nTOTAL ARTISTS\n")
+    assert writer.closed
+    # The command before the long line is answered, and the reading stops there
+    assert writer.written == [format_response("The total number of songs stored is: 200\n").encode()]
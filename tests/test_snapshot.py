@@ -0,0 +1,94 @@
+"""
+Tests of the snapshots: every command a snapshot answers must print the same as
+the database it was exported from, including after the snapshot is exported
+again under a connection that is still open.
+"""
+
+import io
+
+import pytest
+
+from db_handler import DBConnection, load_data
+from parse import DATA_COMMANDS, parse_input
+from snapshot import SnapshotConnection, export_snapshot
+
+# The commands a snapshot answers, with names that are individual artists, whole
+# credits, featured artists and missing, and searches with and without wildcards
+COMMANDS = [
+    '"Adele" ARTIST INFO',
+    '"Drake" ARTIST HITS',
+    '"iann dior" ARTIST WEEKS',
+    '"24kGoldn, iann dior" ARTIST INFO',
+    '"Nobody" ARTIST INFO',
+    '"Adele", "Drake", "Nobody" ARTIST INFO',
+    '"Easy On Me" SONG INFO',
+    '"Easy On Me" SONG DURATION',
+    '"Mood (feat. iann dior)" SONG RANK',
+    '"Easy On Me", "No Such Song" SONG WEEK',
+    '"Adele" ARTIST SONGLIST',
+    '"iann dior" ARTIST SONGLIST',
+    '"24kGoldn, iann dior" ARTIST SONGLIST',
+    '"Nobody" ARTIST SONGLIST',
+    '"Adele", "Drake", "Nobody" ARTIST SONGLIST',
+    '"Drake" ARTIST SONGLIST PAGE 1',
+    '"Easy On Me" SONG AUTHOR',
+    '"No Such Song" SONG AUTHOR',
+    '"Easy On Me", "Mood (feat. iann dior)", "No Such Song" SONG AUTHOR',
+    '"" ARTIST SEARCH',
+    '"" SONG SEARCH',
+    '"a" ARTIST SEARCH',
+    '"iann" ARTIST SEARCH',
+    '"Ha" SONG SEARCH',
+    '"%on%" SONG SEARCH',
+    '"x%" ARTIST SEARCH',
+    '"" ARTIST SEARCH PAGE 2',
+    '"" SONG SEARCH PAGE 3',
+    '"%e" SONG SEARCH PAGE 1',
+    '"an" ARTIST CONTAINS',
+    '"love" SONG CONTAINS',
+    '"e" SONG CONTAINS PAGE 2'
+] + list(DATA_COMMANDS)
+
+
+def output(conx, command):
+    out = io.StringIO()
+    parse_input(conx, command, out)
+    return out.getvalue()
+
+
+@pytest.fixture
+def snapshot(database, tmp_path):
+    snapshot_name = str(tmp_path / "music.snap")
+    export_snapshot(database, snapshot_name)
+    return snapshot_name
+
+
+@pytest.fixture
+def connections(database, snapshot):
+    conx = DBConnection(database, read_only=True)
+    snapshot_conx = SnapshotConnection(snapshot)
+    yield conx, snapshot_conx
+    for connection in (conx, snapshot_conx):
+        if connection.open:
+            connection.close_connection()
+
+
+@pytest.mark.parametrize("command", COMMANDS)
+def test_same_output(connections, command):
+    conx, snapshot_conx = connections
+    expected = output(conx, command)
+    assert "Error" not in expected
+    assert output(snapshot_conx, command) == expected
+
+
+def test_export_again_while_open(connections, database, snapshot, csv_files):
+    conx, snapshot_conx = connections
+    commands = ['"A New Song" SONG INFO', '"Adele" ARTIST SONGLIST', '"A New" SONG SEARCH', 'TOTAL SONGS']
+    before = [output(snapshot_conx, command) for command in commands]
+    with open(csv_files["songs"], "a", encoding="utf-8") as songs:
+        songs.write("1,A New Song,200000,42,3\n")
+    load_data(database, csv_files)
+    export_snapshot(database, snapshot)
+    after = [output(snapshot_conx, command) for command in commands]
+    assert after != before
+    assert after == [output(conx, command) for command in commands]
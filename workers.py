@@ -0,0 +1,101 @@
+"""
+workers.py
+
+Runs commands on a pool of worker processes, so that a busy query host uses
+all of its cores rather than one. A dispatcher hands each command to the next
+free worker, which runs it through parse_input on its own read-only
+connection, opened once when the worker starts and read through a memory map
+(READ_ONLY_PRAGMAS), so the workers share the database's pages. The outputs
+come back in the order the commands were given, however long each one takes.
+
+Each worker keeps its own result cache, name indexes and, when profiling, its
+own profile, so STATS shows the commands of whichever worker ran it.
+"""
+
+import io
+import multiprocessing
+import os
+
+from db_handler import DBConnection, DATABASE_NAME, NAME_COLUMNS
+from parse import parse_input, loads_data, toggles_profiling
+from profiler import CommandProfiler
+
+# The connection of the worker process, opened by start_worker
+connection = None
+
+
+def start_worker(database_name, profile, snapshot):
+    """
+        Opens the worker process's connection and builds its name indexes, so the
+        first commands it is given do not wait for them.
+        :param database_name: str, the path of the database, or of the snapshot
+        :param profile: bool, whether to profile the worker's commands
+        :param snapshot: bool, whether database_name is a snapshot to answer the commands from
+    """
+    global connection
+    if snapshot:
+        # Imported here, as only snapshot workers need it
+        from snapshot import SnapshotConnection
+        connection = SnapshotConnection(database_name)
+    else:
+        connection = DBConnection(database_name, read_only=True)
+    if profile:
+        connection.set_profiler(CommandProfiler())
+    # Without a database, every command reports that the data has not been loaded
+    if os.path.exists(database_name):
+        connection.open_connection()
+        # Recorded first, so the first command does not take the indexes for stale ones
+        connection.check_data_version()
+        for table in NAME_COLUMNS:
+            connection.name_index(table)
+
+
+def run_command(command):
+    """
+        Runs one command on the worker process's connection.
+        :param command: str, the command
+        :return: str, everything the command printed
+    """
+    out = io.StringIO()
+    try:
+        if loads_data(command):
+            print("LOAD DATA and LOAD WEEK are not available from the workers. Run them from main.py.", file=out)
+        elif toggles_profiling(command):
+            # It would only reach this worker, while the next commands go to the others
+            print("PROFILE ON and PROFILE OFF are not available from the workers. "
+                  "Start them with --profile to profile every command.", file=out)
+        else:
+            parse_input(connection, command, out)
+    except Exception as error:
+        print("Error: " + str(error), file=out)
+    return out.getvalue()
+
+
+class WorkerPool:
+    """
+    A class for a fixed number of worker processes that run commands.
+    Attributes:
+        - pool, the multiprocessing.Pool of the workers
+        - size, the number of workers
+    Methods:
+        - run, runs one command on a free worker and returns its output
+        - run_all, runs a list of commands across the workers, returning
+                   their outputs in order
+        - close, stops the workers once they have finished their commands
+    """
+    def __init__(self, database_name=DATABASE_NAME, size=None, profile=False, snapshot=False):
+        self.size = size or multiprocessing.cpu_count()
+        self.pool = multiprocessing.Pool(self.size, start_worker, (database_name, profile, snapshot))
+
+    def run(self, command):
+        return self.pool.apply(run_command, (command,))
+
+    def run_all(self, commands):
+        # Commands are handed out a few at a time, enough to keep the workers from
+        # waiting on the dispatcher but few enough that they finish together
+        chunk_size = max(1, len(commands) // (self.size * 4))
+        return self.pool.imap(run_command, commands, chunk_size)
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()